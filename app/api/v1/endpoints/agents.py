@@ -1,13 +1,20 @@
 # app/api/v1/endpoints/agents.py
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+import uuid
+from sqlalchemy import cast, insert, select, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from datetime import datetime, timedelta
 from ....core.database import get_db
+from ....core import pagination
 from ....schemas import schemas
 from ....models import models
 from ....core import security
 from ....config.settings import get_settings
+from ....services.aggregates import OS_INFO_KEY
+from ....services.fleet import fleet_snapshot
+from ....services.heartbeats import heartbeats
 
 router = APIRouter()
 settings = get_settings()
@@ -15,7 +22,7 @@ settings = get_settings()
 @router.post("/register/token", response_model=schemas.TokenResponse)
 async def get_registration_token(
     token_request: schemas.TokenRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     x_admin_key: str = Header(..., alias="X-Admin-Key")
 ):
     """Generate a registration token for an agent"""
@@ -37,9 +44,254 @@ async def get_registration_token(
     )
     
     db.add(db_token)
-    db.commit()
+    await db.commit()
     
     return {
         "token": token,
         "expires_at": db_token.expires_at
+    }
+
+AGENT_COLUMNS = pagination.schema_columns(schemas.Agent, models.Agent)
+
+def _live_agent(row: dict) -> dict:
+    """Agent row with last_seen/status taken from the in-memory heartbeat view"""
+    live = heartbeats.live(row["id"])
+    if live and (row["last_seen"] is None or live[0] >= row["last_seen"]):
+        row["last_seen"], row["status"] = live
+    return row
+
+def _check_registration_batch(count: int):
+    if count < 1:
+        raise HTTPException(status_code=400, detail="Batch must not be empty")
+    if count > settings.REGISTRATION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.REGISTRATION_BATCH_MAX_ITEMS} items"
+        )
+
+async def mint_registration_tokens(token_request: schemas.TokenBatchRequest, db: AsyncSession):
+    """Generate `count` registration tokens with one multi-row INSERT"""
+    _check_registration_batch(token_request.count)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=token_request.expiry_hours or 24)
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "token": security.generate_registration_token(),
+            "environment": token_request.environment,
+            "description": token_request.description,
+            "created_at": now,
+            "expires_at": expires_at,
+            "used": False,
+        }
+        for _ in range(token_request.count)
+    ]
+    await db.execute(insert(models.RegistrationToken), rows)
+    await db.commit()
+    return {"tokens": [row["token"] for row in rows], "expires_at": expires_at}
+
+def _escape_like(value: str) -> str:
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+def _os_info_filters(postgres: bool, filters: List[str]):
+    conditions = []
+    for item in filters:
+        key, sep, value = item.partition(":")
+        if not sep or not OS_INFO_KEY.match(key):
+            raise HTTPException(status_code=400, detail=f"Invalid os_info filter {item!r}, expected key:value")
+        if postgres:
+            # Same cast as the ix_agents_os_info expression, so the GIN index serves it
+            conditions.append(cast(models.Agent.os_info, JSONB).contains({key: value}))
+        else:
+            conditions.append(models.Agent.os_info[key].as_string() == value)
+    return conditions
+
+@router.get("/", response_model=List[schemas.Agent])
+async def list_agents(
+    request: Request,
+    status: str = None,
+    environment: Optional[str] = None,
+    version: Optional[str] = None,
+    hostname: Optional[str] = Query(None, description="hostname prefix"),
+    hostname_contains: Optional[str] = None,
+    os_info: List[str] = Query([], description="key:value, e.g. distro:ubuntu; repeatable"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """List registered agents, newest first, one keyset page at a time"""
+    query = select(models.Agent)
+    if status:
+        query = query.filter(models.Agent.status == status)
+    if environment:
+        query = query.filter(models.Agent.environment == environment)
+    if version:
+        query = query.filter(models.Agent.version == version)
+    # Patterns are built here rather than in SQL so the planner sees a constant prefix
+    if hostname:
+        query = query.filter(models.Agent.hostname.like(_escape_like(hostname) + "%", escape="/"))
+    if hostname_contains:
+        query = query.filter(
+            models.Agent.hostname.ilike("%" + _escape_like(hostname_contains) + "%", escape="/")
+        )
+    if os_info:
+        query = query.filter(*_os_info_filters(db.get_bind().dialect.name == "postgresql", os_info))
+
+    query = pagination.keyset(query, models.Agent.created_at, models.Agent.id, cursor)
+    if pagination.wants_ndjson(request, format):
+        if limit:
+            query = query.limit(limit)
+        return pagination.stream_ndjson(query, AGENT_COLUMNS, _live_agent)
+    return await pagination.fetch_json_page(
+        db, query, AGENT_COLUMNS, pagination.page_size(limit, 100),
+        timestamp_attr="created_at", transform=_live_agent
+    )
+
+@router.get("/facets", response_model=schemas.FleetFacets)
+async def get_fleet_facets():
+    """Agent counts by environment, status, version and os_info keys, from memory"""
+    return fleet_snapshot.counts()
+
+@router.post("/{agent_id}/heartbeat", response_model=schemas.HeartbeatAck)
+async def heartbeat(agent_uuid: uuid.UUID = Depends(security.authorize_agent)):
+    """Record an agent check-in; written to the agents table by the periodic flush"""
+    last_seen, status = heartbeats.beat(agent_uuid)
+    return {"agent_id": agent_uuid, "status": status, "last_seen": last_seen}
+
+async def register_agent(agent: schemas.AgentRegister, db: AsyncSession):
+    """Register a new agent with a one-time registration token"""
+    # The row lock makes a concurrent registration with the same token wait and then see it used
+    db_token = (await db.execute(
+        select(models.RegistrationToken)
+        .filter(models.RegistrationToken.token == agent.registration_token)
+        .with_for_update()
+    )).scalars().first()
+
+    if not db_token or db_token.used or db_token.expires_at < datetime.utcnow():
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired registration token"
+        )
+
+    db_agent = models.Agent(
+        hostname=agent.hostname,
+        ip_address=agent.ip_address,
+        environment=db_token.environment,
+        description=agent.description,
+        version=agent.version,
+        os_info=agent.os_info or {}
+    )
+    db.add(db_agent)
+    await db.flush()
+
+    api_key = security.generate_api_key()
+    db.add(models.AgentApiKey(agent_id=db_agent.id, key=api_key))
+
+    db_token.used = True
+    db_token.used_by = db_agent.id
+    db_token.used_at = datetime.utcnow()
+
+    await db.commit()
+    fleet_snapshot.add([{
+        "id": db_agent.id,
+        "environment": db_agent.environment,
+        "status": db_agent.status,
+        "version": db_agent.version,
+        "os_info": db_agent.os_info,
+        "created_at": db_agent.created_at,
+    }])
+
+    return {
+        "agent": db_agent,
+        "api_key": api_key
+    }
+
+async def register_agents_bulk(batch: schemas.AgentRegisterBatch, db: AsyncSession):
+    """Register many agents in one transaction; each host succeeds or fails on its own token"""
+    _check_registration_batch(len(batch.agents))
+    now = datetime.utcnow()
+
+    # One query validates every token; row locks stop a concurrent batch from reusing them
+    requested = {agent.registration_token for agent in batch.agents}
+    tokens = {
+        db_token.token: db_token
+        for db_token in (await db.execute(
+            select(models.RegistrationToken)
+            .filter(models.RegistrationToken.token.in_(requested))
+            .with_for_update()
+        )).scalars()
+    }
+
+    results: List[schemas.AgentRegisterResult] = []
+    agent_rows, key_rows, token_updates = [], [], []
+    claimed = set()
+    for index, agent in enumerate(batch.agents):
+        db_token = tokens.get(agent.registration_token)
+        if (
+            not db_token or db_token.used or db_token.expires_at < now
+            or agent.registration_token in claimed
+        ):
+            results.append(schemas.AgentRegisterResult(
+                index=index, hostname=agent.hostname, error="Invalid or expired registration token"
+            ))
+            continue
+        claimed.add(agent.registration_token)
+
+        agent_row = {
+            "id": uuid.uuid4(),
+            "hostname": agent.hostname,
+            "ip_address": agent.ip_address,
+            "environment": db_token.environment,
+            "description": agent.description,
+            "version": agent.version,
+            "os_info": agent.os_info or {},
+            "status": "registered",
+            "last_seen": now,
+            "created_at": now,
+        }
+        api_key = security.generate_api_key()
+        agent_rows.append(agent_row)
+        key_rows.append({
+            "id": uuid.uuid4(), "agent_id": agent_row["id"], "key": api_key,
+            "created_at": now, "revoked": False,
+        })
+        token_updates.append({
+            "id": db_token.id, "used": True, "used_by": agent_row["id"], "used_at": now,
+        })
+        results.append(schemas.AgentRegisterResult(
+            index=index, hostname=agent.hostname,
+            agent=schemas.Agent(**agent_row), api_key=api_key
+        ))
+
+    if agent_rows:
+        await db.execute(insert(models.Agent), agent_rows)
+        await db.execute(insert(models.AgentApiKey), key_rows)
+        # Bulk UPDATE by primary key, batched into one executemany
+        await db.execute(update(models.RegistrationToken), token_updates)
+    await db.commit()
+    fleet_snapshot.add(agent_rows)
+
+    return schemas.AgentRegisterBatchResult(
+        registered=len(agent_rows),
+        failed=len(results) - len(agent_rows),
+        results=results
+    )
+
+async def revoke_agent_keys(agent_id: str, db: AsyncSession):
+    """Revoke all active API keys of an agent"""
+    db_keys = (await db.execute(select(models.AgentApiKey).filter(
+        models.AgentApiKey.agent_id == agent_id,
+        models.AgentApiKey.revoked == False
+    ))).scalars().all()
+
+    # Updating through the ORM lets security invalidate the cached keys on commit
+    for db_key in db_keys:
+        db_key.revoked = True
+        db_key.revoked_at = datetime.utcnow()
+
+    await db.commit()
+    return {
+        "status": "success",
+        "message": f"Revoked {len(db_keys)} API keys"
     }
\ No newline at end of file
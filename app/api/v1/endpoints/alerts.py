@@ -0,0 +1,89 @@
+# app/api/v1/endpoints/alerts.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import uuid
+from ....core.database import get_db
+from ....core import security
+from ....schemas import schemas
+from ....models import models
+from ....config.settings import get_settings
+from ....services.alerts import active_alerts, alert_engine, rules_changed
+
+router = APIRouter()
+settings = get_settings()
+
+async def _get_rule(db: AsyncSession, rule_id: str) -> models.AlertRule:
+    try:
+        rule_uuid = uuid.UUID(rule_id)
+    except ValueError:
+        rule_uuid = None
+    db_rule = await db.get(models.AlertRule, rule_uuid) if rule_uuid else None
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    return db_rule
+
+@router.get("/active", response_model=List[schemas.ActiveAlert])
+async def list_active_alerts(
+    environment: Optional[str] = None,
+    rule_id: Optional[uuid.UUID] = None,
+    limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+    db: AsyncSession = Depends(get_db)
+):
+    """List open alerts, newest first"""
+    return await db.run_sync(active_alerts, environment, rule_id, limit)
+
+@router.get("/rules", response_model=List[schemas.AlertRule])
+async def list_rules(db: AsyncSession = Depends(get_db)):
+    """List alert rules"""
+    result = await db.execute(select(models.AlertRule).order_by(models.AlertRule.name, models.AlertRule.id))
+    return result.scalars().all()
+
+@router.post("/rules", response_model=schemas.AlertRule)
+async def create_rule(
+    rule: schemas.AlertRuleCreate,
+    db: AsyncSession = Depends(get_db),
+    admin_key: str = Depends(security.validate_admin_key)
+):
+    """Create an alert rule; it applies to metrics committed from then on"""
+    db_rule = models.AlertRule(**rule.model_dump())
+    db.add(db_rule)
+    await db.flush()
+    await db.run_sync(rules_changed, db_rule.id)
+    await db.commit()
+    await db.refresh(db_rule)
+    await db.run_sync(alert_engine.load)
+    return db_rule
+
+@router.put("/rules/{rule_id}", response_model=schemas.AlertRule)
+async def update_rule(
+    rule_id: str,
+    rule: schemas.AlertRuleCreate,
+    db: AsyncSession = Depends(get_db),
+    admin_key: str = Depends(security.validate_admin_key)
+):
+    """Replace an alert rule; its open alerts are resolved and its series start over"""
+    db_rule = await _get_rule(db, rule_id)
+    for key, value in rule.model_dump().items():
+        setattr(db_rule, key, value)
+    await db.flush()
+    await db.run_sync(rules_changed, db_rule.id)
+    await db.commit()
+    await db.refresh(db_rule)
+    await db.run_sync(alert_engine.load)
+    return db_rule
+
+@router.delete("/rules/{rule_id}")
+async def delete_rule(
+    rule_id: str,
+    db: AsyncSession = Depends(get_db),
+    admin_key: str = Depends(security.validate_admin_key)
+):
+    """Delete an alert rule and its alert history"""
+    db_rule = await _get_rule(db, rule_id)
+    await db.run_sync(rules_changed, db_rule.id, True)
+    await db.delete(db_rule)
+    await db.commit()
+    await db.run_sync(alert_engine.load)
+    return {"status": "success"}
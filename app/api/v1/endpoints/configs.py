@@ -1,68 +1,122 @@
 # app/api/v1/endpoints/configs.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import uuid
 from ....core.database import get_db
+from ....core import security
 from ....schemas import schemas
 from ....models import models
-from datetime import datetime
+from ....config.settings import get_settings
+from ....services.config_bundles import bump_revision, config_bundles, etag_matches
+from ....services.metric_service import parse_agent_id
 
 router = APIRouter()
+settings = get_settings()
 
-@router.post("/{agent_id}", response_model=schemas.NginxConfig)
-def create_config(
+@router.post(
+    "/{agent_id}", response_model=schemas.NginxConfig,
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def create_config(
     agent_id: str,
     config: schemas.NginxConfigCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new nginx configuration for an agent"""
-    db_agent = db.query(models.Agent).filter(models.Agent.id == agent_id).first()
+    agent_uuid = parse_agent_id(agent_id)
+    db_agent = await db.get(models.Agent, agent_uuid) if agent_uuid else None
     if not db_agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    db_config = models.NginxConfig(**config.dict(), agent_id=agent_id)
+    db_config = models.NginxConfig(**config.model_dump(), agent_id=agent_uuid)
     db.add(db_config)
-    db.commit()
-    db.refresh(db_config)
+    await db.flush()
+    await db.run_sync(bump_revision, agent_uuid)
+    await db.commit()
+    await db.refresh(db_config)
     return db_config
 
-@router.get("/{agent_id}", response_model=List[schemas.NginxConfig])
-def get_configs(agent_id: str, db: Session = Depends(get_db)):
-    """Get all nginx configurations for an agent"""
-    configs = db.query(models.NginxConfig).filter(
-        models.NginxConfig.agent_id == agent_id
-    ).all()
-    return configs
+@router.get(
+    "/{agent_id}",
+    response_model=List[schemas.NginxConfig],
+    responses={304: {"description": "Configs unchanged since the given ETag or revision"}},
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def get_configs(
+    agent_id: str,
+    since: Optional[int] = Query(None, ge=0, description="revision the caller already has"),
+    wait: float = Query(0, ge=0, description="seconds to hold the request open for a change"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get all nginx configurations for an agent, served from memory and versioned by revision.
+
+    With `wait`, a fetch that would be unchanged (per `since` or If-None-Match)
+    is held open until the configs change or `wait` seconds pass.
+    """
+    agent_uuid = parse_agent_id(agent_id)
+    bundle = await config_bundles.bundle(agent_uuid) if agent_uuid else None
+    if bundle is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    if since is None and etag_matches(if_none_match, bundle.etag):
+        since = bundle.revision
+    if wait and since is not None and bundle.revision <= since:
+        bundle = await config_bundles.wait_for_change(
+            agent_uuid, since, min(wait, settings.CONFIG_LONG_POLL_MAX_SECONDS)
+        )
+        if bundle is None:
+            raise HTTPException(status_code=404, detail="Agent not found")
+
+    headers = {
+        "ETag": bundle.etag,
+        "X-Config-Revision": str(bundle.revision),
+        "Cache-Control": "no-cache",
+    }
+    if etag_matches(if_none_match, bundle.etag) or (since is not None and bundle.revision <= since):
+        return Response(status_code=304, headers=headers)
+    return Response(bundle.body, media_type="application/json", headers=headers)
+
+async def _get_config(db: AsyncSession, config_id: str, caller_id: str) -> models.NginxConfig:
+    """The config, if it belongs to the agent whose API key made the request"""
+    try:
+        db_config = await db.get(models.NginxConfig, uuid.UUID(config_id))
+    except ValueError:
+        db_config = None
+    if not db_config:
+        raise HTTPException(status_code=404, detail="Configuration not found")
+    if str(db_config.agent_id) != caller_id:
+        raise HTTPException(status_code=403, detail="API key does not belong to this agent")
+    return db_config
 
 @router.put("/{config_id}", response_model=schemas.NginxConfig)
-def update_config(
+async def update_config(
     config_id: str,
     config_update: schemas.NginxConfigCreate,
-    db: Session = Depends(get_db)
+    caller_id: str = Depends(security.validate_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
     """Update nginx configuration"""
-    db_config = db.query(models.NginxConfig).filter(
-        models.NginxConfig.id == config_id
-    ).first()
-    if not db_config:
-        raise HTTPException(status_code=404, detail="Configuration not found")
-
-    for key, value in config_update.dict().items():
+    db_config = await _get_config(db, config_id, caller_id)
+    for key, value in config_update.model_dump().items():
         setattr(db_config, key, value)
-    
-    db.commit()
-    db.refresh(db_config)
+
+    await db.flush()
+    await db.run_sync(bump_revision, db_config.agent_id)
+    await db.commit()
+    await db.refresh(db_config)
     return db_config
 
 @router.delete("/{config_id}")
-def delete_config(config_id: str, db: Session = Depends(get_db)):
+async def delete_config(
+    config_id: str,
+    caller_id: str = Depends(security.validate_api_key),
+    db: AsyncSession = Depends(get_db)
+):
     """Delete nginx configuration"""
-    db_config = db.query(models.NginxConfig).filter(
-        models.NginxConfig.id == config_id
-    ).first()
-    if not db_config:
-        raise HTTPException(status_code=404, detail="Configuration not found")
-
-    db.delete(db_config)
-    db.commit()
-    return {"status": "success", "message": "Configuration deleted"}
\ No newline at end of file
+    db_config = await _get_config(db, config_id, caller_id)
+    await db.delete(db_config)
+    await db.flush()
+    await db.run_sync(bump_revision, db_config.agent_id)
+    await db.commit()
+    return {"status": "success", "message": "Configuration deleted"}
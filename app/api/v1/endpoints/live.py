@@ -0,0 +1,111 @@
+# app/api/v1/endpoints/live.py
+import asyncio
+from fastapi import (
+    APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect,
+    WebSocketException, status
+)
+from fastapi.requests import HTTPConnection
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
+from ....core import security
+from ....services.live_hub import SAMPLE, LiveFilter, live_hub
+from ....config.settings import get_settings
+
+router = APIRouter()
+settings = get_settings()
+
+def live_filter(
+    connection: HTTPConnection,
+    kind: Optional[List[Literal["metric", "log"]]] = Query(None),
+    agent_id: Optional[List[str]] = Query(None),
+    environment: Optional[List[str]] = Query(None),
+    metric_type: Optional[List[str]] = Query(None),
+    level: Optional[List[str]] = Query(None),
+    caller_id: str = Depends(security.validate_api_key),
+    admin_key: Optional[str] = Header(None, alias="X-Admin-Key"),
+) -> LiveFilter:
+    """Subscription filter from repeatable query parameters.
+
+    An agent's key sees only that agent's events; the admin key any agent's.
+    """
+    agent_ids = frozenset(agent_id or ())
+    if admin_key is None or not security.verify_admin_key(admin_key):
+        if agent_ids - {caller_id}:
+            detail = "API key does not belong to this agent"
+            if connection.scope["type"] == "websocket":
+                raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=detail)
+            raise HTTPException(status_code=403, detail=detail)
+        agent_ids = frozenset({caller_id})
+    return LiveFilter(
+        kinds=frozenset(kind or ()),
+        agent_ids=agent_ids,
+        environments=frozenset(environment or ()),
+        metric_types=frozenset(metric_type or ()),
+        levels=frozenset(name.upper() for name in level or ()),
+    )
+
+@router.get("/sse")
+async def stream_events(
+    request: Request,
+    filters: LiveFilter = Depends(live_filter),
+    slow: Literal["sample", "disconnect"] = SAMPLE
+):
+    """Server-sent events of newly committed metrics and logs matching the filters"""
+    subscription = live_hub.subscribe(filters, slow)
+
+    async def events():
+        try:
+            while not (subscription.closed and subscription.queue.empty()):
+                batch, dropped = await subscription.next_batch(settings.LIVE_KEEPALIVE_SECONDS)
+                if dropped:
+                    yield f"event: dropped\ndata: {dropped}\n\n"
+                if batch:
+                    yield "".join(f"data: {event}\n\n" for event in batch)
+                elif batch is None:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+        finally:
+            live_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def websocket_events(
+    websocket: WebSocket,
+    filters: LiveFilter = Depends(live_filter),
+    slow: Literal["sample", "disconnect"] = SAMPLE
+):
+    """WebSocket feed of newly committed metrics and logs, one JSON array per message"""
+    await websocket.accept()
+    subscription = live_hub.subscribe(filters, slow)
+
+    async def watch_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            live_hub.close(subscription)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        while not (subscription.closed and subscription.queue.empty()):
+            batch, dropped = await subscription.next_batch(settings.LIVE_KEEPALIVE_SECONDS)
+            if watcher.done():
+                break
+            if dropped:
+                await websocket.send_text(f'{{"dropped":{dropped}}}')
+            if batch:
+                await websocket.send_text("[" + ",".join(batch) + "]")
+        else:
+            # Closed by the hub because the consumer fell too far behind
+            await websocket.close(code=1013, reason="Consumer too slow")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
+        live_hub.unsubscribe(subscription)
@@ -1,43 +1,298 @@
 # app/api/v1/endpoints/logs.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from sqlalchemy import delete, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from ....core.cache import MISSING
 from ....core.database import get_db
+from ....core import pagination, security
+from ....core.codecs import DecodingRoute, InvalidTimestamp
 from ....schemas import schemas
 from ....models import models
+from ....services import archive, idempotency, log_search, log_service, metric_service
+from ....services.idempotency import IN_FLIGHT, recent_keys
+from ....services.ingest_queue import ingest_queue, LOG
+from ....services.log_guard import log_guard
+from ....config.settings import get_settings
 from datetime import datetime, timedelta
 
-router = APIRouter()
+# Every body may be msgpack and/or gzip/deflate/zstd compressed, not just JSON
+router = APIRouter(route_class=DecodingRoute)
+settings = get_settings()
 
-@router.post("/{agent_id}", response_model=schemas.Log)
-def create_log(
+def _rate_limited(agent_id) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Log rate limit exceeded for this agent",
+        headers={"Retry-After": str(log_guard.retry_after(agent_id))}
+    )
+
+def _in_flight() -> HTTPException:
+    # Writing the rows again would count them as repeats of themselves
+    return HTTPException(
+        status_code=409,
+        detail="A submission with this key is still being stored",
+        headers={"Retry-After": "1"}
+    )
+
+@router.post(
+    "/{agent_id}", response_model=schemas.Log,
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def create_log(
+    agent_id: str,
+    log: schemas.LogCreate,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    agent_session: Optional[str] = Header(None, alias=idempotency.SESSION_HEADER),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create a new log entry for an agent; a recent identical entry absorbs it instead"""
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    scope = idempotency.key_scope(LOG, agent_uuid)
+    key = idempotency.submission_key(idempotency_key, log.seq, agent_session)
+    if agent_uuid and key:
+        stored = recent_keys.response(scope, key)
+        if stored is not MISSING:
+            return stored
+    if not agent_uuid or not await db.run_sync(metric_service.existing_agent_ids, [agent_uuid]):
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    rows = [log_service.log_row(agent_uuid, log)]
+    claims = []
+    if key:
+        rows, stored = recent_keys.claim(scope, key, rows, exclusive=True)
+        if stored is IN_FLIGHT:
+            raise _in_flight()
+        if stored is not MISSING:
+            return stored
+        claims.append((scope, key))
+
+    admission = log_guard.admit(rows)
+    if admission.collapsed:
+        # The repeat is stored with the row it folded into, which may still be queued
+        if claims:
+            log_guard.when_stored(
+                admission.collapsed[0]["id"], recent_keys.settle_later(claims, admission.collapsed[0])
+            )
+        return admission.collapsed[0]
+    if admission.dropped:
+        recent_keys.release_all(claims)
+        raise _rate_limited(agent_uuid)
+
+    # The row already carries every returned field, so no refresh is needed
+    try:
+        await db.run_sync(log_service.insert_log_rows, admission.rows)
+        await db.commit()
+    except Exception:
+        recent_keys.release_all(claims)
+        raise
+    recent_keys.complete_all(claims, admission.rows[0])
+    return admission.rows[0]
+
+@router.post(
+    "/{agent_id}/submit", response_model=schemas.IngestAck, status_code=202,
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def submit_log(
     agent_id: str,
     log: schemas.LogCreate,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    agent_session: Optional[str] = Header(None, alias=idempotency.SESSION_HEADER)
+):
+    """Queue a log entry for an agent and acknowledge without waiting for the database"""
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    if not agent_uuid:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    scope = idempotency.key_scope(LOG, agent_uuid)
+    key = idempotency.submission_key(idempotency_key, log.seq, agent_session)
+    rows = [log_service.log_row(agent_uuid, log)]
+    claims = []
+    if key:
+        rows, stored = recent_keys.claim(scope, key, rows, exclusive=True)
+        if stored is IN_FLIGHT:
+            # The first attempt settles the key; this one must not admit its row again
+            return {"queued": 0, "queue_depth": ingest_queue.depth, "duplicates": 1}
+        if stored is not MISSING:
+            return {**stored, "queued": 0, "queue_depth": ingest_queue.depth, "duplicates": 1}
+        claims.append((scope, key))
+
+    admission = log_guard.admit(rows)
+    if admission.dropped:
+        recent_keys.release_all(claims)
+        raise _rate_limited(agent_uuid)
+
+    # The key is settled only once the flusher has stored the row, so a retry
+    # after a failed flush is written again rather than answered from memory
+    ack = {"queued": len(admission.rows), "collapsed": len(admission.collapsed)}
+    settle = recent_keys.settle_later(claims, ack) if claims else None
+    if admission.collapsed:
+        # A repeat is stored with the row it folded into, once that row's own flush commits
+        if settle:
+            log_guard.when_stored(admission.collapsed[0]["id"], settle)
+    else:
+        try:
+            ingest_queue.submit(LOG, admission.rows, done=settle)
+        except HTTPException:
+            recent_keys.release_all(claims)
+            raise
+    ack["queue_depth"] = ingest_queue.depth
+    return ack
+
+@router.post(
+    "/{agent_id}/columnar", response_model=schemas.BatchResult,
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def create_logs_columnar(
+    agent_id: str,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Create a new log entry for an agent"""
-    db_agent = db.query(models.Agent).filter(models.Agent.id == agent_id).first()
-    if not db_agent:
+    """Create many log entries from a columnar batch of timestamps, levels and messages"""
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    scope = idempotency.key_scope(LOG, agent_uuid)
+    request_key = idempotency.submission_key(idempotency_key)
+    if agent_uuid and request_key:
+        stored = recent_keys.response(scope, request_key)
+        if stored is not MISSING:
+            return stored
+    if not agent_uuid or not await db.run_sync(metric_service.existing_agent_ids, [agent_uuid]):
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    db_log = models.AgentLog(**log.dict(), agent_id=agent_id)
-    db.add(db_log)
-    db.commit()
-    db.refresh(db_log)
-    return db_log
+    payload = await request.json()
+    entries = len(payload.get("timestamps") or ()) if isinstance(payload, dict) else 0
+    if entries > settings.METRICS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.METRICS_BATCH_MAX_ITEMS} items"
+        )
+    try:
+        rows = log_service.rows_from_columnar(agent_uuid, payload)
+    except InvalidTimestamp as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows, _, claims, stored = recent_keys.claim_batch(
+        scope, request_key, [(scope, None, rows)], exclusive=True
+    )
+    if stored is IN_FLIGHT:
+        raise _in_flight()
+    if stored is not MISSING:
+        return stored
+
+    admission = log_guard.admit(rows)
+    try:
+        inserted = await db.run_sync(log_service.insert_log_rows, admission.rows)
+        await db.commit()
+    except Exception:
+        recent_keys.release_all(claims)
+        raise
+    result = schemas.BatchResult(
+        accepted=len(admission.rows) + len(admission.collapsed),
+        rejected=admission.dropped,
+        rows=inserted,
+        collapsed=len(admission.collapsed),
+        duplicates=len(admission.rows) - inserted
+    )
+    recent_keys.complete_all(claims, result)
+    return result
+
+LOG_COLUMNS = pagination.schema_columns(schemas.Log, models.AgentLog)
+
+async def _log_page(
+    db: AsyncSession,
+    query,
+    request: Request,
+    cursor: Optional[str],
+    limit: Optional[int],
+    format: Optional[str],
+    q: Optional[str] = None,
+    default_limit: Optional[int] = None,
+    archived: Optional[pagination.ArchiveReader] = None
+):
+    if q:
+        try:
+            query = query.filter(log_search.search_condition(db.get_bind().dialect.name, q))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    query = pagination.keyset(query, models.AgentLog.timestamp, models.AgentLog.id, cursor)
+    if pagination.wants_ndjson(request, format):
+        if limit:
+            query = query.limit(limit)
+        return pagination.stream_ndjson(query, LOG_COLUMNS, archived=archived, limit=limit)
+    size = pagination.page_size(limit, default_limit)
+    if not q:
+        return await pagination.fetch_json_page(db, query, LOG_COLUMNS, size, archived=archived)
+    try:
+        await db.run_sync(log_search.apply_time_budget)
+        return await pagination.fetch_json_page(db, query, LOG_COLUMNS, size, archived=archived)
+    except DBAPIError as e:
+        if log_search.is_over_budget(e):
+            raise _over_budget()
+        raise
+
+def _over_budget() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Search exceeded its {settings.LOG_SEARCH_TIME_BUDGET_MS} ms budget; "
+               "narrow the query or the time window"
+    )
+
+@router.get("/search", response_model=List[schemas.LogSearchHit])
+async def search_logs(
+    q: str = Query(..., min_length=1),
+    agent_id: Optional[str] = None,
+    level: str = None,
+    category: str = None,
+    hours: int = Query(24, ge=1),
+    limit: int = Query(50, ge=1),
+    db: AsyncSession = Depends(get_db)
+):
+    """Logs matching a full-text query, best match first, with matches highlighted"""
+    if hours > settings.LOG_SEARCH_MAX_HOURS:
+        raise HTTPException(
+            status_code=400, detail=f"hours must be at most {settings.LOG_SEARCH_MAX_HOURS}"
+        )
+    if agent_id and not metric_service.parse_agent_id(agent_id):
+        raise HTTPException(status_code=404, detail="Agent not found")
+    try:
+        return await db.run_sync(
+            log_search.search,
+            q=q,
+            since=datetime.utcnow() - timedelta(hours=hours),
+            agent_id=agent_id,
+            level=level,
+            category=category,
+            limit=min(limit, settings.LOG_SEARCH_MAX_RESULTS)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DBAPIError as e:
+        if log_search.is_over_budget(e):
+            raise _over_budget()
+        raise
 
 @router.get("/{agent_id}", response_model=List[schemas.Log])
-def get_logs(
+async def get_logs(
     agent_id: str,
+    request: Request,
     level: str = None,
     category: str = None,
     hours: int = 24,
-    db: Session = Depends(get_db)
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get logs for an agent"""
-    query = db.query(models.AgentLog).filter(
+    """Get logs for an agent, newest first, one keyset page at a time; `q` filters by full text"""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    query = select(models.AgentLog).filter(
         models.AgentLog.agent_id == agent_id,
-        models.AgentLog.timestamp >= datetime.utcnow() - timedelta(hours=hours)
+        models.AgentLog.timestamp >= since
     )
     
     if level:
@@ -45,19 +300,33 @@ def get_logs(
     if category:
         query = query.filter(models.AgentLog.category == category)
     
-    return query.order_by(models.AgentLog.timestamp.desc()).all()
+    archived = None
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    if agent_uuid and archive.reaches_archive(archive.LOGS, since):
+        environment = await db.run_sync(metric_service.agent_environment, agent_uuid)
+        archived = archive.reader(
+            archive.LOGS, since, {"agent_id": agent_uuid, "level": level, "category": category},
+            cursor, environment=environment or archive.UNKNOWN_ENVIRONMENT, q=q
+        )
+
+    return await _log_page(db, query, request, cursor, limit, format, q=q, archived=archived)
 
 @router.get("/", response_model=List[schemas.Log])
-def get_all_logs(
+async def get_all_logs(
+    request: Request,
     level: str = None,
     category: str = None,
     hours: int = 24,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get logs across all agents"""
-    query = db.query(models.AgentLog).filter(
-        models.AgentLog.timestamp >= datetime.utcnow() - timedelta(hours=hours)
+    """Get logs across all agents, newest first, one keyset page at a time; `q` filters by full text"""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    query = select(models.AgentLog).filter(
+        models.AgentLog.timestamp >= since
     )
     
     if level:
@@ -65,21 +334,28 @@ def get_all_logs(
     if category:
         query = query.filter(models.AgentLog.category == category)
     
-    return query.order_by(models.AgentLog.timestamp.desc()).limit(limit).all()
+    archived = None
+    if archive.reaches_archive(archive.LOGS, since):
+        archived = archive.reader(archive.LOGS, since, {"level": level, "category": category}, cursor, q=q)
+
+    return await _log_page(
+        db, query, request, cursor, limit, format, q=q, default_limit=100, archived=archived
+    )
 
-@router.delete("/{agent_id}/clear")
-def clear_logs(
+@router.delete("/{agent_id}/clear", dependencies=[Depends(security.authorize_agent)])
+async def clear_logs(
     agent_id: str,
     days: int = 30,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete old logs for an agent"""
-    deleted = db.query(models.AgentLog).filter(
+    result = await db.execute(delete(models.AgentLog).where(
         models.AgentLog.agent_id == agent_id,
         models.AgentLog.timestamp < datetime.utcnow() - timedelta(days=days)
-    ).delete()
+    ))
+    deleted = result.rowcount
     
-    db.commit()
+    await db.commit()
     return {
         "status": "success",
         "message": f"Deleted {deleted} logs older than {days} days"
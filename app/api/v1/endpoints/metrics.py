@@ -1,77 +1,404 @@
 # app/api/v1/endpoints/metrics.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Literal, Optional, Union
 from datetime import datetime, timedelta
+from ....core.cache import MISSING
 from ....core.database import get_db
+from ....core import pagination, security
+from ....core.codecs import DecodingRoute, InvalidTimestamp
 from ....schemas import schemas
 from ....models import models
+from ....services import aggregates, archive, idempotency, metric_service, rollups
+from ....services.idempotency import recent_keys
+from ....services.ingest_queue import ingest_queue, METRIC
+from ....services.latest_metrics import latest_metrics
+from ....config.settings import get_settings
 
-router = APIRouter()
+# Every body may be msgpack and/or gzip/deflate/zstd compressed, not just JSON
+router = APIRouter(route_class=DecodingRoute)
+settings = get_settings()
 
-@router.post("/{agent_id}", response_model=schemas.Metric)
+METRIC_COLUMNS = pagination.schema_columns(schemas.Metric, models.AgentMetric)
+
+def _check_batch_size(batch: schemas.MetricsBatch):
+    if len(batch.metrics) + len(batch.submissions) > settings.METRICS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.METRICS_BATCH_MAX_ITEMS} items"
+        )
+
+async def _store_batch(
+    db: AsyncSession,
+    rows: List[dict],
+    accepted: int,
+    errors: List[schemas.BatchItemError],
+    claims: List[idempotency.Claim] = (),
+    duplicates: int = 0,
+    request_key: Optional[str] = None
+) -> schemas.BatchResult:
+    """Persist all accepted rows in a single transaction"""
+    try:
+        inserted = await db.run_sync(metric_service.insert_metric_rows, rows)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        recent_keys.release_all(claims)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    errors.sort(key=lambda e: (e.section, e.index))
+    result = schemas.BatchResult(
+        accepted=accepted,
+        rejected=len(errors),
+        rows=inserted,
+        errors=errors,
+        duplicates=duplicates
+    )
+    # A batch keyed as a whole answers its retries with this result
+    recent_keys.complete_all(claims, result if request_key else True)
+    return result
+
+@router.post("/batch", response_model=schemas.BatchResult)
+async def record_fleet_metrics_batch(
+    batch: schemas.MetricsBatch,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    agent_session: Optional[str] = Header(None, alias=idempotency.SESSION_HEADER),
+    caller_id: str = Depends(security.validate_api_key),
+    admin_key: Optional[str] = Header(None, alias="X-Admin-Key"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Record metrics for many agents in one request; other agents' need the admin key too"""
+    _check_batch_size(batch)
+    scope = idempotency.caller_scope(METRIC, caller_id)
+    request_key = idempotency.submission_key(idempotency_key)
+    if request_key:
+        stored = recent_keys.response(scope, request_key)
+        if stored is not MISSING:
+            return stored
+
+    metrics, errors = metric_service.validate_items(
+        batch.metrics, schemas.MetricCreate, "metrics"
+    )
+    submissions, submit_errors = metric_service.validate_items(
+        batch.submissions, schemas.AgentMetricsSubmit, "submissions"
+    )
+    errors.extend(submit_errors)
+
+    # Resolve every referenced agent with one query
+    known_agents = await db.run_sync(
+        metric_service.existing_agent_ids,
+        [item.agent_id for _, item in metrics + submissions]
+    )
+
+    any_agent = admin_key is not None and security.verify_admin_key(admin_key)
+    keyed_items = []
+    for section, items, to_rows in (
+        ("metrics", metrics, metric_service.rows_from_metric),
+        ("submissions", submissions, metric_service.rows_from_submit),
+    ):
+        for index, item in items:
+            if not any_agent and str(item.agent_id) != caller_id:
+                errors.append(schemas.BatchItemError(
+                    section=section, index=index, detail="API key does not belong to this agent"
+                ))
+                continue
+            if item.agent_id not in known_agents:
+                errors.append(schemas.BatchItemError(
+                    section=section, index=index, detail="Agent not found"
+                ))
+                continue
+            keyed_items.append((
+                idempotency.key_scope(METRIC, item.agent_id),
+                idempotency.submission_key(None, item.seq, agent_session),
+                to_rows(item.agent_id, item)
+            ))
+
+    rows, duplicates, claims, stored = recent_keys.claim_batch(scope, request_key, keyed_items)
+    if stored is not MISSING:
+        return stored
+    return await _store_batch(db, rows, len(keyed_items), errors, claims, duplicates, request_key)
+
+@router.post(
+    "/{agent_id}/batch", response_model=schemas.BatchResult,
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def record_metrics_batch(
+    agent_id: str,
+    batch: schemas.MetricsBatch,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    agent_session: Optional[str] = Header(None, alias=idempotency.SESSION_HEADER),
+    db: AsyncSession = Depends(get_db)
+):
+    """Record many metric samples for an agent in one request"""
+    _check_batch_size(batch)
+
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    scope = idempotency.key_scope(METRIC, agent_uuid)
+    request_key = idempotency.submission_key(idempotency_key)
+    if agent_uuid and request_key:
+        stored = recent_keys.response(scope, request_key)
+        if stored is not MISSING:
+            return stored
+    if not agent_uuid or not await db.run_sync(metric_service.existing_agent_ids, [agent_uuid]):
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    metrics, errors = metric_service.validate_items(
+        batch.metrics, schemas.MetricSample, "metrics"
+    )
+    submissions, submit_errors = metric_service.validate_items(
+        batch.submissions, schemas.MetricsSubmit, "submissions"
+    )
+    errors.extend(submit_errors)
+
+    keyed_items = [
+        (scope, idempotency.submission_key(None, metric.seq, agent_session), metric_service.rows_from_metric(agent_uuid, metric))
+        for _, metric in metrics
+    ] + [
+        (scope, idempotency.submission_key(None, submit.seq, agent_session), metric_service.rows_from_submit(agent_uuid, submit))
+        for _, submit in submissions
+    ]
+
+    rows, duplicates, claims, stored = recent_keys.claim_batch(scope, request_key, keyed_items)
+    if stored is not MISSING:
+        return stored
+    return await _store_batch(db, rows, len(keyed_items), errors, claims, duplicates, request_key)
+
+@router.post(
+    "/{agent_id}/columnar", response_model=schemas.BatchResult,
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def record_metrics_columnar(
+    agent_id: str,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    db: AsyncSession = Depends(get_db)
+):
+    """Record a columnar batch: {"timestamps": [...], "metrics": {type: {field: [...]}}}"""
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    scope = idempotency.key_scope(METRIC, agent_uuid)
+    request_key = idempotency.submission_key(idempotency_key)
+    if agent_uuid and request_key:
+        stored = recent_keys.response(scope, request_key)
+        if stored is not MISSING:
+            return stored
+    if not agent_uuid or not await db.run_sync(metric_service.existing_agent_ids, [agent_uuid]):
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    payload = await request.json()
+    samples = len(payload.get("timestamps") or ()) if isinstance(payload, dict) else 0
+    if samples > settings.METRICS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.METRICS_BATCH_MAX_ITEMS} items"
+        )
+    try:
+        rows = metric_service.rows_from_columnar(agent_uuid, payload)
+    except InvalidTimestamp as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows, _, claims, stored = recent_keys.claim_batch(scope, request_key, [(scope, None, rows)])
+    if stored is not MISSING:
+        return stored
+    return await _store_batch(db, rows, samples, [], claims, request_key=request_key)
+
+@router.post(
+    "/{agent_id}", response_model=schemas.Metric,
+    dependencies=[Depends(security.authorize_agent)]
+)
 async def record_metric(
     agent_id: str,
     metric: schemas.MetricCreate,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    agent_session: Optional[str] = Header(None, alias=idempotency.SESSION_HEADER),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Record a new metric for an agent"""
+    """Record a new metric for an agent; a retry with the same key or seq returns the first result"""
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    scope = idempotency.key_scope(METRIC, agent_uuid)
+    key = idempotency.submission_key(idempotency_key, metric.seq, agent_session)
+    if agent_uuid and key:
+        stored = recent_keys.response(scope, key)
+        if stored is not MISSING:
+            return stored
+
+    claimed = False
     try:
         # Verify agent exists
-        agent = db.query(models.Agent).filter(
-            models.Agent.id == agent_id
-        ).first()
-        
-        if not agent:
+        if not agent_uuid or not await db.run_sync(metric_service.existing_agent_ids, [agent_uuid]):
             raise HTTPException(status_code=404, detail="Agent not found")
 
-        # Create metric
-        db_metric = models.AgentMetric(
-            agent_id=agent_id,
-            metric_type=metric.metric_type,
-            value=metric.value,
-            timestamp=metric.timestamp or datetime.utcnow()
-        )
-        
-        db.add(db_metric)
-        db.commit()
-        db.refresh(db_metric)
-        return db_metric
+        # Create metric; the row already carries every returned field
+        rows = metric_service.rows_from_metric(agent_uuid, metric)
+        if key:
+            rows, stored = recent_keys.claim(scope, key, rows)
+            if stored is not MISSING:
+                return stored
+            claimed = True
+        await db.run_sync(metric_service.insert_metric_rows, rows)
+        await db.commit()
+        if claimed:
+            recent_keys.complete(scope, key, rows[0])
+        return rows[0]
 
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        if claimed:
+            recent_keys.release(scope, key)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/{agent_id}/metrics", response_model=List[schemas.Metric])
+@router.post(
+    "/{agent_id}/submit", response_model=schemas.IngestAck, status_code=202,
+    dependencies=[Depends(security.authorize_agent)]
+)
+async def submit_metrics(
+    agent_id: str,
+    metrics: Union[schemas.MetricsSubmit, schemas.MetricSample],
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    agent_session: Optional[str] = Header(None, alias=idempotency.SESSION_HEADER)
+):
+    """Queue metrics for an agent and acknowledge without waiting for the database"""
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    if not agent_uuid:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    if isinstance(metrics, schemas.MetricsSubmit):
+        rows = metric_service.rows_from_submit(agent_uuid, metrics)
+    else:
+        rows = metric_service.rows_from_metric(agent_uuid, metrics)
+
+    scope = idempotency.key_scope(METRIC, agent_uuid)
+    key = idempotency.submission_key(idempotency_key, metrics.seq, agent_session)
+    claims = []
+    if key:
+        rows, stored = recent_keys.claim(scope, key, rows)
+        if stored is not MISSING:
+            return {**stored, "queued": 0, "queue_depth": ingest_queue.depth, "duplicates": 1}
+        claims.append((scope, key))
+
+    # The key is settled only once the flusher has stored the rows, so a retry
+    # after a failed flush is written again rather than answered from memory
+    ack = {"queued": len(rows)}
+    try:
+        ingest_queue.submit(METRIC, rows, done=recent_keys.settle_later(claims, ack) if claims else None)
+    except HTTPException:
+        recent_keys.release_all(claims)
+        raise
+    ack["queue_depth"] = ingest_queue.depth
+    return ack
+
+@router.get(
+    "/{agent_id}/metrics",
+    response_model=Union[List[schemas.Metric], List[schemas.MetricBucket]]
+)
 async def get_agent_metrics(
     agent_id: str,
+    request: Request,
     metric_type: Optional[str] = None,
     hours: int = 24,
-    db: Session = Depends(get_db)
+    bucket: Optional[Literal["1m", "5m", "1h"]] = None,
+    agg: Literal["avg", "min", "max", "p95"] = "avg",
+    field: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get metrics for an agent"""
-    query = db.query(models.AgentMetric).filter(
+    """Get metrics for an agent, optionally downsampled into time buckets"""
+    if bucket:
+        if not metric_type or not field:
+            raise HTTPException(
+                status_code=400,
+                detail="metric_type and field are required when bucket is set"
+            )
+        agent_uuid = metric_service.parse_agent_id(agent_id)
+        if not agent_uuid:
+            return []
+        fields = [f.strip() for f in field.split(",") if f.strip()]
+        try:
+            return await db.run_sync(
+                rollups.query_buckets, agent_uuid, metric_type, fields, bucket, agg, hours
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    query = select(models.AgentMetric).filter(
         models.AgentMetric.agent_id == agent_id,
-        models.AgentMetric.timestamp >= datetime.utcnow() - timedelta(hours=hours)
+        models.AgentMetric.timestamp >= since
     )
     
     if metric_type:
         query = query.filter(models.AgentMetric.metric_type == metric_type)
     
-    return query.order_by(models.AgentMetric.timestamp.desc()).all()
+    # Windows reaching past the hot data continue into the archive
+    archived = None
+    agent_uuid = metric_service.parse_agent_id(agent_id)
+    if agent_uuid and archive.reaches_archive(archive.METRICS, since):
+        environment = await db.run_sync(metric_service.agent_environment, agent_uuid)
+        archived = archive.reader(
+            archive.METRICS, since, {"agent_id": agent_uuid, "metric_type": metric_type}, cursor,
+            environment=environment or archive.UNKNOWN_ENVIRONMENT
+        )
+
+    query = pagination.keyset(query, models.AgentMetric.timestamp, models.AgentMetric.id, cursor)
+    if pagination.wants_ndjson(request, format):
+        if limit:
+            query = query.limit(limit)
+        return pagination.stream_ndjson(query, METRIC_COLUMNS, archived=archived, limit=limit)
+    return await pagination.fetch_json_page(
+        db, query, METRIC_COLUMNS, pagination.page_size(limit), archived=archived
+    )
+
+@router.get("/aggregate", response_model=schemas.AggregateResult)
+async def get_fleet_aggregate(
+    metric_type: str,
+    field: str,
+    group_by: Optional[str] = None,
+    hours: int = 1,
+    top: int = 0,
+    top_by: Literal["avg", "min", "max"] = "avg",
+    ascending: bool = False
+):
+    """Fleet-wide statistics of one metric field, grouped by environment, status or os_info.<key>"""
+    if not 1 <= hours <= settings.AGGREGATE_MAX_HOURS:
+        raise HTTPException(
+            status_code=400, detail=f"hours must be between 1 and {settings.AGGREGATE_MAX_HOURS}"
+        )
+    if not 0 <= top <= settings.AGGREGATE_MAX_TOP:
+        raise HTTPException(
+            status_code=400, detail=f"top must be between 0 and {settings.AGGREGATE_MAX_TOP}"
+        )
+    try:
+        aggregates.group_column(group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await aggregates.cached_aggregate(
+        metric_type=metric_type, field=field, group_by=group_by, hours=hours,
+        top=top, top_by=top_by, ascending=ascending
+    )
+
+@router.get("/latest", response_model=Dict[str, Dict[str, schemas.Metric]])
+async def get_fleet_latest_metrics(metric_type: Optional[str] = None):
+    """Get the newest value of every metric type for every agent"""
+    return latest_metrics.snapshot(metric_type)
 
 @router.get("/{agent_id}/latest", response_model=schemas.Metric)
 async def get_latest_metric(
     agent_id: str,
     metric_type: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get latest metric of specific type for an agent"""
-    metric = db.query(models.AgentMetric).filter(
-        models.AgentMetric.agent_id == agent_id,
-        models.AgentMetric.metric_type == metric_type
-    ).order_by(models.AgentMetric.timestamp.desc()).first()
-    
+    metric = latest_metrics.get(agent_id, metric_type)
+    if not metric:
+        metric = await db.run_sync(latest_metrics.load_series, agent_id, metric_type)
+
     if not metric:
         raise HTTPException(status_code=404, detail="Metric not found")
     
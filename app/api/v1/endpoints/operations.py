@@ -0,0 +1,30 @@
+# app/api/v1/endpoints/operations.py
+from fastapi import APIRouter, Depends, Response
+from ....core import instrumentation, security
+from ....services.alerts import alert_engine
+from ....services.fleet import fleet_snapshot
+from ....services.idempotency import recent_keys
+from ....services.ingest_queue import ingest_queue
+from ....services.log_guard import log_guard
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus exposition of request, database and ingest instrumentation"""
+    # Agents by status come from the in-memory fleet snapshot, so a scrape never queries the database
+    agents_by_status = fleet_snapshot.counts()["facets"]["status"]
+    return Response(
+        instrumentation.render(agents_by_status),
+        media_type=instrumentation.CONTENT_TYPE_LATEST
+    )
+
+@router.get("/api/v1/ingest/stats")
+async def ingest_stats(admin_key: str = Depends(security.validate_admin_key)):
+    """Write-behind ingestion queue depth, flush latency, log dedup/rate-limit, retry and alert counters"""
+    return {
+        **ingest_queue.stats(),
+        "logs": log_guard.stats(),
+        "idempotency": recent_keys.stats(),
+        "alerts": alert_engine.stats()
+    }
@@ -0,0 +1,52 @@
+# app/api/v1/endpoints/registration.py
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from ....core.database import get_db
+from ....core import security
+from ....schemas import schemas
+from . import agents
+
+router = APIRouter()
+
+@router.post("/register/token", response_model=schemas.TokenResponse)
+async def create_registration_token(
+    request: schemas.TokenRequest,
+    db: AsyncSession = Depends(get_db),
+    admin_key: str = Depends(security.validate_admin_key)
+):
+    """Generate a new registration token"""
+    return await agents.get_registration_token(request, db, admin_key)
+
+@router.post("/register/tokens", response_model=schemas.TokenBatchResponse)
+async def create_registration_tokens(
+    request: schemas.TokenBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    admin_key: str = Depends(security.validate_admin_key)
+):
+    """Generate many registration tokens in one transaction"""
+    return await agents.mint_registration_tokens(request, db)
+
+@router.post("/register/agent", response_model=schemas.AgentResponse)
+async def register_agent(
+    agent: schemas.AgentRegister,
+    db: AsyncSession = Depends(get_db)
+):
+    """Register a new agent"""
+    return await agents.register_agent(agent, db)
+
+@router.post("/register/agents", response_model=schemas.AgentRegisterBatchResult)
+async def register_agents(
+    batch: schemas.AgentRegisterBatch,
+    db: AsyncSession = Depends(get_db)
+):
+    """Register many agents, each with its own registration token"""
+    return await agents.register_agents_bulk(batch, db)
+
+@router.post("/agents/{agent_id}/keys/revoke")
+async def revoke_agent_keys(
+    agent_id: str,
+    db: AsyncSession = Depends(get_db),
+    admin_key: str = Depends(security.validate_admin_key)
+):
+    """Revoke all API keys of an agent"""
+    return await agents.revoke_agent_keys(agent_id, db)
@@ -0,0 +1,505 @@
+# app/benchmarks/agent_bench.py
+"""Simulate a fleet of agents against the API and report latency and throughput.
+
+Run against a live server:
+    python -m app.benchmarks.agent_bench --base-url http://localhost:8000 --admin-key ...
+
+or in-process against a throwaway SQLite stand-in (ADMIN_KEY etc. must be set):
+    python -m app.benchmarks.agent_bench --database-url sqlite:///./bench.db
+
+Use --save-baseline to record a run and --baseline to fail on regressions.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import msgpack
+
+# Operation -> relative weight in the mixed traffic of each scenario
+SCENARIOS: Dict[str, Dict[str, int]] = {
+    "ingest": {
+        "record_metric": 4, "submit_metrics": 4, "metrics_batch": 1,
+        "create_log": 3, "submit_log": 3, "heartbeat": 4,
+        "metrics_columnar": 1, "logs_columnar": 1,
+    },
+    "query": {
+        "get_metrics": 3, "get_metrics_bucketed": 2, "get_latest": 3,
+        "get_fleet_latest": 1, "get_logs": 3, "list_agents": 1, "fleet_aggregate": 1,
+    },
+    "mixed": {
+        "record_metric": 3, "submit_metrics": 3, "metrics_batch": 1,
+        "create_log": 2, "submit_log": 2, "heartbeat": 3,
+        "get_metrics": 2, "get_latest": 2, "get_logs": 2, "list_agents": 1,
+    },
+}
+
+# Operations that rely on Postgres-only SQL (date_bin) and are skipped on SQLite
+POSTGRES_ONLY = {"get_metrics_bucketed"}
+
+LOG_LEVELS = ["DEBUG", "INFO", "INFO", "INFO", "WARNING", "ERROR"]
+LOG_CATEGORIES = ["system", "nginx", "security", "agent"]
+
+class Agent:
+    def __init__(self, agent_id: str, api_key: str, hostname: str):
+        self.agent_id = agent_id
+        self.api_key = api_key
+        self.hostname = hostname
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"X-API-Key": self.api_key}
+
+class Recorder:
+    """Per-operation latency samples, row counts and errors"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.rows: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.bytes_sent: Dict[str, int] = defaultdict(int)
+        self.elapsed = 0.0
+
+    def record(self, op: str, seconds: float, ok: bool, rows: int, sent: int = 0):
+        self.latencies[op].append(seconds)
+        self.bytes_sent[op] += sent
+        if ok:
+            self.rows[op] += rows
+        else:
+            self.errors[op] += 1
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        elapsed = self.elapsed or 1.0
+        results = {}
+        for op, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            results[op] = {
+                "count": len(samples),
+                "errors": self.errors[op],
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p99_ms": round(percentile(samples, 99) * 1000, 3),
+                "requests_per_sec": round(len(samples) / elapsed, 2),
+                "rows_per_sec": round(self.rows[op] / elapsed, 2),
+                "request_bytes": round(self.bytes_sent[op] / len(samples)),
+            }
+        return results
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    k = (len(sorted_samples) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (k - lo)
+
+# Payloads shaped like what the agent daemon sends (MetricsSubmit / LogSubmit)
+def metrics_submit(rng: random.Random) -> dict:
+    total_mem = 16 * 1024 ** 3
+    used_mem = int(total_mem * rng.uniform(0.2, 0.9))
+    return {
+        "cpu": {
+            "percent": round(rng.uniform(0, 100), 1),
+            "load_1": round(rng.uniform(0, 8), 2),
+            "load_5": round(rng.uniform(0, 6), 2),
+            "load_15": round(rng.uniform(0, 4), 2),
+            "cores": 8,
+        },
+        "memory": {
+            "total": total_mem, "used": used_mem, "available": total_mem - used_mem,
+            "percent": round(used_mem / total_mem * 100, 1),
+        },
+        "disk": {
+            "total": 512 * 1024 ** 3, "used": rng.randint(50, 400) * 1024 ** 3,
+            "percent": round(rng.uniform(10, 80), 1),
+            "read_bytes": rng.randint(0, 10 ** 9), "write_bytes": rng.randint(0, 10 ** 9),
+        },
+        "network": {
+            "bytes_sent": rng.randint(0, 10 ** 10), "bytes_recv": rng.randint(0, 10 ** 10),
+            "packets_sent": rng.randint(0, 10 ** 7), "packets_recv": rng.randint(0, 10 ** 7),
+        },
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+def metric(rng: random.Random) -> dict:
+    submit = metrics_submit(rng)
+    metric_type = rng.choice(["cpu", "memory", "disk", "network"])
+    return {"metric_type": metric_type, "value": submit[metric_type], "timestamp": submit["timestamp"]}
+
+def metrics_columnar(rng: random.Random, count: int) -> dict:
+    """`count` MetricsSubmit samples as one timestamp array and per-field value arrays"""
+    samples = [metrics_submit(rng) for _ in range(count)]
+    now = time.time()
+    return {
+        "timestamps": [now - (count - i) for i in range(count)],
+        "metrics": {
+            metric_type: {
+                field: [sample[metric_type][field] for sample in samples]
+                for field in samples[0][metric_type]
+            }
+            for metric_type in ("cpu", "memory", "disk", "network")
+        },
+    }
+
+def logs_columnar(rng: random.Random, agent: "Agent", count: int) -> dict:
+    entries = [log_submit(rng, agent) for _ in range(count)]
+    now = time.time()
+    return {
+        "timestamps": [now - (count - i) for i in range(count)],
+        **{name: [entry[name] for entry in entries] for name in ("level", "message", "category")},
+    }
+
+def log_submit(rng: random.Random, agent: Agent) -> dict:
+    level = rng.choice(LOG_LEVELS)
+    return {
+        "level": level,
+        "category": rng.choice(LOG_CATEGORIES),
+        "message": f"{agent.hostname}: {level.lower()} event {rng.randint(0, 10 ** 6)}",
+        "details": {"pid": rng.randint(1, 65535), "unit": "nginx.service"},
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+# Each operation returns (method, path, json body, rows written or read by a success)
+Operation = Callable[[random.Random, Agent, argparse.Namespace], Tuple[str, str, Optional[dict], int]]
+
+OPERATIONS: Dict[str, Operation] = {
+    "record_metric": lambda rng, a, o: (
+        "POST", f"/api/v1/metrics/{a.agent_id}", {**metric(rng), "agent_id": a.agent_id}, 1
+    ),
+    "submit_metrics": lambda rng, a, o: (
+        "POST", f"/api/v1/metrics/{a.agent_id}/submit", metrics_submit(rng), 4
+    ),
+    "metrics_batch": lambda rng, a, o: (
+        "POST", f"/api/v1/metrics/{a.agent_id}/batch",
+        {"submissions": [metrics_submit(rng) for _ in range(o.batch_size)]}, 4 * o.batch_size
+    ),
+    "metrics_columnar": lambda rng, a, o: (
+        "POST", f"/api/v1/metrics/{a.agent_id}/columnar",
+        metrics_columnar(rng, o.batch_size), 4 * o.batch_size
+    ),
+    "logs_columnar": lambda rng, a, o: (
+        "POST", f"/api/v1/logs/{a.agent_id}/columnar", logs_columnar(rng, a, o.batch_size), o.batch_size
+    ),
+    "create_log": lambda rng, a, o: ("POST", f"/api/v1/logs/{a.agent_id}", log_submit(rng, a), 1),
+    "submit_log": lambda rng, a, o: (
+        "POST", f"/api/v1/logs/{a.agent_id}/submit", log_submit(rng, a), 1
+    ),
+    "heartbeat": lambda rng, a, o: ("POST", f"/api/v1/agents/{a.agent_id}/heartbeat", None, 1),
+    "get_metrics": lambda rng, a, o: (
+        "GET", f"/api/v1/metrics/{a.agent_id}/metrics?hours=1&limit=500", None, 0
+    ),
+    "get_metrics_bucketed": lambda rng, a, o: (
+        "GET", f"/api/v1/metrics/{a.agent_id}/metrics?hours=24&bucket=5m&metric_type=cpu&field=percent",
+        None, 0
+    ),
+    "get_latest": lambda rng, a, o: (
+        "GET", f"/api/v1/metrics/{a.agent_id}/latest?metric_type=cpu", None, 0
+    ),
+    "get_fleet_latest": lambda rng, a, o: ("GET", "/api/v1/metrics/latest?metric_type=cpu", None, 0),
+    "fleet_aggregate": lambda rng, a, o: (
+        "GET", "/api/v1/metrics/aggregate?metric_type=memory&field=percent"
+        "&group_by=environment&top=20&hours=1", None, 0
+    ),
+    "get_logs": lambda rng, a, o: ("GET", f"/api/v1/logs/{a.agent_id}?limit=100", None, 0),
+    "list_agents": lambda rng, a, o: ("GET", "/api/v1/agents/?limit=100", None, 0),
+}
+
+def _rows_read(response: httpx.Response) -> int:
+    try:
+        body = response.json()
+    except ValueError:
+        return 0
+    if isinstance(body, list):
+        return len(body)
+    return 1 if isinstance(body, dict) else 0
+
+def encode_body(body: Any, encoding: str, compression: str) -> Tuple[bytes, Dict[str, str]]:
+    """Serialize a request body the way an agent configured for `encoding`/`compression` would"""
+    if encoding == "msgpack":
+        content, headers = msgpack.packb(body), {"Content-Type": "application/msgpack"}
+    else:
+        content = json.dumps(body, separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json"}
+    if compression == "gzip":
+        content, headers["Content-Encoding"] = gzip.compress(content, 5), "gzip"
+    elif compression == "zstd":
+        import zstandard
+        content, headers["Content-Encoding"] = zstandard.ZstdCompressor(3).compress(content), "zstd"
+    return content, headers
+
+async def timed(
+    client: httpx.AsyncClient, recorder: Recorder, op: str, method: str, path: str,
+    body: Optional[dict] = None, headers: Optional[Dict[str, str]] = None, rows: int = 0,
+    options: Optional[argparse.Namespace] = None,
+) -> Optional[httpx.Response]:
+    content = None
+    if body is not None:
+        content, content_headers = encode_body(
+            body, options.encoding if options else "json", options.compression if options else "none"
+        )
+        headers = {**(headers or {}), **content_headers}
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, content=content, headers=headers)
+    except httpx.HTTPError:
+        recorder.record(op, time.perf_counter() - start, False, 0)
+        return None
+    ok = response.status_code < 400
+    if ok and method == "GET":
+        rows = _rows_read(response)
+    recorder.record(op, time.perf_counter() - start, ok, rows, len(content or b""))
+    return response
+
+def _host(run_id: str, index: int, token: str) -> dict:
+    return {
+        "hostname": f"bench-{run_id}-{index:05d}",
+        "ip_address": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+        "registration_token": token,
+        "version": "1.0.0",
+        "os_info": {"system": "Linux", "release": "22.04"},
+    }
+
+async def register_agents(
+    client: httpx.AsyncClient, recorder: Recorder, options: argparse.Namespace
+) -> List[Agent]:
+    """Mint one registration token per agent and register it through the token flow"""
+    semaphore = asyncio.Semaphore(options.concurrency)
+    admin = {"X-Admin-Key": options.admin_key}
+    run_id = f"{int(time.time())}-{os.getpid()}"
+
+    async def register(index: int) -> Optional[Agent]:
+        async with semaphore:
+            response = await timed(
+                client, recorder, "create_token", "POST", "/api/v1/register/token",
+                {"environment": options.environment, "description": "benchmark"}, admin, rows=1
+            )
+            if response is None or response.status_code >= 400:
+                return None
+            host = _host(run_id, index, response.json()["token"])
+            response = await timed(
+                client, recorder, "register_agent", "POST", "/api/v1/register/agent", host, rows=1
+            )
+            if response is None or response.status_code >= 400:
+                return None
+            body = response.json()
+            return Agent(body["agent"]["id"], body["api_key"], host["hostname"])
+
+    async def register_chunk(start: int, count: int) -> List[Agent]:
+        async with semaphore:
+            response = await timed(
+                client, recorder, "mint_tokens", "POST", "/api/v1/register/tokens",
+                {"environment": options.environment, "description": "benchmark", "count": count},
+                admin, rows=count
+            )
+            if response is None or response.status_code >= 400:
+                return []
+            hosts = [
+                _host(run_id, start + offset, token)
+                for offset, token in enumerate(response.json()["tokens"])
+            ]
+            response = await timed(
+                client, recorder, "register_agents_bulk", "POST", "/api/v1/register/agents",
+                {"agents": hosts}, rows=count
+            )
+            if response is None or response.status_code >= 400:
+                return []
+            return [
+                Agent(result["agent"]["id"], result["api_key"], result["hostname"])
+                for result in response.json()["results"] if result["agent"]
+            ]
+
+    if options.bulk_register:
+        size = options.register_batch_size
+        chunks = await asyncio.gather(*(
+            register_chunk(start, min(size, options.agents - start))
+            for start in range(0, options.agents, size)
+        ))
+        return [agent for chunk in chunks for agent in chunk]
+
+    agents = await asyncio.gather(*(register(i) for i in range(options.agents)))
+    return [agent for agent in agents if agent]
+
+async def seed(client: httpx.AsyncClient, recorder: Recorder, agents: List[Agent], options: argparse.Namespace):
+    """Give every agent a batch of history so read scenarios have data to return"""
+    semaphore = asyncio.Semaphore(options.concurrency)
+    rng = random.Random(options.seed)
+
+    async def seed_agent(agent: Agent):
+        async with semaphore:
+            method, path, body, rows = OPERATIONS["metrics_batch"](rng, agent, options)
+            await timed(
+                client, recorder, "seed_metrics", method, path, body, agent.headers, rows, options
+            )
+            for _ in range(5):
+                await timed(
+                    client, recorder, "seed_logs", "POST", f"/api/v1/logs/{agent.agent_id}",
+                    log_submit(rng, agent), agent.headers, 1
+                )
+
+    await asyncio.gather(*(seed_agent(agent) for agent in agents))
+
+async def replay(
+    client: httpx.AsyncClient, recorder: Recorder, agents: List[Agent], options: argparse.Namespace
+):
+    """Run weighted traffic from `concurrency` workers for `duration` seconds"""
+    weights = SCENARIOS[options.scenario]
+    if not options.base_url and options.database_url.startswith("sqlite"):
+        weights = {op: w for op, w in weights.items() if op not in POSTGRES_ONLY}
+    ops, op_weights = list(weights), list(weights.values())
+    deadline = time.perf_counter() + options.duration
+
+    async def worker(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            agent = rng.choice(agents)
+            op = rng.choices(ops, op_weights)[0]
+            method, path, body, rows = OPERATIONS[op](rng, agent, options)
+            await timed(client, recorder, op, method, path, body, agent.headers, rows, options)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(options.seed + i) for i in range(options.concurrency)))
+    recorder.elapsed = time.perf_counter() - start
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of p99 latency or rows/sec beyond `tolerance` (a fraction) of the baseline"""
+    regressions = []
+    for op, base in baseline.items():
+        current = results.get(op)
+        if not current:
+            continue
+        if base["p99_ms"] and current["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{op}: p99 {current['p99_ms']}ms > baseline {base['p99_ms']}ms")
+        if base["rows_per_sec"] and current["rows_per_sec"] < base["rows_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{op}: {current['rows_per_sec']} rows/s < baseline {base['rows_per_sec']} rows/s"
+            )
+    return regressions
+
+def print_report(setup: dict, results: dict, agents: int, options: argparse.Namespace):
+    print(f"scenario={options.scenario} agents={agents} concurrency={options.concurrency} "
+          f"duration={options.duration}s encoding={options.encoding} compression={options.compression}")
+    header = (
+        f"{'operation':<22}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'req/s':>10}{'rows/s':>11}{'req bytes':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for op, r in {**setup, **results}.items():
+        print(f"{op:<22}{r['count']:>8}{r['errors']:>8}{r['p50_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['requests_per_sec']:>10}{r['rows_per_sec']:>11}{r.get('request_bytes', 0):>11}")
+
+def _in_process_client(options: argparse.Namespace):
+    """ASGI client bound to the app itself, using `--database-url` as the database"""
+    os.environ["DATABASE_URL_OVERRIDE"] = options.database_url
+    # The throwaway database gets its schema at startup
+    os.environ.setdefault("DB_AUTO_MIGRATE", "true")
+    os.environ.setdefault("ADMIN_KEY", options.admin_key or "bench-admin-key")
+    options.admin_key = os.environ["ADMIN_KEY"]
+    from app.main import app
+
+    return app, httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=options.timeout
+    )
+
+async def run(options: argparse.Namespace) -> int:
+    lifespan = None
+    if options.base_url:
+        client = httpx.AsyncClient(
+            base_url=options.base_url, timeout=options.timeout,
+            limits=httpx.Limits(max_connections=options.concurrency * 2),
+        )
+    else:
+        app, client = _in_process_client(options)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+
+    try:
+        # Each phase has its own recorder so its rows/sec are over that phase only
+        register_recorder = Recorder()
+        start = time.perf_counter()
+        agents = await register_agents(client, register_recorder, options)
+        register_recorder.elapsed = time.perf_counter() - start
+        if not agents:
+            print("no agents could be registered; check --admin-key and the server", file=sys.stderr)
+            return 2
+
+        seed_recorder = Recorder()
+        start = time.perf_counter()
+        await seed(client, seed_recorder, agents, options)
+        seed_recorder.elapsed = time.perf_counter() - start
+
+        recorder = Recorder()
+        await replay(client, recorder, agents, options)
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    setup, results = {**register_recorder.report(), **seed_recorder.report()}, recorder.report()
+    print_report(setup, results, len(agents), options)
+    combined = {**setup, **results}
+
+    registrations_per_sec = len(agents) / (register_recorder.elapsed or 1.0)
+    print(f"registered {len(agents)} agents at {registrations_per_sec:.1f} agents/s")
+    if options.register_target and registrations_per_sec < options.register_target:
+        print(f"REGRESSION: registration below target of {options.register_target} agents/s")
+        return 1
+
+    if options.save_baseline:
+        with open(options.save_baseline, "w") as f:
+            json.dump(combined, f, indent=2, sort_keys=True)
+        print(f"baseline written to {options.save_baseline}")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(combined, json.load(f), options.tolerance)
+        if regressions:
+            print("REGRESSIONS:", *regressions, sep="\n  ")
+            return 1
+        print(f"no regressions against {options.baseline} (tolerance {options.tolerance:.0%})")
+    return 0
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="server to benchmark; omit to run the app in-process")
+    parser.add_argument("--database-url", default="sqlite:///./bench.db",
+                        help="database for the in-process app (default: %(default)s)")
+    parser.add_argument("--admin-key", default=os.environ.get("ADMIN_KEY"))
+    parser.add_argument("--environment", default="benchmark")
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of replayed traffic")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--batch-size", type=int, default=50, help="submissions per batch request")
+    parser.add_argument("--encoding", choices=["json", "msgpack"], default="json",
+                        help="body encoding for replayed ingest traffic")
+    parser.add_argument("--compression", choices=["none", "gzip", "zstd"], default="none",
+                        help="Content-Encoding for replayed ingest traffic")
+    parser.add_argument("--bulk-register", action="store_true",
+                        help="mint tokens and register agents through the bulk endpoints")
+    parser.add_argument("--register-batch-size", type=int, default=500)
+    parser.add_argument("--register-target", type=float,
+                        help="minimum agents registered per second; exit 1 below it")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--baseline", help="baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--save-baseline", help="write this run's results as a baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed regression as a fraction of the baseline (default: %(default)s)")
+    options = parser.parse_args(argv)
+    if options.base_url and not options.admin_key:
+        parser.error("--admin-key (or ADMIN_KEY) is required with --base-url")
+    return options
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(run(parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
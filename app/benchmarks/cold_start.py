@@ -0,0 +1,132 @@
+# app/benchmarks/cold_start.py
+"""Measure how long a fresh worker process takes to import the app, start and serve.
+
+Each run is a new interpreter, as a worker started by the process manager is:
+    python -m app.benchmarks.cold_start --database-url sqlite:///./cold_start.db
+
+The database is migrated once up front; the runs measure only the worker.
+Use --save-baseline to record a run and --baseline to fail on regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Runs in the child interpreter; prints one JSON line of millisecond timings
+CHILD = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+from app.core import database
+engine_at_import = bool(database._engines) or "app.lifespan" in sys.modules
+
+import httpx
+
+async def serve():
+    application = app.main.app
+    async with application.router.lifespan_context(application):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://cold") as client:
+            health = await client.get("/health")
+            served = time.perf_counter()
+            # Goes through the database, on a connection the pool warm-up opened
+            db_response = await client.get("/metrics")
+            db_served = time.perf_counter()
+    assert health.status_code == 200 and db_response.status_code == 200
+    return ready, served, db_served
+
+ready, served, db_served = asyncio.run(serve())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_request_ms": (served - ready) * 1000,
+    "first_db_request_ms": (db_served - served) * 1000,
+    "engine_at_import": engine_at_import,
+}))
+"""
+
+PHASES = ["process_ms", "import_ms", "startup_ms", "first_request_ms", "first_db_request_ms"]
+
+def _env(options: argparse.Namespace) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["DATABASE_URL_OVERRIDE"] = options.database_url
+    env.setdefault("ADMIN_KEY", "bench-admin-key")
+    env.pop("DB_AUTO_MIGRATE", None)
+    return env
+
+def run_once(options: argparse.Namespace) -> Dict[str, float]:
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD], env=_env(options), capture_output=True, text=True,
+        timeout=options.timeout
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"cold start run failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = elapsed
+    return result
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Phases whose median grew beyond `tolerance` (a fraction) of the baseline"""
+    return [
+        f"{phase}: {results[phase]:.1f}ms > baseline {baseline[phase]:.1f}ms"
+        for phase in PHASES
+        if baseline.get(phase) and results[phase] > baseline[phase] * (1 + tolerance)
+    ]
+
+def run(options: argparse.Namespace) -> int:
+    migrate = subprocess.run(
+        [sys.executable, "-m", "app.migrate"], env=_env(options), capture_output=True, text=True
+    )
+    if migrate.returncode != 0:
+        print(migrate.stderr, file=sys.stderr)
+        return 2
+
+    runs = [run_once(options) for _ in range(options.runs)]
+    results = {phase: statistics.median(r[phase] for r in runs) for phase in PHASES}
+
+    print(f"runs={options.runs} database={options.database_url} (median ms)")
+    for phase in PHASES:
+        print(f"{phase:<22}{results[phase]:>10.1f}")
+    if any(r["engine_at_import"] for r in runs):
+        print("REGRESSION: importing app.main created a database engine or loaded the services")
+        return 1
+
+    if options.save_baseline:
+        with open(options.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline written to {options.save_baseline}")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        if regressions:
+            print("REGRESSIONS:", *regressions, sep="\n  ")
+            return 1
+        print(f"no regressions against {options.baseline} (tolerance {options.tolerance:.0%})")
+    return 0
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./cold_start.db",
+                        help="database the workers start against (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds allowed per run")
+    parser.add_argument("--baseline", help="baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--save-baseline", help="write this run's results as a baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed regression as a fraction of the baseline (default: %(default)s)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return run(parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# app/benchmarks/serialization_bench.py
+"""Compare the list endpoints' column-tuple/orjson path with ORM rows validated by response_model.
+
+Seeds a throwaway SQLite stand-in (ADMIN_KEY etc. must be set) and, for
+list_agents, get_agent_metrics and get_logs, times both paths on the same
+query and checks that they produce identical bytes:
+    python -m app.benchmarks.serialization_bench --rows 10000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+def _seed(models, engine, rows: int, rng: random.Random) -> uuid.UUID:
+    from sqlalchemy import insert
+
+    now = datetime.utcnow()
+    agents = [
+        {
+            "id": uuid.uuid4(),
+            "hostname": f"bench-{i:06d}",
+            "ip_address": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            "environment": rng.choice(["production", "staging"]),
+            "description": None,
+            "version": "1.0.0",
+            "os_info": {"distro": "ubuntu", "release": "22.04", "kernel": "5.15.0-91"},
+            "status": "online",
+            "last_seen": now,
+            "created_at": now - timedelta(seconds=i),
+        }
+        for i in range(rows)
+    ]
+    agent_id = agents[0]["id"]
+    metrics = [
+        {
+            "id": uuid.uuid4(),
+            "agent_id": agent_id,
+            "metric_type": "system",
+            "value": {
+                "cpu": round(rng.uniform(0, 100), 2),
+                "memory": rng.random(),
+                "load": [rng.random() * 4 for _ in range(3)],
+                "disk_free": rng.randrange(1 << 40),
+            },
+            "timestamp": now - timedelta(seconds=i),
+        }
+        for i in range(rows)
+    ]
+    logs = [
+        {
+            "id": uuid.uuid4(),
+            "agent_id": agent_id,
+            "level": rng.choice(["INFO", "WARNING", "ERROR"]),
+            "category": "system",
+            "message": f"service restarted after {rng.randrange(100)} failures — état dégradé",
+            "details": {"service": "nginx", "pid": rng.randrange(1 << 16)},
+            "timestamp": now - timedelta(seconds=i),
+        }
+        for i in range(rows)
+    ]
+    with engine.begin() as connection:
+        for table, batch in (
+            (models.Agent, agents), (models.AgentMetric, metrics), (models.AgentLog, logs)
+        ):
+            connection.execute(insert(table), batch)
+    return agent_id
+
+async def _time(run, repeat: int):
+    timings, body = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = await run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), body
+
+async def run(options: argparse.Namespace) -> int:
+    os.environ["DATABASE_URL_OVERRIDE"] = options.database_url
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from sqlalchemy import select
+
+    from app.core import pagination
+    from app.core.database import AsyncSessionLocal, Base, engine
+    from app.models import models
+    from app.schemas import schemas
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    agent_id = _seed(models, engine, options.rows, random.Random(options.seed))
+
+    cases = {
+        "list_agents": (
+            select(models.Agent).order_by(models.Agent.created_at.desc(), models.Agent.id.desc()),
+            schemas.Agent, models.Agent,
+        ),
+        "get_agent_metrics": (
+            select(models.AgentMetric).filter(models.AgentMetric.agent_id == agent_id)
+            .order_by(models.AgentMetric.timestamp.desc(), models.AgentMetric.id.desc()),
+            schemas.Metric, models.AgentMetric,
+        ),
+        "get_logs": (
+            select(models.AgentLog).filter(models.AgentLog.agent_id == agent_id)
+            .order_by(models.AgentLog.timestamp.desc(), models.AgentLog.id.desc()),
+            schemas.Log, models.AgentLog,
+        ),
+    }
+
+    print(f"rows={options.rows} repeat={options.repeat} (median ms, query included)")
+    header = f"{'endpoint':<20}{'orm+pydantic':>14}{'tuples+orjson':>15}{'speedup':>9}{'bytes':>11}{'identical':>11}"
+    print(header)
+    print("-" * len(header))
+    mismatched = 0
+    for name, (query, schema, model) in cases.items():
+        field = create_response_field(name=f"Response_{name}", type_=List[schema])
+        columns = pagination.schema_columns(schema, model)
+
+        async def before():
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(query.limit(options.rows))).scalars().all()
+                content = await serialize_response(field=field, response_content=rows)
+            return JSONResponse(content).body
+
+        async def after():
+            async with AsyncSessionLocal() as db:
+                response = await pagination.fetch_json_page(db, query, columns, options.rows)
+            return response.body
+
+        before_ms, before_body = await _time(before, options.repeat)
+        after_ms, after_body = await _time(after, options.repeat)
+        identical = before_body == after_body
+        mismatched += not identical
+        print(f"{name:<20}{before_ms:>14.1f}{after_ms:>15.1f}{before_ms / after_ms:>8.1f}x"
+              f"{len(after_body):>11}{str(identical):>11}")
+    return 1 if mismatched else 0
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./serialization_bench.db",
+                        help="throwaway database; its tables are dropped (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=10000, help="rows per list response")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(run(parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 # app/config/settings.py
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 from functools import lru_cache
 
 class Settings(BaseSettings):
@@ -12,6 +12,9 @@ class Settings(BaseSettings):
     # Security
     ADMIN_KEY: str
     SECRET_KEY: str
+    API_KEY_CACHE_SIZE: int = 100000
+    API_KEY_CACHE_TTL: float = 30.0
+    API_KEY_NEGATIVE_CACHE_TTL: float = 5.0
 
     # Database Settings
     POSTGRES_USER: str
@@ -19,11 +22,144 @@ class Settings(BaseSettings):
     POSTGRES_SERVER: str
     POSTGRES_PORT: str
     POSTGRES_DB: str
+    # Full SQLAlchemy URL that replaces the Postgres settings, e.g. sqlite:///bench.db
+    DATABASE_URL_OVERRIDE: Optional[str] = None
+
+    # Connection Pool Settings (applied to the async and the background engine)
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    # Connections each worker opens before serving, so the first requests do not pay for them
+    DB_POOL_WARM_CONNECTIONS: int = 5
+    # Run `python -m app.migrate` at startup; meant for development and the SQLite stand-in
+    DB_AUTO_MIGRATE: bool = False
+
+    # Bulk Registration Settings
+    REGISTRATION_BATCH_MAX_ITEMS: int = 5000
+
+    # Ingestion Settings
+    METRICS_BATCH_MAX_ITEMS: int = 10000
+    # Cap on a request body after Content-Encoding is undone
+    INGEST_MAX_BODY_BYTES: int = 64 * 1024 * 1024
+    INGEST_QUEUE_MAX_SIZE: int = 100000
+    INGEST_BATCH_SIZE: int = 5000
+    INGEST_FLUSH_INTERVAL: float = 1.0
+    INGEST_RETRY_AFTER: int = 1
+    LATEST_METRICS_WARM_HOURS: int = 24
+
+    # Idempotency Settings (a retried submission with the same key or seq is stored once)
+    # Retries within the window are answered from memory; later ones are caught by the primary
+    # key, provided the agent sent the sample's timestamp
+    IDEMPOTENCY_WINDOW_SECONDS: float = 900.0
+    IDEMPOTENCY_WINDOW_SIZE: int = 200000
+
+    # Log Ingest Guard Settings (repeats within the window collapse into one row)
+    LOG_DEDUP_WINDOW_SECONDS: float = 10.0
+    LOG_DEDUP_MAX_SPAN_SECONDS: float = 300.0
+    LOG_DEDUP_MAX_KEYS: int = 100000
+    LOG_DEDUP_FLUSH_INTERVAL: float = 5.0
+    # Per-agent token bucket for new log rows; 0 disables the limit
+    LOG_RATE_LIMIT_PER_SECOND: float = 100.0
+    LOG_RATE_LIMIT_BURST: int = 1000
+
+    # Live Stream Settings
+    LIVE_QUEUE_SIZE: int = 256
+    LIVE_KEEPALIVE_SECONDS: float = 15.0
+    # Fan live events out to subscribers on other workers through NOTIFY; off by default,
+    # as every NOTIFY-bearing commit takes Postgres' global notify queue lock
+    LIVE_NOTIFY_ENABLED: bool = False
+    # How often a worker with subscribers tells its peers; they forget it after three missed
+    LIVE_PRESENCE_INTERVAL: float = 10.0
+
+    # Config Distribution Settings
+    CONFIG_CACHE_SIZE: int = 100000
+    # Backstop for workers that miss a change NOTIFY; local changes invalidate at once
+    CONFIG_CACHE_TTL: float = 300.0
+    CONFIG_LONG_POLL_MAX_SECONDS: float = 60.0
+
+    # Pagination Settings
+    PAGE_SIZE_DEFAULT: int = 1000
+    PAGE_SIZE_MAX: int = 10000
+
+    # Retention Settings (set per deployment environment)
+    METRICS_RETENTION_DAYS: int = 30
+    LOGS_RETENTION_DAYS: int = 30
+    PARTITION_PREMAKE_DAYS: int = 7
+    PARTITION_MAINTENANCE_INTERVAL: float = 3600.0
+
+    # Archive Settings (rows past the hot window move to Arrow IPC files; off without ARCHIVE_DIR)
+    # Must be shared, e.g. an NFS mount, when several nodes serve reads
+    ARCHIVE_DIR: Optional[str] = None
+    # Keep these below the retention days, or partitions are dropped before they are archived
+    METRICS_ARCHIVE_AFTER_DAYS: int = 7
+    LOGS_ARCHIVE_AFTER_DAYS: int = 7
+    ARCHIVE_RETENTION_DAYS: int = 365
+    ARCHIVE_INTERVAL: float = 3600.0
+    ARCHIVE_FILE_MAX_ROWS: int = 1000000
+    ARCHIVE_BATCH_ROWS: int = 65536
+    ARCHIVE_RUN_MAX_ROWS: int = 20000000
+    # IPC buffer compression: "zstd", "lz4" or "none"; only uncompressed files are read without copying
+    ARCHIVE_COMPRESSION: str = "zstd"
+
+    # Log Search Settings
+    LOG_SEARCH_TIME_BUDGET_MS: int = 2000
+    LOG_SEARCH_MAX_RESULTS: int = 500
+    LOG_SEARCH_MAX_HOURS: int = 168
+
+    # Rollup Settings
+    ROLLUP_INTERVAL: float = 60.0
+    ROLLUP_LAG_SECONDS: int = 60
+    ROLLUP_BACKFILL_HOURS: int = 24
+
+    # Fleet Aggregate Settings
+    AGGREGATE_CACHE_TTL: float = 10.0
+    AGGREGATE_CACHE_SIZE: int = 1024
+    AGGREGATE_MAX_HOURS: int = 168
+    AGGREGATE_MAX_TOP: int = 100
+
+    # Alerting Settings (rules are evaluated in memory as metrics commit)
+    ALERT_FLUSH_INTERVAL: float = 2.0
+    ALERT_MAX_SERIES: int = 1000000
+    # Backstop for workers that miss a rule-change NOTIFY
+    ALERT_RULE_REFRESH_INTERVAL: float = 60.0
+
+    # Fleet Directory Settings
+    # os_info keys counted as facets, alongside environment, status and version
+    FLEET_FACET_OS_INFO_KEYS: List[str] = ["distro", "kernel"]
+    # How soon agents registered through other workers appear in facet counts
+    FLEET_REFRESH_INTERVAL: float = 30.0
+
+    # Heartbeat Settings
+    HEARTBEAT_FLUSH_INTERVAL: float = 5.0
+    HEARTBEAT_SWEEP_INTERVAL: float = 15.0
+    HEARTBEAT_STALE_SECONDS: int = 90
+    HEARTBEAT_OFFLINE_SECONDS: int = 300
+
+    # Cluster Settings
+    # Base URLs of every server taking agent traffic, e.g. ["http://10.0.0.5:8001", ...], each a
+    # single-worker gunicorn instance; an agent's ingest goes to the one its id hashes to
+    WORKER_NODES: List[str] = []
+    # This worker's entry in WORKER_NODES; affinity is off unless it is listed there
+    WORKER_NODE: Optional[str] = None
+    WORKER_RING_VNODES: int = 160
 
     @property
     def DATABASE_URL(self) -> str:
+        if self.DATABASE_URL_OVERRIDE:
+            return self.DATABASE_URL_OVERRIDE
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        if self.DATABASE_URL_OVERRIDE:
+            return self.DATABASE_URL_OVERRIDE.replace("sqlite://", "sqlite+aiosqlite://", 1).replace(
+                "postgresql://", "postgresql+asyncpg://", 1
+            )
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,168 @@
+# app/core/cluster.py
+import bisect
+import hashlib
+import logging
+import re
+import threading
+import uuid
+from typing import List, Optional, Set, Tuple
+
+from .notify import notify_enabled
+from ..config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big", signed=True)
+
+class Leadership:
+    """Which singleton background jobs this worker leads, as Postgres advisory locks.
+
+    Every worker runs the same periodic tasks; a job marked leader-only only
+    proceeds in the worker holding its session-level lock. The locks live on
+    one dedicated connection, so a worker that exits or loses that connection
+    gives them up and another worker takes over on its next tick.
+    """
+
+    def __init__(self):
+        self._connection = None
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import psycopg2
+
+        connection = psycopg2.connect(settings.DATABASE_URL)
+        connection.autocommit = True
+        return connection
+
+    def holds(self, job: str) -> bool:
+        """Whether this worker leads `job`, taking the lead if nobody holds it; blocking"""
+        if not notify_enabled():
+            # Advisory locks need Postgres; the SQLite stand-in runs a single worker
+            return True
+        with self._lock:
+            try:
+                if self._connection is None:
+                    self._connection = self._connect()
+                    self._held.clear()
+                with self._connection.cursor() as cursor:
+                    if job in self._held:
+                        # The lock lasts exactly as long as this connection does
+                        cursor.execute("SELECT 1")
+                        return True
+                    cursor.execute("SELECT pg_try_advisory_lock(%s)", (_hash64(f"job:{job}"),))
+                    if cursor.fetchone()[0]:
+                        self._held.add(job)
+                        logger.info("Leading background job %s", job)
+                        return True
+                    return False
+            except Exception:
+                logger.exception("Leadership connection failed; giving up led jobs")
+                self._close()
+                return False
+
+    def led_jobs(self) -> List[str]:
+        return sorted(self._held)
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
+        self._held.clear()
+
+    def release(self):
+        """Give up every lead, so another worker takes over without waiting for a timeout"""
+        with self._lock:
+            self._close()
+
+leadership = Leadership()
+
+class HashRing:
+    """Consistent hashing of keys onto nodes; adding or removing a node moves ~1/n of the keys"""
+
+    def __init__(self, nodes: List[str], vnodes: int = 160):
+        self.nodes = list(dict.fromkeys(nodes))
+        points: List[Tuple[int, str]] = sorted(
+            (_hash64(f"{node}#{replica}"), node) for node in self.nodes for replica in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash64(key)) % len(self._hashes)
+        return self._owners[index]
+
+# Routes whose in-memory state (dedup windows, rate limits, alert series, heartbeats,
+# config long-polls) is per agent; the agent id is the first path segment after the prefix
+AGENT_ID = r"(?P<agent_id>[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12})"
+AGENT_ROUTES = [
+    ("POST", re.compile(rf"^/api/v1/metrics/{AGENT_ID}(?:/[a-z]+)?$")),
+    ("POST", re.compile(rf"^/api/v1/logs/{AGENT_ID}(?:/[a-z]+)?$")),
+    ("POST", re.compile(rf"^/api/v1/agents/{AGENT_ID}/heartbeat$")),
+    ("GET", re.compile(rf"^/api/v1/configs/{AGENT_ID}$")),
+]
+
+def routed_agent_id(method: str, path: str) -> Optional[str]:
+    """Canonical agent id of an agent-scoped request, or None for any other request"""
+    for route_method, pattern in AGENT_ROUTES:
+        if method == route_method:
+            match = pattern.match(path)
+            if match:
+                return str(uuid.UUID(match.group("agent_id")))
+    return None
+
+class AgentAffinityMiddleware:
+    """Send each agent's ingest to the node owning it on the hash ring.
+
+    Requests for agents this node owns pass through; others get a 307 to
+    the owner, which keeps method and body. Every agent-scoped response
+    names the owner in X-Agent-Owner so agents can talk to it directly.
+    """
+
+    def __init__(self, app, ring: HashRing, node: str):
+        self.app = app
+        self.ring = ring
+        self.node = node
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        agent_id = routed_agent_id(scope["method"], scope["path"])
+        owner = self.ring.node_for(agent_id) if agent_id else None
+        if owner is None:
+            await self.app(scope, receive, send)
+            return
+
+        owner_header = (b"x-agent-owner", owner.encode())
+        if owner != self.node:
+            location = owner.rstrip("/") + scope.get("root_path", "") + scope["path"]
+            if scope.get("query_string"):
+                location += "?" + scope["query_string"].decode("latin-1")
+            await send({
+                "type": "http.response.start",
+                "status": 307,
+                "headers": [(b"location", location.encode()), owner_header, (b"content-length", b"0")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_owner(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), owner_header]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_owner)
+
+def cluster_ring() -> Optional[HashRing]:
+    """The ring of WORKER_NODES when this worker is one of them, else None (affinity off)"""
+    if not settings.WORKER_NODES or settings.WORKER_NODE not in settings.WORKER_NODES:
+        return None
+    return HashRing(settings.WORKER_NODES, settings.WORKER_RING_VNODES)
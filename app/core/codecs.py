@@ -0,0 +1,180 @@
+# app/core/codecs.py
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, List, Optional
+
+import msgpack
+import orjson
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+
+from ..config.settings import get_settings
+
+settings = get_settings()
+
+MSGPACK_MEDIA_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+def _too_large():
+    return HTTPException(
+        status_code=413,
+        detail=f"Decoded body exceeds {settings.INGEST_MAX_BODY_BYTES} bytes"
+    )
+
+def _inflate(body: bytes, wbits: int, limit: int) -> bytes:
+    decompressor = zlib.decompressobj(wbits)
+    try:
+        data = decompressor.decompress(body, limit + 1)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Malformed compressed body")
+    if len(data) > limit:
+        raise _too_large()
+    return data
+
+def _zstd(body: bytes, limit: int) -> bytes:
+    try:
+        import zstandard
+    except ImportError:
+        raise HTTPException(status_code=415, detail="zstd request bodies are not supported")
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            data = reader.read(limit + 1)
+    except zstandard.ZstdError:
+        raise HTTPException(status_code=400, detail="Malformed compressed body")
+    if len(data) > limit:
+        raise _too_large()
+    return data
+
+def decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """Undo a gzip, deflate or zstd Content-Encoding, bounded by INGEST_MAX_BODY_BYTES"""
+    encoding = (content_encoding or "identity").strip().lower()
+    limit = settings.INGEST_MAX_BODY_BYTES
+    if encoding == "identity":
+        return body
+    if encoding in ("gzip", "x-gzip"):
+        return _inflate(body, 16 + zlib.MAX_WBITS, limit)
+    if encoding == "deflate":
+        return _inflate(body, zlib.MAX_WBITS, limit)
+    if encoding == "zstd":
+        return _zstd(body, limit)
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+
+def unpack(body: bytes) -> Any:
+    """Decode a msgpack body; msgpack timestamps become datetimes"""
+    try:
+        return msgpack.unpackb(body, raw=False, timestamp=3, strict_map_key=False)
+    except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError):
+        raise HTTPException(status_code=400, detail="Malformed msgpack body")
+
+class InvalidTimestamp(ValueError):
+    """A timestamp value that is malformed or outside the representable range"""
+
+def parse_timestamp(value: Any) -> datetime:
+    """Naive UTC datetime from epoch seconds, an ISO 8601 string or a datetime"""
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.utcfromtimestamp(value)
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            return value
+    # Epoch values past the platform's range raise OverflowError or OSError, not ValueError
+    except (ValueError, OverflowError, OSError):
+        pass
+    raise InvalidTimestamp(f"Invalid timestamp: {value!r}")
+
+def parse_timestamps(values: List[Any], path: str = "timestamps") -> List[datetime]:
+    """parse_timestamp over a column; the error names the index of the bad value"""
+    timestamps = []
+    for index, value in enumerate(values):
+        try:
+            timestamps.append(parse_timestamp(value))
+        except InvalidTimestamp as e:
+            raise InvalidTimestamp(f"{path}[{index}]: {e}") from None
+    return timestamps
+
+class DecodedRequest(Request):
+    """Request whose body is decompressed and whose msgpack payload reads as JSON"""
+
+    def __init__(self, scope, receive):
+        self.is_msgpack = False
+        headers = scope.get("headers", [])
+        for name, value in headers:
+            if name == b"content-type" and _media_type(value.decode("latin-1")) in MSGPACK_MEDIA_TYPES:
+                # FastAPI only hands JSON content types to json(); msgpack is parsed there instead
+                self.is_msgpack = True
+                scope = {
+                    **scope,
+                    "headers": [
+                        (n, b"application/json" if n == b"content-type" else v) for n, v in headers
+                    ],
+                }
+                break
+        super().__init__(scope, receive)
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_decoded_body"):
+            self._decoded_body = decompress(
+                await super().body(), self.headers.get("content-encoding")
+            )
+        return self._decoded_body
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            self._json = unpack(body) if self.is_msgpack else json.loads(body)
+        return self._json
+
+class DecodingRoute(APIRoute):
+    """Route class accepting msgpack and gzip/deflate/zstd request bodies on any JSON endpoint"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def decoding_handler(request: Request):
+            return await handler(DecodedRequest(request.scope, request.receive))
+
+        return decoding_handler
+
+def _orjson_exact(value: Any) -> bool:
+    # orjson and json.dumps only disagree on floats: "1e-6" vs "1e-06", NaN and infinities.
+    # Values decoded from JSON columns are exactly these types, so no isinstance() is needed
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        kind = type(value)
+        if kind is float:
+            if not (value == 0.0 or 1e-4 <= abs(value) < 1e16):
+                return False
+        elif kind is dict:
+            pending.extend(value.values())
+        elif kind is list or kind is tuple:
+            pending.extend(value)
+    return True
+
+def dumps(content: Any) -> bytes:
+    """The bytes FastAPI's JSONResponse would render for `content`, through orjson when that is exact"""
+    if _orjson_exact(content):
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            pass
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+def dumps_line(content: Any) -> bytes:
+    """One NDJSON line, as pydantic's model_dump_json would write it"""
+    try:
+        return orjson.dumps(content, option=orjson.OPT_APPEND_NEWLINE)
+    except TypeError:
+        # Integers beyond 64 bits, which pydantic writes exactly as json.dumps does
+        return json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8") + b"\n"
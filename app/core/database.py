@@ -1,19 +1,118 @@
 # app/core/database.py
-from sqlalchemy import create_engine
+import threading
+from typing import Any, Callable, Dict
+
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from ..config.settings import get_settings
+from .instrumentation import TimedAsyncQueuePool, TimedQueuePool, instrument_engine
 
 settings = get_settings()
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _is_postgres() -> bool:
+    return settings.DATABASE_URL.startswith("postgresql")
+
+def _pool_options(poolclass) -> dict:
+    if not _is_postgres():
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+def _statement_timeout() -> str:
+    return str(settings.DB_STATEMENT_TIMEOUT_MS)
+
+_engines: Dict[str, Any] = {}
+_engines_lock = threading.Lock()
+
+def _create_engine():
+    sync_engine = create_engine(
+        settings.DATABASE_URL,
+        connect_args=(
+            {"options": f"-c statement_timeout={_statement_timeout()}"}
+            if _is_postgres() else {"check_same_thread": False}
+        ),
+        **_pool_options(TimedQueuePool)
+    )
+    instrument_engine(sync_engine, "sync")
+    return sync_engine
+
+def _create_async_engine():
+    engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        connect_args=(
+            {"server_settings": {"statement_timeout": _statement_timeout()}}
+            if _is_postgres() else {}
+        ),
+        **_pool_options(TimedAsyncQueuePool)
+    )
+    instrument_engine(engine.sync_engine, "async")
+    return engine
+
+def _engine(name: str, factory: Callable[[], Any]):
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _engines[name] = factory()
+    return engine
+
+def get_engine() -> Engine:
+    """Sync engine for background workers that run in threads (ingest flush, rollups, maintenance)"""
+    return _engine("sync", _create_engine)
+
+def get_async_engine() -> AsyncEngine:
+    """Async engine used by every request handler"""
+    return _engine("async", _create_async_engine)
+
+async def dispose_engines():
+    """Close the pooled connections of whichever engines were created"""
+    if "async" in _engines:
+        await _engines["async"].dispose()
+    if "sync" in _engines:
+        _engines["sync"].dispose()
+
+class _BindOnFirstUse:
+    """Session factory that creates its engine when the first session is made, not at import"""
+
+    def __init__(self, engine_factory: Callable[[], Any], **kw):
+        super().__init__(**kw)
+        self.engine_factory = engine_factory
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self.engine_factory())
+        return super().__call__(**local_kw)
+
+class _LazySessionmaker(_BindOnFirstUse, sessionmaker):
+    pass
+
+class _LazyAsyncSessionmaker(_BindOnFirstUse, async_sessionmaker):
+    pass
+
+SessionLocal = _LazySessionmaker(get_engine, autocommit=False, autoflush=False)
+AsyncSessionLocal = _LazyAsyncSessionmaker(
+    get_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+def __getattr__(name: str):
+    # `engine` and `async_engine` stay importable, but only build the engine when asked for
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
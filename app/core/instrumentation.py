@@ -0,0 +1,211 @@
+# app/core/instrumentation.py
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# With PROMETHEUS_MULTIPROC_DIR set, every worker writes its samples to its own mmap'd files
+# (no cross-process locking) and a scrape sums them, so any uvicorn/gunicorn worker can answer
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ["engine"],
+    buckets=LATENCY_BUCKETS,
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out",
+    "Connections currently checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+POOL_OPEN = Gauge(
+    "db_pool_connections_open",
+    "Open DBAPI connections held by the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Statement execution time by engine and statement type",
+    ["engine", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds",
+    "Seconds each startup phase of a worker took; phase=total is the whole lifespan startup",
+    ["phase"],
+    multiprocess_mode="max",
+)
+ROWS_INGESTED = Counter(
+    "agent_rows_ingested_total",
+    "Metric and log rows committed, by agent environment",
+    ["kind", "environment"],
+)
+LOGS_COLLAPSED = Counter(
+    "agent_logs_collapsed_total",
+    "Log messages folded into an earlier identical row, by agent environment",
+    ["environment"],
+)
+LOGS_RATE_LIMITED = Counter(
+    "agent_logs_rate_limited_total",
+    "Log messages dropped by the per-agent rate limit, by agent environment",
+    ["environment"],
+)
+ALERT_TRANSITIONS = Counter(
+    "agent_alert_transitions_total",
+    "Alerts fired and resolved by the ingest-time rule engine",
+    ["transition"],
+)
+ROWS_ARCHIVED = Counter(
+    "agent_rows_archived_total",
+    "Metric and log rows moved from the database to the archive",
+    ["table"],
+)
+
+OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording request latency under the matched route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the shared scope; templates keep cardinality bounded
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
+
+class _TimedCheckout:
+    engine_label = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.engine_label).observe(time.perf_counter() - started)
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    """QueuePool that records how long each checkout waited"""
+    engine_label = "sync"
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited"""
+    engine_label = "async"
+
+def instrument_engine(engine: Engine, label: str):
+    """Attach pool usage and per-statement timing listeners to an engine"""
+    checked_out = POOL_CHECKED_OUT.labels(label)
+    open_connections = POOL_OPEN.labels(label)
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        open_connections.inc()
+
+    @event.listens_for(engine, "close")
+    def _close(dbapi_connection, connection_record):
+        open_connections.dec()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        operation = statement.lstrip()[:6].upper()
+        QUERY_LATENCY.labels(
+            label, operation if operation in OPERATIONS else "OTHER"
+        ).observe(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(context):
+        started = context.connection.info.get("query_started") if context.connection else None
+        if started:
+            started.pop()
+
+def count_ingested(kind: str, rows: Iterable[Mapping[str, Any]], environment_of: Callable[[Any], Optional[str]]):
+    """Add committed rows to the per-environment ingest counter"""
+    counts: Dict[str, int] = {}
+    for row in rows:
+        environment = environment_of(row["agent_id"]) or "unknown"
+        counts[environment] = counts.get(environment, 0) + 1
+    for environment, count in counts.items():
+        ROWS_INGESTED.labels(kind, environment).inc(count)
+
+class _Static:
+    """Collector for metric families computed at scrape time"""
+
+    def __init__(self, *families):
+        self.families = families
+
+    def collect(self):
+        return self.families
+
+def render(agents_by_status: Mapping[str, int]) -> bytes:
+    """Exposition text for this process (or all workers) plus the scrape-time agent gauge"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    agents = GaugeMetricFamily("agents", "Registered agents by status", labels=["status"])
+    for status, count in sorted(agents_by_status.items()):
+        agents.add_metric([status or "unknown"], count)
+    scrape = CollectorRegistry(auto_describe=False)
+    scrape.register(_Static(agents))
+
+    return generate_latest(registry) + generate_latest(scrape)
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the shared multiprocess directory"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
@@ -0,0 +1,119 @@
+# app/core/notify.py
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Union
+
+from sqlalchemy import Connection, text
+from sqlalchemy.orm import Session
+
+from .database import get_engine
+from ..config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+def notify_enabled(bind=None) -> bool:
+    return (bind or get_engine()).dialect.name == "postgresql"
+
+def json_default(value: Any) -> str:
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def chunk_payloads(items: Iterable[Any]) -> Iterator[str]:
+    """Pack items into JSON arrays that each fit in one NOTIFY payload.
+
+    Items that do not fit on their own are skipped; callers that need them
+    delivered must send something smaller in their place.
+    """
+    chunk: List[str] = []
+    size = 2
+    for item in items:
+        encoded = json.dumps(item, default=json_default, separators=(",", ":"))
+        encoded_size = len(encoded.encode())
+        if encoded_size + 2 > MAX_PAYLOAD_BYTES:
+            continue
+        if chunk and size + encoded_size + 1 > MAX_PAYLOAD_BYTES:
+            yield "[" + ",".join(chunk) + "]"
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += encoded_size + 1
+    if chunk:
+        yield "[" + ",".join(chunk) + "]"
+
+def notify(session: Union[Session, Connection], channel: str, payload: str):
+    """Queue a NOTIFY in the session's (or connection's) transaction; it is delivered on commit"""
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": channel, "payload": payload}
+    )
+
+class NotifyListener:
+    """Background thread that LISTENs on Postgres channels and dispatches payloads.
+
+    Handlers run on the listener thread and must be thread-safe.
+    """
+
+    def __init__(self, poll_timeout: float = 5.0, reconnect_delay: float = 2.0):
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self._handlers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def listen(self, channel: str, handler: Callable[[str], None]):
+        """Register a handler; must be called before start()"""
+        self._handlers[channel].append(handler)
+
+    def start(self):
+        if self._thread or not self._handlers or not notify_enabled():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="notify-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.poll_timeout + 1)
+        self._thread = None
+
+    def _run(self):
+        import psycopg2
+
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(settings.DATABASE_URL)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    for channel in self._handlers:
+                        cursor.execute(f'LISTEN "{channel}"')
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        self._dispatch(notification.channel, notification.payload)
+            except Exception:
+                logger.exception("LISTEN connection failed, reconnecting")
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _dispatch(self, channel: str, payload: str):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception("NOTIFY handler for %s failed", channel)
+
+notify_listener = NotifyListener()
@@ -0,0 +1,161 @@
+# app/core/pagination.py
+import asyncio
+import base64
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .codecs import dumps, dumps_line
+from .database import AsyncSessionLocal
+from ..config.settings import get_settings
+
+settings = get_settings()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+RowTransform = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+@dataclass(frozen=True)
+class ArchiveReader:
+    """Archived rows of a listing: `read(limit)` yields batches newest first, all before `before`"""
+    read: Callable[[Optional[int]], Iterator[List[Dict[str, Any]]]]
+    before: datetime
+
+def encode_cursor(timestamp: datetime, row_id) -> str:
+    """Opaque cursor pointing just past a (timestamp, id) position"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset(query: Select, timestamp_col, id_col, cursor: Optional[str]) -> Select:
+    """Order newest first on (timestamp, id) and resume after `cursor`"""
+    if cursor:
+        query = query.filter(tuple_(timestamp_col, id_col) < tuple_(*decode_cursor(cursor)))
+    return query.order_by(timestamp_col.desc(), id_col.desc())
+
+def page_size(limit: Optional[int], default: Optional[int] = None) -> int:
+    limit = limit or default or settings.PAGE_SIZE_DEFAULT
+    return max(1, min(limit, settings.PAGE_SIZE_MAX))
+
+def schema_columns(schema, model) -> List:
+    """Model columns for each field of a response schema, in the schema's field order"""
+    return [getattr(model, name) for name in schema.model_fields]
+
+def _row_dicts(columns: Sequence, rows, transform: Optional[RowTransform]) -> List[Dict[str, Any]]:
+    names = [column.key for column in columns]
+    items = [dict(zip(names, row)) for row in rows]
+    return [transform(item) for item in items] if transform else items
+
+async def fetch_rows(
+    db: AsyncSession,
+    query: Select,
+    columns: Sequence,
+    limit: int,
+    transform: Optional[RowTransform] = None
+) -> List[Dict[str, Any]]:
+    """Up to `limit` rows of the given columns, as plain dicts"""
+    rows = (await db.execute(query.with_only_columns(*columns).limit(limit))).all()
+    return _row_dicts(columns, rows, transform)
+
+def json_page(items: List[Dict[str, Any]], limit: int, timestamp_attr: str = "timestamp") -> Response:
+    """A page of the first `limit` items; one more item than that means there is a next page"""
+    headers = {}
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last[timestamp_attr], last["id"])
+    # Row by row, so one row that needs the slow encoder does not slow the whole page
+    body = b"[" + b",".join(map(dumps, items)) + b"]"
+    return Response(body, media_type="application/json", headers=headers)
+
+async def fetch_json_page(
+    db: AsyncSession,
+    query: Select,
+    columns: Sequence,
+    limit: int,
+    timestamp_attr: str = "timestamp",
+    transform: Optional[RowTransform] = None,
+    archived: Optional[ArchiveReader] = None
+) -> Response:
+    """fetch_page for large lists: plain column tuples encoded straight to JSON.
+
+    No ORM objects are built and rows are not validated one by one; the body
+    matches what the endpoint's response_model would have produced. Rows
+    from `archived` are merged into the page in the same order.
+    """
+    items = await fetch_rows(db, query, columns, limit + 1, transform)
+    # A full page ending at or after the archive's boundary has nothing archived to merge in
+    if archived is not None and (len(items) <= limit or items[-1][timestamp_attr] < archived.before):
+        older = await asyncio.to_thread(lambda: [item for batch in archived.read(limit + 1) for item in batch])
+        items = merge_newest(items, [transform(item) for item in older] if transform else older, limit=limit + 1)
+    return json_page(items, limit, timestamp_attr)
+
+def merge_newest(*pages: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Rows of several newest-first pages in one (timestamp, id) order, without repeated ids"""
+    seen = set()
+    merged = []
+    for item in sorted(
+        (item for page in pages for item in page),
+        key=lambda item: (item["timestamp"], item["id"]),
+        reverse=True
+    ):
+        if item["id"] not in seen:
+            seen.add(item["id"])
+            merged.append(item)
+    return merged[:limit]
+
+def wants_ndjson(request: Request, format: Optional[str]) -> bool:
+    if format:
+        return format == "ndjson"
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def stream_ndjson(
+    query: Select,
+    columns: Sequence,
+    transform: Optional[RowTransform] = None,
+    batch_size: int = 1000,
+    archived: Optional[ArchiveReader] = None,
+    limit: Optional[int] = None
+) -> StreamingResponse:
+    """Stream the given columns of a query as NDJSON through a server-side cursor.
+
+    The rows are read on a dedicated session so memory stays flat and the
+    stream does not depend on the request's session staying open. Rows
+    from `archived`, older than the query's, follow them; `limit` caps both.
+    """
+    async def lines() -> AsyncIterator[bytes]:
+        sent = 0
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(
+                query.with_only_columns(*columns).execution_options(yield_per=batch_size)
+            )
+            async for rows in result.partitions():
+                sent += len(rows)
+                yield b"".join(dumps_line(item) for item in _row_dicts(columns, rows, transform))
+        if archived is None or (limit is not None and sent >= limit):
+            return
+        batches = archived.read(None if limit is None else limit - sent)
+        while limit is None or sent < limit:
+            items = await asyncio.to_thread(next, batches, None)
+            if items is None:
+                break
+            if limit is not None:
+                items = items[:limit - sent]
+            sent += len(items)
+            yield b"".join(dumps_line(transform(item) if transform else item) for item in items)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
@@ -1,13 +1,33 @@
 # app/core/security.py
-from fastapi import HTTPException, Header
+from fastapi import HTTPException, Header, Depends
+import hashlib
 import secrets
-from typing import Optional
+import uuid
+from typing import NamedTuple, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from ..config.settings import get_settings
+from .cache import TTLCache, MISSING
+from .database import get_db
+from .notify import notify, notify_enabled, notify_listener
+from ..models import models
 
 settings = get_settings()
 
+NOTIFY_CHANNEL = "api_keys_changed"
+
+class ApiKeyIdentity(NamedTuple):
+    agent_id: str
+    revoked: bool
+
+# Hashed API key -> ApiKeyIdentity, or None for keys that do not exist
+api_key_cache = TTLCache(
+    max_size=settings.API_KEY_CACHE_SIZE,
+    ttl=settings.API_KEY_CACHE_TTL
+)
+
 async def validate_admin_key(x_admin_key: str = Header(..., alias="X-Admin-Key")) -> str:
     """Validate admin API key from header"""
     if x_admin_key != settings.ADMIN_KEY:
@@ -17,15 +37,36 @@ async def validate_admin_key(x_admin_key: str = Header(..., alias="X-Admin-Key")
         )
     return x_admin_key
 
-async def validate_api_key(x_api_key: str = Header(..., alias="X-API-Key")) -> str:
-    """Validate agent API key from header"""
-    # You would typically check this against your database
+async def validate_api_key(
+    x_api_key: str = Header(..., alias="X-API-Key"),
+    db: AsyncSession = Depends(get_db)
+) -> str:
+    """Validate agent API key from header and return the owning agent id"""
     if not x_api_key:
         raise HTTPException(
             status_code=401,
             detail="API key is required"
         )
-    return x_api_key
+
+    identity = cached_api_key(x_api_key)
+    if identity is MISSING:
+        identity = await db.run_sync(load_api_key, x_api_key)
+    if identity is None or identity.revoked:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid API key"
+        )
+    return identity.agent_id
+
+async def authorize_agent(agent_id: str, caller_id: str = Depends(validate_api_key)) -> uuid.UUID:
+    """The path's agent, for routes acting on it; the API key must belong to that agent"""
+    try:
+        agent_uuid = uuid.UUID(agent_id)
+    except ValueError:
+        agent_uuid = None
+    if agent_uuid is None or str(agent_uuid) != caller_id:
+        raise HTTPException(status_code=403, detail="API key does not belong to this agent")
+    return agent_uuid
 
 def generate_registration_token() -> str:
     """Generate a new registration token"""
@@ -35,11 +76,55 @@ def generate_api_key() -> str:
     """Generate a new API key"""
     return secrets.token_urlsafe(48)
 
+def hash_api_key(api_key: str) -> str:
+    """Hash an API key so plaintext keys are never held in the cache"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def cached_api_key(api_key: str):
+    """Cached identity for a key, None for a known-bad key, or MISSING"""
+    return api_key_cache.get(hash_api_key(api_key))
+
+def load_api_key(db: Session, api_key: str) -> Optional[ApiKeyIdentity]:
+    """Read a key from agent_api_keys and cache the result"""
+    key_hash = hash_api_key(api_key)
+    db_key = db.query(
+        models.AgentApiKey.agent_id,
+        models.AgentApiKey.revoked
+    ).filter(models.AgentApiKey.key == api_key).first()
+
+    if db_key is None:
+        api_key_cache.set(key_hash, None, ttl=settings.API_KEY_NEGATIVE_CACHE_TTL)
+        return None
+
+    identity = ApiKeyIdentity(agent_id=str(db_key.agent_id), revoked=bool(db_key.revoked))
+    api_key_cache.set(key_hash, identity)
+    return identity
+
+def invalidate_api_key(api_key: str):
+    """Drop a key from the cache so its next use is read from the database"""
+    api_key_cache.pop(hash_api_key(api_key))
+
 def verify_admin_key(admin_key: str) -> bool:
     """Verify if admin key is valid"""
     return admin_key == settings.ADMIN_KEY
 
-def verify_agent_api_key(db: Session, agent_id: str, api_key: str) -> bool:
-    """Verify if agent API key is valid"""
-    # Implement database check for API key
-    return True  # Placeholder - implement actual verification
\ No newline at end of file
+# Invalidate cached keys as soon as a change to them is committed
+@event.listens_for(models.AgentApiKey, "after_update")
+def _track_api_key_update(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_api_keys", set()).add(target.key)
+    # Other workers drop theirs too, on the same commit; the hash keeps keys out of the payload
+    if notify_enabled(connection):
+        notify(connection, NOTIFY_CHANNEL, hash_api_key(target.key))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_api_keys(session):
+    for api_key in session.info.pop("changed_api_keys", ()):
+        invalidate_api_key(api_key)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_api_keys(session):
+    session.info.pop("changed_api_keys", None)
+
+notify_listener.listen(NOTIFY_CHANNEL, api_key_cache.pop)
@@ -0,0 +1,49 @@
+# app/core/tasks.py
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from .cluster import leadership
+
+logger = logging.getLogger(__name__)
+
+class PeriodicTask:
+    """Run a blocking function every `interval` seconds in a worker thread.
+
+    A `leader_only` task ticks only in the worker leading it, so jobs that must
+    run once per cluster are not repeated by every worker; run_once() always runs.
+    """
+
+    def __init__(self, name: str, func: Callable[[], None], interval: float, leader_only: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.leader_only = leader_only
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, initial_delay: float = 0):
+        if not self._task:
+            self._task = asyncio.create_task(self._run(initial_delay), name=self.name)
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self):
+        try:
+            await asyncio.to_thread(self.func)
+        except Exception:
+            logger.exception("Periodic task %s failed", self.name)
+
+    async def _run(self, initial_delay: float):
+        await asyncio.sleep(initial_delay)
+        while True:
+            if not self.leader_only or await asyncio.to_thread(leadership.holds, self.name):
+                await self.run_once()
+            await asyncio.sleep(self.interval)
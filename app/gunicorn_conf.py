@@ -0,0 +1,53 @@
+# app/gunicorn_conf.py
+"""Gunicorn settings for serving the app with uvicorn workers.
+
+    gunicorn -c app/gunicorn_conf.py app.main:app
+
+Binds 0.0.0.0:$PORT (8000) with $WEB_CONCURRENCY workers (one per core);
+command-line options override both. The schema is migrated once, in a
+separate process, before the workers start; set MIGRATE_ON_START=0 to skip
+it. Workers share their Prometheus samples through PROMETHEUS_MULTIPROC_DIR,
+a temporary directory unless one is given.
+
+A node's workers share one port, so each agent's in-memory state (dedup
+windows, rate limits, alert series) is only kept in one process when every
+instance runs a single worker: start one per port and hash agents across
+them with the configuration `python -m app.serve` prints, or list them in
+WORKER_NODES.
+"""
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Seconds workers get to drain in-flight requests and flush their queues on stop
+graceful_timeout = 30
+
+_owned_multiproc_dir = None
+
+def on_starting(server):
+    global _owned_multiproc_dir
+    if os.environ.get("MIGRATE_ON_START", "1") != "0":
+        # A child process, so the master never holds database connections its workers would inherit
+        subprocess.run([sys.executable, "-m", "app.migrate"], check=True)
+    # Migrated above; workers must not each run it again
+    os.environ["DB_AUTO_MIGRATE"] = "false"
+
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        _owned_multiproc_dir = tempfile.mkdtemp(prefix="agent-portal-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = _owned_multiproc_dir
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited, however it ended"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+def on_exit(server):
+    if _owned_multiproc_dir:
+        shutil.rmtree(_owned_multiproc_dir, ignore_errors=True)
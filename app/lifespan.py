@@ -0,0 +1,164 @@
+# app/lifespan.py
+"""What each worker starts before serving and stops on shutdown.
+
+Imported by the application lifespan rather than at module level, so that
+importing app.main loads neither the services nor a database driver.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable
+
+from sqlalchemy import text
+
+from .config.settings import get_settings
+from .core import instrumentation
+from .core.cluster import leadership
+from .core.database import dispose_engines, get_async_engine, get_engine
+from .core.notify import notify_listener
+from .core.tasks import PeriodicTask
+from .services.alerts import flush_alerts, reload_alert_rules, warm_alerts
+from .services.archive import archive_aged_rows
+from .services.config_bundles import config_bundles
+from .services.fleet import refresh_fleet_snapshot
+from .services.heartbeats import flush_heartbeats, sweep_heartbeats, warm_heartbeats
+from .services.ingest_queue import ingest_queue
+from .services.latest_metrics import warm_latest_metrics
+from .services.live_hub import announce_live_presence, live_hub
+from .services.log_guard import flush_log_repeats
+from .services.partitions import maintain_partitions
+from .services.rollups import refresh_all_rollups
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Once per cluster: in the worker holding the job's advisory lock
+partition_task = PeriodicTask(
+    "partition-maintenance", maintain_partitions, settings.PARTITION_MAINTENANCE_INTERVAL,
+    leader_only=True
+)
+rollup_task = PeriodicTask(
+    "metric-rollups", refresh_all_rollups, settings.ROLLUP_INTERVAL, leader_only=True
+)
+archive_task = PeriodicTask(
+    "archive", archive_aged_rows, settings.ARCHIVE_INTERVAL, leader_only=True
+)
+heartbeat_flush_task = PeriodicTask(
+    "heartbeat-flush", flush_heartbeats, settings.HEARTBEAT_FLUSH_INTERVAL
+)
+heartbeat_sweep_task = PeriodicTask(
+    "heartbeat-sweep", sweep_heartbeats, settings.HEARTBEAT_SWEEP_INTERVAL
+)
+fleet_refresh_task = PeriodicTask(
+    "fleet-snapshot-refresh", refresh_fleet_snapshot, settings.FLEET_REFRESH_INTERVAL
+)
+log_repeat_task = PeriodicTask(
+    "log-repeat-flush", flush_log_repeats, settings.LOG_DEDUP_FLUSH_INTERVAL
+)
+live_presence_task = PeriodicTask(
+    "live-presence", announce_live_presence, settings.LIVE_PRESENCE_INTERVAL
+)
+alert_flush_task = PeriodicTask("alert-flush", flush_alerts, settings.ALERT_FLUSH_INTERVAL)
+alert_rule_task = PeriodicTask(
+    "alert-rule-refresh", reload_alert_rules, settings.ALERT_RULE_REFRESH_INTERVAL
+)
+
+async def _timed(phase: str, step: Awaitable) -> None:
+    started = time.perf_counter()
+    await step
+    elapsed = time.perf_counter() - started
+    instrumentation.STARTUP_SECONDS.labels(phase).set(elapsed)
+    logger.info("Startup phase %s took %.3fs", phase, elapsed)
+
+async def _warm_async_pool(connections: int):
+    async def touch():
+        async with get_async_engine().connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    # Held concurrently, so the pool opens `connections` connections rather than reusing one
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+def _warm_sync_pool(connections: int):
+    engine = get_engine()
+    held = []
+    try:
+        for _ in range(connections):
+            held.append(engine.connect())
+            held[-1].execute(text("SELECT 1"))
+    finally:
+        for connection in held:
+            connection.close()
+
+async def _warm_heartbeats_and_fleet():
+    await asyncio.to_thread(warm_heartbeats)
+    # After the heartbeat view is warm, so statuses are counted as list_agents shows them
+    await fleet_refresh_task.run_once()
+
+async def startup():
+    started = time.perf_counter()
+    if settings.DB_AUTO_MIGRATE:
+        from .migrate import migrate
+        await _timed("migrate", asyncio.to_thread(migrate))
+
+    # Independent warm-ups share the wait for the database instead of queuing behind each other
+    warm_connections = min(settings.DB_POOL_WARM_CONNECTIONS, settings.DB_POOL_SIZE)
+    await asyncio.gather(
+        _timed("async_pool", _warm_async_pool(warm_connections)),
+        _timed("sync_pool", asyncio.to_thread(_warm_sync_pool, min(warm_connections, 2))),
+        # Partitions for today must exist before the first insert
+        _timed("partitions", partition_task.run_once()),
+        _timed("latest_metrics", asyncio.to_thread(warm_latest_metrics)),
+        _timed("heartbeats", _warm_heartbeats_and_fleet()),
+        _timed("alerts", asyncio.to_thread(warm_alerts)),
+    )
+
+    await ingest_queue.start()
+    live_hub.start()
+    config_bundles.start()
+    notify_listener.start()
+    await partition_task.start(initial_delay=partition_task.interval)
+    await rollup_task.start()
+    if settings.ARCHIVE_DIR:
+        await archive_task.start(initial_delay=archive_task.interval)
+    await heartbeat_flush_task.start(initial_delay=heartbeat_flush_task.interval)
+    await heartbeat_sweep_task.start(initial_delay=heartbeat_sweep_task.interval)
+    await fleet_refresh_task.start(initial_delay=fleet_refresh_task.interval)
+    await log_repeat_task.start(initial_delay=log_repeat_task.interval)
+    if settings.LIVE_NOTIFY_ENABLED:
+        await live_presence_task.start(initial_delay=live_presence_task.interval)
+    await alert_flush_task.start(initial_delay=alert_flush_task.interval)
+    await alert_rule_task.start(initial_delay=alert_rule_task.interval)
+
+    elapsed = time.perf_counter() - started
+    instrumentation.STARTUP_SECONDS.labels("total").set(elapsed)
+    logger.info("Worker ready in %.3fs", elapsed)
+
+async def shutdown():
+    await partition_task.stop()
+    await live_presence_task.stop()
+    live_hub.stop()
+    # Releases held long-polls, which answer with the bundle they have
+    config_bundles.stop()
+    await rollup_task.stop()
+    await archive_task.stop()
+
+    await heartbeat_sweep_task.stop()
+    await heartbeat_flush_task.stop()
+    # Check-ins received since the last flush would otherwise be lost
+    await heartbeat_flush_task.run_once()
+    await fleet_refresh_task.stop()
+
+    await ingest_queue.stop()
+    # After the queue has drained, so the rows these repeats belong to have committed
+    await log_repeat_task.stop()
+    await log_repeat_task.run_once()
+    # Likewise for alert transitions of the queue's last metrics
+    await alert_rule_task.stop()
+    await alert_flush_task.stop()
+    await alert_flush_task.run_once()
+
+    await asyncio.to_thread(notify_listener.stop)
+    # Hands the leader-only jobs to another worker now rather than when the connection times out
+    await asyncio.to_thread(leadership.release)
+    await dispose_engines()
+    instrumentation.mark_process_dead()
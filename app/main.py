@@ -1,19 +1,57 @@
 # app/main.py
-from fastapi import FastAPI, Depends, HTTPException
+import time
+
+_import_started = time.perf_counter()
+
+import importlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
 
-from .api.v1.endpoints import agents, metrics, logs
-from .core.database import engine, Base, get_db
-from .schemas import schemas
 from .config.settings import get_settings
 from .core import security
+from .core import cluster
+from .core import instrumentation
 
 settings = get_settings()
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# (endpoint module, prefix, tag, whether the routes need an agent API key)
+ROUTERS = [
+    ("registration", "/api/v1", "registration", False),
+    ("agents", "/api/v1/agents", "agents", True),
+    ("metrics", "/api/v1/metrics", "metrics", True),
+    ("logs", "/api/v1/logs", "logs", True),
+    ("alerts", "/api/v1/alerts", "alerts", True),
+    ("configs", "/api/v1/configs", "configs", True),
+    ("live", "/api/v1/live", "live", True),
+    ("operations", "", None, False),
+]
+
+def include_routers(app: FastAPI):
+    """Import the endpoint modules and mount their routers; later calls do nothing"""
+    if getattr(app.state, "routers_included", False):
+        return
+    for module_name, prefix, tag, needs_api_key in ROUTERS:
+        module = importlib.import_module(f".api.v1.endpoints.{module_name}", __package__)
+        app.include_router(
+            module.router,
+            prefix=prefix,
+            tags=[tag] if tag else None,
+            dependencies=[Depends(security.validate_api_key)] if needs_api_key else None
+        )
+    app.state.routers_included = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Routers, services and the database engines load here rather than on import
+    include_routers(app)
+    from . import lifespan as worker
+
+    await worker.startup()
+    try:
+        yield
+    finally:
+        await worker.shutdown()
 
 app = FastAPI(
     title="Ubuntu Agent Manager",
@@ -21,6 +59,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS
@@ -32,47 +71,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Registration endpoints
-@app.post("/api/v1/register/token", response_model=schemas.TokenResponse)
-async def create_registration_token(
-    request: schemas.TokenRequest,
-    db: Session = Depends(get_db),
-    admin_key: str = Depends(security.validate_admin_key)
-):
-    """Generate a new registration token"""
-    return await agents.get_registration_token(request, db)
-
-@app.post("/api/v1/register/agent", response_model=schemas.AgentResponse)
-async def register_agent(
-    agent: schemas.AgentRegister,
-    db: Session = Depends(get_db)
-):
-    """Register a new agent"""
-    return await agents.register_agent(agent, db)
-
-# Agent routes
-app.include_router(
-    agents.router,
-    prefix="/api/v1/agents",
-    tags=["agents"],
-    dependencies=[Depends(security.validate_api_key)]
-)
-
-# Metrics routes
-app.include_router(
-    metrics.router,
-    prefix="/api/v1/metrics",
-    tags=["metrics"],
-    dependencies=[Depends(security.validate_api_key)]
-)
+# Agent affinity across the workers in WORKER_NODES, so each agent's in-memory state lives in one
+ring = cluster.cluster_ring()
+if ring is not None:
+    app.add_middleware(cluster.AgentAffinityMiddleware, ring=ring, node=settings.WORKER_NODE)
 
-# Logs routes
-app.include_router(
-    logs.router,
-    prefix="/api/v1/logs",
-    tags=["logs"],
-    dependencies=[Depends(security.validate_api_key)]
-)
+# Request latency histograms; added last so it wraps every other middleware
+app.add_middleware(instrumentation.RequestMetricsMiddleware)
 
 @app.get("/health")
 async def health_check():
@@ -82,6 +87,8 @@ async def health_check():
         "version": settings.VERSION
     }
 
+instrumentation.STARTUP_SECONDS.labels("import").set(time.perf_counter() - _import_started)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,61 @@
+# app/migrate.py
+"""Bring the database schema up to date with the Alembic revisions.
+
+Run once per deploy, before the new version starts serving:
+    python -m app.migrate
+
+The revisions live in app/migrations/versions. Each runs in its own
+transaction; index builds on populated tables use CREATE INDEX CONCURRENTLY
+outside of it (see 0002_indexes.py), so writes carry on while they run.
+"""
+import logging
+import os
+import sys
+from typing import List, Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import Engine, inspect
+
+from .core.database import get_engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "alembic.ini")
+# Databases set up before Alembic already have this revision's schema
+PRE_ALEMBIC_REVISION = "0002"
+
+def alembic_config() -> Config:
+    return Config(ALEMBIC_INI)
+
+def migrate(engine: Optional[Engine] = None) -> List[str]:
+    """Upgrade to the latest revision; returns the revisions applied, oldest first"""
+    engine = engine or get_engine()
+    config = alembic_config()
+    script = ScriptDirectory.from_config(config)
+    with engine.connect() as connection:
+        config.attributes["connection"] = connection
+        current = MigrationContext.configure(connection).get_current_revision()
+        if current is None and inspect(connection).has_table("agents"):
+            command.stamp(config, PRE_ALEMBIC_REVISION)
+            current = PRE_ALEMBIC_REVISION
+            logger.info("stamped existing schema as revision %s", PRE_ALEMBIC_REVISION)
+        command.upgrade(config, "head")
+        head = MigrationContext.configure(connection).get_current_revision()
+    return [
+        f"{revision.revision} {revision.doc}"
+        for revision in reversed(list(script.iterate_revisions(head, current)))
+    ]
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    applied = migrate()
+    for revision in applied:
+        logger.info("applied %s", revision)
+    logger.info("schema up to date" if not applied else f"{len(applied)} revisions applied")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# app/migrations/env.py
+"""Alembic environment: runs the revisions on the application's database.
+
+`app.migrate` hands over its connection in config.attributes; the alembic
+command line gets one from the application engine.
+"""
+from alembic import context
+from sqlalchemy import text
+
+from app.core.database import Base, get_engine
+from app.models import models  # registers every table on Base.metadata
+
+# Serializes concurrent runs, e.g. several workers started with DB_AUTO_MIGRATE
+MIGRATION_LOCK_ID = 0x6167656E74  # "agent"
+
+config = context.config
+target_metadata = Base.metadata
+
+def include_name(name, type_, parent_names):
+    """Leave the SQLite full-text tables, which no model describes, out of autogenerate"""
+    return not (type_ == "table" and name.startswith(models.LOG_SEARCH_FTS_TABLE))
+
+def run_migrations_offline():
+    context.configure(
+        url=get_engine().url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def _run(connection):
+    postgres = connection.dialect.name == "postgresql"
+    if postgres:
+        # Session-level, so it outlasts the commits of per-revision transactions
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        # Index builds on large tables outlast the request-sized statement timeout
+        connection.execute(text("SET statement_timeout = 0"))
+    # Revisions that build indexes concurrently need to leave the transaction
+    # they run in, which only works if Alembic started it
+    connection.commit()
+    try:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            transaction_per_migration=True,
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        if postgres:
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+    with get_engine().connect() as connection:
+        _run(connection)
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,157 @@
+# app/migrations/versions/0001_tables.py
+"""Tables
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+LOG_SEARCH_DETAILS_KEYS = ("error", "exception", "path", "service")
+_fts_details = " || ' ' || ".join(
+    f"coalesce(json_extract(new.details, '$.{key}'), '')" for key in LOG_SEARCH_DETAILS_KEYS
+)
+# SQLite stand-in: an FTS5 table kept in step with agent_logs by triggers
+SQLITE_LOG_SEARCH = (
+    "CREATE VIRTUAL TABLE agent_logs_fts USING fts5(message, details)",
+    "CREATE TRIGGER agent_logs_fts_insert AFTER INSERT ON agent_logs BEGIN "
+    "INSERT INTO agent_logs_fts(rowid, message, details) "
+    f"VALUES (new.rowid, new.message, {_fts_details}); END",
+    "CREATE TRIGGER agent_logs_fts_delete AFTER DELETE ON agent_logs BEGIN "
+    "DELETE FROM agent_logs_fts WHERE rowid = old.rowid; END",
+)
+
+def upgrade():
+    op.create_table(
+        "agents",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column("hostname", sa.String(), nullable=False),
+        sa.Column("ip_address", sa.String(), nullable=False),
+        sa.Column("environment", sa.String(), nullable=False),
+        sa.Column("description", sa.String()),
+        sa.Column("version", sa.String()),
+        sa.Column("os_info", sa.JSON()),
+        sa.Column("status", sa.String()),
+        sa.Column("last_seen", sa.DateTime()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("config_revision", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "registration_tokens",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column("token", sa.String(), nullable=False, unique=True),
+        sa.Column("environment", sa.String(), nullable=False),
+        sa.Column("description", sa.String()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("used", sa.Boolean()),
+        sa.Column("used_by", sa.Uuid(), sa.ForeignKey("agents.id")),
+        sa.Column("used_at", sa.DateTime()),
+    )
+    op.create_table(
+        "nginx_configs",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column("agent_id", sa.Uuid(), sa.ForeignKey("agents.id"), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("enabled", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_table(
+        "agent_api_keys",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column("agent_id", sa.Uuid(), sa.ForeignKey("agents.id"), nullable=False),
+        sa.Column("key", sa.String(), nullable=False, unique=True),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("revoked", sa.Boolean()),
+        sa.Column("revoked_at", sa.DateTime()),
+    )
+    # Range-partitioned by day on Postgres (see services/partitions.py)
+    op.create_table(
+        "agent_metrics",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column("agent_id", sa.Uuid(), sa.ForeignKey("agents.id"), nullable=False),
+        sa.Column("metric_type", sa.String(), nullable=False),
+        sa.Column("value", sa.JSON(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), primary_key=True),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    op.create_table(
+        "agent_logs",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column("agent_id", sa.Uuid(), sa.ForeignKey("agents.id"), nullable=False),
+        sa.Column("level", sa.String(), nullable=False),
+        sa.Column("category", sa.String()),
+        sa.Column("message", sa.String(), nullable=False),
+        sa.Column("details", sa.JSON()),
+        sa.Column("timestamp", sa.DateTime(), primary_key=True),
+        sa.Column("repeat_count", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("last_timestamp", sa.DateTime()),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    if op.get_bind().dialect.name == "sqlite":
+        for statement in SQLITE_LOG_SEARCH:
+            op.execute(statement)
+    op.create_table(
+        "agent_metric_rollups",
+        sa.Column("agent_id", sa.Uuid(), sa.ForeignKey("agents.id"), primary_key=True),
+        sa.Column("metric_type", sa.String(), primary_key=True),
+        sa.Column("field", sa.String(), primary_key=True),
+        sa.Column("bucket_width", sa.Integer(), primary_key=True),
+        sa.Column("bucket_start", sa.DateTime(), primary_key=True),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.Column("sum", sa.Float(), nullable=False),
+        sa.Column("min", sa.Float(), nullable=False),
+        sa.Column("max", sa.Float(), nullable=False),
+    )
+    op.create_table(
+        "agent_metric_rollups_dirty",
+        sa.Column("agent_id", sa.Uuid(), primary_key=True),
+        sa.Column("hour_start", sa.DateTime(), primary_key=True),
+    )
+    op.create_table(
+        "alert_rules",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("metric_type", sa.String(), nullable=False),
+        sa.Column("field", sa.String(), nullable=False),
+        sa.Column("environment", sa.String()),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("comparator", sa.String(), nullable=False),
+        sa.Column("threshold", sa.Float(), nullable=False),
+        sa.Column("for_seconds", sa.Integer(), nullable=False),
+        sa.Column("window", sa.Integer(), nullable=False),
+        sa.Column("enabled", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_table(
+        "alert_events",
+        sa.Column("id", sa.Uuid(), primary_key=True),
+        sa.Column(
+            "rule_id", sa.Uuid(), sa.ForeignKey("alert_rules.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("agent_id", sa.Uuid(), sa.ForeignKey("agents.id"), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("fired_at", sa.DateTime(), nullable=False),
+        sa.Column("value", sa.Float(), nullable=False),
+        sa.Column("resolved_at", sa.DateTime()),
+        sa.Column("resolved_value", sa.Float()),
+    )
+
+def downgrade():
+    for table in (
+        "alert_events", "alert_rules", "agent_metric_rollups_dirty", "agent_metric_rollups",
+        "agent_logs", "agent_metrics", "agent_api_keys", "nginx_configs", "registration_tokens",
+        "agents",
+    ):
+        op.drop_table(table)
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("DROP TABLE IF EXISTS agent_logs_fts")
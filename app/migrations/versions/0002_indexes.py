@@ -0,0 +1,104 @@
+# app/migrations/versions/0002_indexes.py
+"""Secondary indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Postgres cannot build indexes on partitioned tables concurrently; the parent's
+# index cascades to each partition (and is instant before the first one exists)
+PARTITIONED = {"agent_metrics", "agent_logs"}
+POSTGRES_ONLY = {"ix_agents_hostname_trgm", "ix_agents_os_info", "ix_agent_logs_search"}
+LOG_SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, message{})".format("".join(
+    f" || ' ' || coalesce(details ->> '{key}', '')"
+    for key in ("error", "exception", "path", "service")
+))
+
+def create_index(name, table, columns, **kw):
+    """CREATE INDEX CONCURRENTLY on Postgres, so writes to a populated table carry on"""
+    if op.get_bind().dialect.name != "postgresql" or table in PARTITIONED:
+        op.create_index(name, table, columns, **kw)
+        return
+    # Concurrent builds cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(name, table, columns, postgresql_concurrently=True, **kw)
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == "postgresql"
+
+    # list_agents(status=..., environment=..., version=...) walk these in keyset order
+    create_index("ix_agents_status_created_at", "agents", ["status", "created_at", "id"])
+    create_index("ix_agents_environment_created_at", "agents", ["environment", "created_at", "id"])
+    create_index("ix_agents_version_created_at", "agents", ["version", "created_at", "id"])
+    # Hostname prefix filters; text_pattern_ops lets LIKE 'x%' use it under any collation
+    create_index(
+        "ix_agents_hostname", "agents", ["hostname"],
+        postgresql_ops={"hostname": "text_pattern_ops"}
+    )
+    if postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        # Hostname substring filters (ILIKE '%x%')
+        create_index(
+            "ix_agents_hostname_trgm", "agents", ["hostname"],
+            postgresql_using="gin", postgresql_ops={"hostname": "gin_trgm_ops"}
+        )
+        # os_info containment filters; queries must cast os_info to jsonb the same way
+        create_index(
+            "ix_agents_os_info", "agents", [sa.text("(os_info::jsonb) jsonb_path_ops")],
+            postgresql_using="gin"
+        )
+
+    create_index("ix_nginx_configs_agent_id", "nginx_configs", ["agent_id"])
+
+    create_index("ix_agent_metrics_agent_timestamp", "agent_metrics", ["agent_id", "timestamp"])
+    create_index(
+        "ix_agent_metrics_agent_type_timestamp", "agent_metrics", ["agent_id", "metric_type", "timestamp"]
+    )
+    create_index("ix_agent_logs_agent_timestamp", "agent_logs", ["agent_id", "timestamp"])
+    create_index("ix_agent_logs_timestamp", "agent_logs", ["timestamp"])
+    if postgres:
+        create_index(
+            "ix_agent_logs_search", "agent_logs", [sa.text(LOG_SEARCH_DOCUMENT)], postgresql_using="gin"
+        )
+
+    create_index(
+        "ix_agent_metric_rollups_watermark", "agent_metric_rollups", ["bucket_width", "bucket_start"]
+    )
+
+    # At most one open alert per series; also what lists the active alerts
+    create_index(
+        "ux_alert_events_open", "alert_events", ["rule_id", "agent_id"], unique=True,
+        postgresql_where=sa.text("resolved_at IS NULL"),
+        sqlite_where=sa.text("resolved_at IS NULL"),
+    )
+    create_index("ix_alert_events_fired_at", "alert_events", ["fired_at"])
+
+def downgrade():
+    postgres = op.get_bind().dialect.name == "postgresql"
+    for name, table in (
+        ("ix_alert_events_fired_at", "alert_events"),
+        ("ux_alert_events_open", "alert_events"),
+        ("ix_agent_metric_rollups_watermark", "agent_metric_rollups"),
+        ("ix_agent_logs_search", "agent_logs"),
+        ("ix_agent_logs_timestamp", "agent_logs"),
+        ("ix_agent_logs_agent_timestamp", "agent_logs"),
+        ("ix_agent_metrics_agent_type_timestamp", "agent_metrics"),
+        ("ix_agent_metrics_agent_timestamp", "agent_metrics"),
+        ("ix_nginx_configs_agent_id", "nginx_configs"),
+        ("ix_agents_os_info", "agents"),
+        ("ix_agents_hostname_trgm", "agents"),
+        ("ix_agents_hostname", "agents"),
+        ("ix_agents_version_created_at", "agents"),
+        ("ix_agents_environment_created_at", "agents"),
+        ("ix_agents_status_created_at", "agents"),
+    ):
+        if postgres or name not in POSTGRES_ONLY:
+            op.drop_index(name, table_name=table)
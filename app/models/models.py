@@ -1,10 +1,21 @@
 # app/models/models.py
-from sqlalchemy import Column, String, DateTime, Boolean, JSON, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, Boolean, JSON, ForeignKey, Integer, BigInteger, Float, Index
+from sqlalchemy import DDL, Uuid, event, text
+from sqlalchemy.types import TypeDecorator
 import uuid
 from datetime import datetime
 from ..core.database import Base
 
+class UUID(TypeDecorator):
+    """Native UUID on Postgres, CHAR(32) on the SQLite stand-in; accepts str ids like Postgres does"""
+    impl = Uuid
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(str(value))
+
 class RegistrationToken(Base):
     __tablename__ = "registration_tokens"
     
@@ -31,6 +42,43 @@ class Agent(Base):
     status = Column(String, default='registered')
     last_seen = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped in the same transaction as every change to the agent's nginx configs
+    config_revision = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # list_agents(status=..., environment=..., version=...) walk these in keyset order
+        Index("ix_agents_status_created_at", "status", "created_at", "id"),
+        Index("ix_agents_environment_created_at", "environment", "created_at", "id"),
+        Index("ix_agents_version_created_at", "version", "created_at", "id"),
+        # Hostname prefix filters; text_pattern_ops lets LIKE 'x%' use it under any collation
+        Index("ix_agents_hostname", "hostname", postgresql_ops={"hostname": "text_pattern_ops"}),
+        # Hostname substring filters (ILIKE '%x%')
+        Index(
+            "ix_agents_hostname_trgm", "hostname",
+            postgresql_using="gin", postgresql_ops={"hostname": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+        # os_info containment filters; queries must cast os_info to jsonb the same way
+        Index(
+            "ix_agents_os_info", text("(os_info::jsonb) jsonb_path_ops"), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
+
+# The hostname trigram index needs pg_trgm
+event.listen(
+    Agent.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+class NginxConfig(Base):
+    __tablename__ = "nginx_configs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    agent_id = Column(UUID(as_uuid=True), ForeignKey('agents.id'), nullable=False, index=True)
+    name = Column(String, nullable=False)
+    content = Column(String, nullable=False)
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class AgentApiKey(Base):
     __tablename__ = "agent_api_keys"
@@ -40,4 +88,135 @@ class AgentApiKey(Base):
     key = Column(String, unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     revoked = Column(Boolean, default=False)
-    revoked_at = Column(DateTime, nullable=True)
\ No newline at end of file
+    revoked_at = Column(DateTime, nullable=True)
+
+# Metrics and logs are range-partitioned by day on Postgres (see services/partitions.py),
+# so the partition key is part of the primary key
+class AgentMetric(Base):
+    __tablename__ = "agent_metrics"
+    __table_args__ = (
+        Index("ix_agent_metrics_agent_timestamp", "agent_id", "timestamp"),
+        Index("ix_agent_metrics_agent_type_timestamp", "agent_id", "metric_type", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    agent_id = Column(UUID(as_uuid=True), ForeignKey('agents.id'), nullable=False)
+    metric_type = Column(String, nullable=False)
+    value = Column(JSON, nullable=False)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+# `details` keys searched alongside the message
+LOG_SEARCH_DETAILS_KEYS = ("error", "exception", "path", "service")
+# Postgres only uses the GIN index for queries that repeat this expression verbatim
+LOG_SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, message{})".format("".join(
+    f" || ' ' || coalesce(details ->> '{key}', '')" for key in LOG_SEARCH_DETAILS_KEYS
+))
+
+class AgentLog(Base):
+    __tablename__ = "agent_logs"
+    __table_args__ = (
+        Index("ix_agent_logs_agent_timestamp", "agent_id", "timestamp"),
+        Index("ix_agent_logs_timestamp", "timestamp"),
+        Index(
+            "ix_agent_logs_search", text(LOG_SEARCH_DOCUMENT), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    agent_id = Column(UUID(as_uuid=True), ForeignKey('agents.id'), nullable=False)
+    level = Column(String, nullable=False)
+    category = Column(String, nullable=True)
+    message = Column(String, nullable=False)
+    details = Column(JSON, nullable=True)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
+    repeat_count = Column(Integer, nullable=False, default=1, server_default="1")
+    last_timestamp = Column(DateTime, nullable=True)
+
+# SQLite stand-in: an FTS5 table kept in step with agent_logs by triggers
+LOG_SEARCH_FTS_TABLE = "agent_logs_fts"
+_fts_details = " || ' ' || ".join(
+    f"coalesce(json_extract(new.details, '$.{key}'), '')" for key in LOG_SEARCH_DETAILS_KEYS
+)
+for _statement in (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {LOG_SEARCH_FTS_TABLE} USING fts5(message, details)",
+    f"CREATE TRIGGER IF NOT EXISTS {LOG_SEARCH_FTS_TABLE}_insert AFTER INSERT ON agent_logs BEGIN "
+    f"INSERT INTO {LOG_SEARCH_FTS_TABLE}(rowid, message, details) "
+    f"VALUES (new.rowid, new.message, {_fts_details}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {LOG_SEARCH_FTS_TABLE}_delete AFTER DELETE ON agent_logs BEGIN "
+    f"DELETE FROM {LOG_SEARCH_FTS_TABLE} WHERE rowid = old.rowid; END",
+):
+    event.listen(AgentLog.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+# Its rowids point into agent_logs, so it must not outlive the table
+event.listen(
+    AgentLog.__table__, "after_drop",
+    DDL(f"DROP TABLE IF EXISTS {LOG_SEARCH_FTS_TABLE}").execute_if(dialect="sqlite")
+)
+
+class MetricRollup(Base):
+    __tablename__ = "agent_metric_rollups"
+    __table_args__ = (
+        Index("ix_agent_metric_rollups_watermark", "bucket_width", "bucket_start"),
+    )
+
+    agent_id = Column(UUID(as_uuid=True), ForeignKey('agents.id'), primary_key=True)
+    metric_type = Column(String, primary_key=True)
+    field = Column(String, primary_key=True)
+    bucket_width = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(BigInteger, nullable=False)
+    sum = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+
+# Hours of an agent's samples that arrived after their buckets may have been rolled up
+class MetricRollupDirty(Base):
+    __tablename__ = "agent_metric_rollups_dirty"
+
+    agent_id = Column(UUID(as_uuid=True), primary_key=True)
+    hour_start = Column(DateTime, primary_key=True)
+
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String, nullable=False)
+    metric_type = Column(String, nullable=False)
+    # Key of the metric's value dict; dots descend into nested dicts
+    field = Column(String, nullable=False)
+    # Only agents of this environment are evaluated; null means every environment
+    environment = Column(String, nullable=True)
+    # "threshold" compares the value itself, "zscore" its deviation from an EWMA baseline
+    kind = Column(String, nullable=False, default="threshold")
+    comparator = Column(String, nullable=False, default=">")
+    threshold = Column(Float, nullable=False)
+    for_seconds = Column(Integer, nullable=False, default=0)
+    # zscore: EWMA span in samples, and the samples seen before it may fire
+    window = Column(Integer, nullable=False, default=60)
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# One row per firing; resolving sets resolved_at, so only state transitions are written
+class AlertEvent(Base):
+    __tablename__ = "alert_events"
+    __table_args__ = (
+        # At most one open alert per series; also what lists the active alerts
+        Index(
+            "ux_alert_events_open", "rule_id", "agent_id", unique=True,
+            postgresql_where=text("resolved_at IS NULL"),
+            sqlite_where=text("resolved_at IS NULL"),
+        ),
+        Index("ix_alert_events_fired_at", "fired_at"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    rule_id = Column(UUID(as_uuid=True), ForeignKey('alert_rules.id', ondelete="CASCADE"), nullable=False)
+    agent_id = Column(UUID(as_uuid=True), ForeignKey('agents.id'), nullable=False)
+    # Sample timestamps: when the condition started holding, and when the alert fired
+    started_at = Column(DateTime, nullable=False)
+    fired_at = Column(DateTime, nullable=False)
+    value = Column(Float, nullable=False)
+    resolved_at = Column(DateTime, nullable=True)
+    resolved_value = Column(Float, nullable=True)
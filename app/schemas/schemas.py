@@ -1,7 +1,8 @@
 # app/schemas/schemas.py
-from pydantic import BaseModel, UUID4
-from typing import Optional, Dict, List, Any
+from pydantic import BaseModel, Field, UUID4
+from typing import Optional, Dict, List, Any, Literal
 from datetime import datetime
+from uuid import UUID
 
 class TokenRequest(BaseModel):
     environment: str
@@ -12,6 +13,13 @@ class TokenResponse(BaseModel):
     token: str
     expires_at: datetime
 
+class TokenBatchRequest(TokenRequest):
+    count: int
+
+class TokenBatchResponse(BaseModel):
+    tokens: List[str]
+    expires_at: datetime
+
 class AgentRegister(BaseModel):
     hostname: str
     ip_address: str
@@ -35,6 +43,31 @@ class Agent(BaseModel):
     class Config:
         from_attributes = True
 
+class FleetFacets(BaseModel):
+    total: int
+    refreshed_at: Optional[datetime]
+    facets: Dict[str, Dict[str, int]]
+
+class AgentRegisterBatch(BaseModel):
+    agents: List[AgentRegister]
+
+class AgentRegisterResult(BaseModel):
+    index: int
+    hostname: str
+    agent: Optional[Agent] = None
+    api_key: Optional[str] = None
+    error: Optional[str] = None
+
+class AgentRegisterBatchResult(BaseModel):
+    registered: int
+    failed: int
+    results: List[AgentRegisterResult]
+
+class HeartbeatAck(BaseModel):
+    agent_id: UUID4
+    status: str
+    last_seen: datetime
+
 class AgentResponse(BaseModel):
     agent: Agent
     api_key: str
@@ -45,44 +78,180 @@ class MetricBase(BaseModel):
     value: Dict[str, Any]
     timestamp: Optional[datetime] = None
 
-class MetricCreate(MetricBase):
+class MetricSample(MetricBase):
+    # Sequence number within the agent's X-Agent-Session; a retried sample with the same seq is stored once
+    seq: Optional[int] = Field(None, ge=0)
+
+class MetricCreate(MetricSample):
     agent_id: UUID4
 
 class Metric(MetricBase):
-    id: UUID4
+    # Version 5 for rows of keyed submissions, see services.idempotency
+    id: UUID
     agent_id: UUID4
     timestamp: datetime
 
     class Config:
         from_attributes = True
 
+class MetricBucket(BaseModel):
+    bucket: datetime
+    metric_type: str
+    field: str
+    value: Optional[float]
+    count: int
+
+class AggregateAgent(BaseModel):
+    agent_id: UUID4
+    hostname: str
+    samples: int
+    value: Optional[float]
+
+class AggregateGroup(BaseModel):
+    group: Optional[str]
+    agents: int
+    samples: int
+    avg: Optional[float]
+    min: Optional[float]
+    max: Optional[float]
+    percentiles: Dict[str, Optional[float]]
+    top: List[AggregateAgent] = []
+
+class AggregateResult(BaseModel):
+    metric_type: str
+    field: str
+    group_by: Optional[str]
+    hours: int
+    top: int
+    top_by: str
+    ascending: bool
+    computed_at: datetime
+    groups: List[AggregateGroup]
+
 class MetricsSubmit(BaseModel):
     cpu: Dict[str, Any]
     memory: Dict[str, Any]
     disk: Dict[str, Any]
     network: Dict[str, Any]
-    timestamp: datetime = datetime.utcnow()
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    seq: Optional[int] = Field(None, ge=0)
+
+class AgentMetricsSubmit(MetricsSubmit):
+    agent_id: UUID4
+
+# Alert schemas
+class AlertRuleBase(BaseModel):
+    name: str
+    metric_type: str
+    field: str
+    environment: Optional[str] = None
+    kind: Literal["threshold", "zscore"] = "threshold"
+    comparator: Literal[">", ">=", "<", "<="] = ">"
+    threshold: float
+    for_seconds: int = Field(0, ge=0)
+    window: int = Field(60, ge=2)
+    enabled: bool = True
+
+class AlertRuleCreate(AlertRuleBase):
+    pass
+
+class AlertRule(AlertRuleBase):
+    id: UUID4
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ActiveAlert(BaseModel):
+    id: UUID4
+    rule_id: UUID4
+    rule_name: str
+    agent_id: UUID4
+    hostname: str
+    environment: str
+    value: float
+    started_at: datetime
+    fired_at: datetime
+
+# Batch ingestion schemas
+class MetricsBatch(BaseModel):
+    # Items are validated one by one so a bad sample only rejects itself
+    metrics: List[Dict[str, Any]] = []
+    submissions: List[Dict[str, Any]] = []
+
+class BatchItemError(BaseModel):
+    section: str
+    index: int
+    detail: str
+
+class BatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    rows: int
+    errors: List[BatchItemError] = []
+    collapsed: int = 0
+    # Items already stored by an earlier attempt of the same submission
+    duplicates: int = 0
+
+# Nginx config schemas
+class NginxConfigBase(BaseModel):
+    name: str
+    content: str
+    enabled: bool = True
+
+class NginxConfigCreate(NginxConfigBase):
+    pass
+
+class NginxConfig(NginxConfigBase):
+    id: UUID4
+    agent_id: UUID4
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
 
 # Log schemas
 class LogBase(BaseModel):
     level: str
     message: str
+    category: Optional[str] = None
     details: Optional[Dict] = None
     timestamp: Optional[datetime] = None
 
 class LogCreate(LogBase):
-    pass
+    # Sequence number within the agent's X-Agent-Session; a retried entry with the same seq is stored once
+    seq: Optional[int] = Field(None, ge=0)
 
 class Log(LogBase):
-    id: UUID4
+    # Version 5 for rows of keyed submissions, see services.idempotency
+    id: UUID
     agent_id: UUID4
     timestamp: datetime
+    # Identical messages collapsed into this row, first at `timestamp`, last at `last_timestamp`
+    repeat_count: int = 1
+    last_timestamp: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class LogSearchHit(Log):
+    rank: float
+    highlight: str
+
 class LogSubmit(BaseModel):
     level: str
     message: str
+    category: Optional[str] = None
     details: Optional[Dict] = None
-    timestamp: datetime = datetime.utcnow()
\ No newline at end of file
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    seq: Optional[int] = Field(None, ge=0)
+
+# Write-behind ingestion schemas
+class IngestAck(BaseModel):
+    queued: int
+    queue_depth: int
+    collapsed: int = 0
+    dropped: int = 0
+    duplicates: int = 0
\ No newline at end of file
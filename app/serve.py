@@ -0,0 +1,53 @@
+# app/serve.py
+"""Print an nginx configuration that sends each agent's requests to one server.
+
+    python -m app.serve 10.0.0.5:8001 10.0.0.5:8002 10.0.0.6:8001 > agent-portal.conf
+
+Each address is a gunicorn instance (see app/gunicorn_conf.py). nginx
+hashes agent-scoped requests on the agent id, so every agent reaches the
+same instance while the set of instances is unchanged; other requests are
+spread by request.
+"""
+import argparse
+import sys
+from typing import List, Optional
+
+NGINX_TEMPLATE = """\
+# Agent-scoped requests go to one server by agent id; everything else is spread by request
+map $uri $agent_key {{
+    ~^/api/v1/(?:metrics|logs|agents|configs)/(?<agent_id>[0-9a-fA-F-]{{32,36}}) $agent_id;
+    default $request_id;
+}}
+
+upstream agent_portal {{
+    hash $agent_key consistent;
+{servers}
+}}
+
+server {{
+    listen 80;
+    location / {{
+        proxy_pass http://agent_portal;
+        proxy_http_version 1.1;
+        proxy_set_header Host $host;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection $http_connection;
+        proxy_read_timeout 120s;
+    }}
+}}
+"""
+
+def nginx_config(servers: List[str]) -> str:
+    return NGINX_TEMPLATE.format(servers="\n".join(f"    server {server};" for server in servers))
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("servers", nargs="+", metavar="HOST:PORT", help="address of each gunicorn instance")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    print(nginx_config(parse_args(argv).servers), end="")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# app/services/aggregates.py
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, Integer, String, case, func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from ..core.cache import SingleFlightCache
+from ..core.database import AsyncSessionLocal
+from ..config.settings import get_settings
+from ..models import models
+
+settings = get_settings()
+
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p95": 0.95, "p99": 0.99}
+GROUP_COLUMNS = {"environment": models.Agent.environment, "status": models.Agent.status}
+# os_info keys are matched against this before being used as a JSON path
+OS_INFO_KEY = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+
+aggregate_cache = SingleFlightCache(
+    max_size=settings.AGGREGATE_CACHE_SIZE,
+    ttl=settings.AGGREGATE_CACHE_TTL
+)
+
+def group_column(group_by: Optional[str]):
+    """SQL expression for a group_by value: environment, status, os_info.<key> or none"""
+    if not group_by:
+        return literal("all", String)
+    if group_by in GROUP_COLUMNS:
+        return GROUP_COLUMNS[group_by]
+    if group_by.startswith("os_info."):
+        key = group_by[len("os_info."):]
+        if OS_INFO_KEY.match(key):
+            return models.Agent.os_info[key].as_string()
+    raise ValueError(f"Cannot group by {group_by!r}")
+
+def aggregate(
+    db: Session,
+    metric_type: str,
+    field: str,
+    group_by: Optional[str],
+    hours: int,
+    top: int,
+    top_by: str,
+    ascending: bool
+) -> List[Dict[str, Any]]:
+    """Group statistics and the top-k agents per group, computed by one SQL statement"""
+    postgres = db.get_bind().dialect.name == "postgresql"
+    since = datetime.utcnow() - timedelta(hours=hours)
+
+    # Agents may report any JSON under a field; only numbers are cast, the rest count as missing
+    raw = models.AgentMetric.value[field]
+    is_number = (
+        func.json_typeof(raw) == "number" if postgres
+        # SQLite extracts true/false as 1/0, so the type is read from the document itself
+        else func.json_type(models.AgentMetric.value, f'$."{field}"').in_(("integer", "real"))
+    )
+    samples = select(
+        group_column(group_by).label("group_key"),
+        models.Agent.id.label("agent_id"),
+        models.Agent.hostname.label("hostname"),
+        case((is_number, raw.as_float()), else_=null()).label("v"),
+    ).select_from(models.AgentMetric).join(
+        models.Agent, models.Agent.id == models.AgentMetric.agent_id
+    ).where(
+        models.AgentMetric.metric_type == metric_type,
+        models.AgentMetric.timestamp >= since,
+    ).cte("samples")
+    v = samples.c.v
+
+    # percentile_cont is Postgres-only; other dialects report them as null
+    percentiles = [
+        (func.percentile_cont(fraction).within_group(v) if postgres else null())
+        .cast(Float).label(name)
+        for name, fraction in PERCENTILES.items()
+    ]
+    groups = select(
+        literal("group").label("row_kind"),
+        samples.c.group_key,
+        null().cast(samples.c.agent_id.type).label("agent_id"),
+        null().cast(String).label("hostname"),
+        func.count(v).label("samples"),
+        func.count(func.distinct(samples.c.agent_id)).label("agents"),
+        func.avg(v).cast(Float).label("avg"),
+        func.min(v).cast(Float).label("min"),
+        func.max(v).cast(Float).label("max"),
+        *percentiles,
+    ).where(v.isnot(None)).group_by(samples.c.group_key)
+
+    statement = groups
+    if top:
+        per_agent = select(
+            samples.c.group_key, samples.c.agent_id, samples.c.hostname,
+            func.count(v).label("samples"),
+            func.avg(v).label("avg"),
+            func.min(v).label("min"),
+            func.max(v).label("max"),
+        ).where(v.isnot(None)).group_by(
+            samples.c.group_key, samples.c.agent_id, samples.c.hostname
+        ).subquery("per_agent")
+        rank_value = per_agent.c[top_by]
+        ranked = select(
+            per_agent,
+            func.row_number().over(
+                partition_by=per_agent.c.group_key,
+                order_by=rank_value.asc() if ascending else rank_value.desc()
+            ).label("rank")
+        ).subquery("ranked")
+        top_rows = select(
+            literal("top").label("row_kind"),
+            ranked.c.group_key,
+            ranked.c.agent_id,
+            ranked.c.hostname,
+            ranked.c.samples,
+            literal(1, Integer).label("agents"),
+            ranked.c.avg.cast(Float),
+            ranked.c.min.cast(Float),
+            ranked.c.max.cast(Float),
+            *[null().cast(Float).label(name) for name in PERCENTILES],
+        ).where(ranked.c.rank <= top)
+        statement = union_all(groups, top_rows)
+
+    return _assemble(db.execute(statement), top_by, ascending)
+
+def _assemble(rows, top_by: str, ascending: bool) -> List[Dict[str, Any]]:
+    groups: Dict[Optional[str], Dict[str, Any]] = {}
+    tops: List[Tuple[Optional[str], Dict[str, Any]]] = []
+    for row in rows:
+        if row.row_kind == "group":
+            groups[row.group_key] = {
+                "group": row.group_key,
+                "agents": row.agents,
+                "samples": row.samples,
+                "avg": row.avg,
+                "min": row.min,
+                "max": row.max,
+                "percentiles": {name: getattr(row, name) for name in PERCENTILES},
+                "top": [],
+            }
+        else:
+            tops.append((row.group_key, {
+                "agent_id": row.agent_id,
+                "hostname": row.hostname,
+                "samples": row.samples,
+                "value": getattr(row, top_by),
+            }))
+
+    for group_key, agent in tops:
+        if group_key in groups:
+            groups[group_key]["top"].append(agent)
+    for group in groups.values():
+        group["top"].sort(key=lambda a: a["value"], reverse=not ascending)
+    return sorted(groups.values(), key=lambda g: (g["group"] is None, str(g["group"])))
+
+async def cached_aggregate(**params) -> Dict[str, Any]:
+    """Aggregate through a short-TTL cache; identical concurrent requests share one query"""
+    key = tuple(sorted(params.items()))
+
+    async def compute():
+        # Own session: the query outlives whichever request happened to start it
+        async with AsyncSessionLocal() as db:
+            groups = await db.run_sync(aggregate, **params)
+        return {**params, "computed_at": datetime.utcnow(), "groups": groups}
+
+    return await aggregate_cache.get_or_compute(key, compute)
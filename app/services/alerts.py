@@ -0,0 +1,393 @@
+# app/services/alerts.py
+import logging
+import math
+import operator
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionLocal
+from ..core.instrumentation import ALERT_TRANSITIONS
+from ..core.notify import notify, notify_enabled, notify_listener
+from ..config.settings import get_settings
+from ..models import models
+from . import metric_service
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+NOTIFY_CHANNEL = "alert_rules_changed"
+THRESHOLD = "threshold"
+ZSCORE = "zscore"
+FIRED = "fired"
+RESOLVED = "resolved"
+COMPARATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+SeriesKey = Tuple[uuid.UUID, uuid.UUID]
+Transition = Tuple[str, Dict[str, Any]]
+
+def _series_key(transition: Transition) -> SeriesKey:
+    kind, row = transition
+    if kind == FIRED:
+        return row["rule_id"], row["agent_id"]
+    return row["b_rule_id"], row["b_agent_id"]
+
+@dataclass(frozen=True)
+class Rule:
+    """An enabled alert rule, compiled for evaluation"""
+    id: uuid.UUID
+    metric_type: str
+    path: Tuple[str, ...]
+    environment: Optional[str]
+    kind: str
+    compare: Callable[[float, float], bool]
+    threshold: float
+    hold: timedelta
+    # EWMA weight of each new sample, and samples seen before a z-score is trusted
+    alpha: float
+    warmup: int
+
+    @classmethod
+    def compile(cls, rule: models.AlertRule) -> "Rule":
+        return cls(
+            id=rule.id,
+            metric_type=rule.metric_type,
+            path=tuple(rule.field.split(".")),
+            environment=rule.environment,
+            kind=rule.kind,
+            compare=COMPARATORS[rule.comparator],
+            threshold=rule.threshold,
+            hold=timedelta(seconds=rule.for_seconds),
+            alpha=2.0 / (rule.window + 1),
+            warmup=rule.window,
+        )
+
+    def read(self, value: Any) -> Optional[float]:
+        """The rule's field of a metric value, if it is a finite number"""
+        for key in self.path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            return float(value)
+        return None
+
+class _Series:
+    """Streaming state of one (rule, agent) series; constant size whatever the window"""
+    __slots__ = ("mean", "var", "samples", "last", "breach_since", "firing")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0
+        self.last: Optional[datetime] = None
+        self.breach_since: Optional[datetime] = None
+        self.firing = False
+
+    def zscore(self, value: float, alpha: float, warmup: int) -> Optional[float]:
+        """Deviation of `value` from the EWMA baseline before it, which `value` then joins"""
+        z = None
+        if self.samples >= warmup:
+            deviation = value - self.mean
+            std = math.sqrt(self.var)
+            z = deviation / std if std > 0 else (0.0 if deviation == 0 else math.copysign(math.inf, deviation))
+        if self.samples == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.samples += 1
+        return z
+
+class AlertEngine:
+    """Alert rules evaluated incrementally as metric rows commit.
+
+    Each (rule, agent) series keeps O(1) state in memory: when its condition
+    started holding and, for z-score rules, an exponentially weighted mean and
+    variance. Only transitions are stored: firing inserts an alert_events row,
+    resolving closes it. A periodic flush writes them in bulk.
+    """
+
+    def __init__(self, max_series: int):
+        self.max_series = max_series
+        self._rules: Dict[uuid.UUID, Rule] = {}
+        self._rules_by_type: Dict[str, List[Rule]] = {}
+        self._series: Dict[SeriesKey, _Series] = {}
+        self._transitions: List[Transition] = []
+        self._lock = threading.Lock()
+
+        # Counters
+        self.evaluated_samples = 0
+        self.untracked_samples = 0
+        self.fired = 0
+        self.resolved = 0
+        self.dropped_transitions = 0
+
+    def set_rules(self, rules: List[models.AlertRule]):
+        """Swap in the rule set; series of new or changed rules start over"""
+        compiled = {rule.id: Rule.compile(rule) for rule in rules if rule.enabled}
+        by_type: Dict[str, List[Rule]] = {}
+        for rule in compiled.values():
+            by_type.setdefault(rule.metric_type, []).append(rule)
+        with self._lock:
+            changed = {
+                rule_id for rule_id, rule in self._rules.items() if compiled.get(rule_id) != rule
+            }
+            if changed:
+                for key in [key for key in self._series if key[0] in changed]:
+                    del self._series[key]
+                self._transitions = [t for t in self._transitions if _series_key(t)[0] not in changed]
+            self._rules = compiled
+            self._rules_by_type = by_type
+
+    def load(self, db: Session) -> int:
+        self.set_rules(db.execute(select(models.AlertRule)).scalars().all())
+        return len(self._rules)
+
+    def warm(self, db: Session) -> int:
+        """Load the rules and mark the series of stored open alerts as firing"""
+        self.load(db)
+        events = models.AlertEvent
+        open_alerts = db.execute(
+            select(events.rule_id, events.agent_id, events.started_at).where(events.resolved_at.is_(None))
+        ).all()
+        with self._lock:
+            for rule_id, agent_id, started_at in open_alerts:
+                if rule_id in self._rules:
+                    series = self._series.setdefault((rule_id, agent_id), _Series())
+                    series.firing = True
+                    series.breach_since = started_at
+        return len(open_alerts)
+
+    def observe(self, rows: List[Dict[str, Any]]):
+        """After-commit hook: evaluate committed metric rows against the rules for their type"""
+        if not self._rules_by_type:
+            return
+        transitions: List[Transition] = []
+        with self._lock:
+            rules_by_type = self._rules_by_type
+            for row in rows:
+                rules = rules_by_type.get(row["metric_type"])
+                if not rules:
+                    continue
+                agent_id = row["agent_id"]
+                environment = None
+                for rule in rules:
+                    if rule.environment is not None:
+                        environment = environment or metric_service.cached_agent_environment(agent_id)
+                        if environment != rule.environment:
+                            continue
+                    value = rule.read(row["value"])
+                    if value is not None:
+                        self._evaluate(rule, agent_id, value, row["timestamp"], transitions)
+            self._transitions.extend(transitions)
+
+        for kind, run in groupby(transitions, key=lambda t: t[0]):
+            ALERT_TRANSITIONS.labels(kind).inc(sum(1 for _ in run))
+
+    def _evaluate(
+        self,
+        rule: Rule,
+        agent_id: uuid.UUID,
+        value: float,
+        timestamp: datetime,
+        transitions: List[Transition]
+    ):
+        key = (rule.id, agent_id)
+        series = self._series.get(key)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                self.untracked_samples += 1
+                return
+            series = self._series[key] = _Series()
+        # A late sample would rewind the for-duration clock
+        if series.last is not None and timestamp < series.last:
+            return
+        series.last = timestamp
+        self.evaluated_samples += 1
+
+        signal = value if rule.kind == THRESHOLD else series.zscore(value, rule.alpha, rule.warmup)
+        if signal is None:
+            # Baseline still warming up: neither breach nor recovery
+            return
+        if rule.compare(signal, rule.threshold):
+            if series.breach_since is None:
+                series.breach_since = timestamp
+            if not series.firing and timestamp - series.breach_since >= rule.hold:
+                series.firing = True
+                self.fired += 1
+                transitions.append((FIRED, {
+                    "id": uuid.uuid4(),
+                    "rule_id": rule.id,
+                    "agent_id": agent_id,
+                    "started_at": series.breach_since,
+                    "fired_at": timestamp,
+                    "value": value,
+                }))
+        else:
+            series.breach_since = None
+            if series.firing:
+                series.firing = False
+                self.resolved += 1
+                transitions.append((RESOLVED, {
+                    "b_rule_id": rule.id,
+                    "b_agent_id": agent_id,
+                    "b_resolved_at": timestamp,
+                    "b_resolved_value": value,
+                }))
+
+    def _write(self, db: Session, transitions: List[Transition]):
+        """One bulk statement per run of transitions of the same kind"""
+        events = models.AlertEvent.__table__
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        for kind, run in groupby(transitions, key=lambda t: t[0]):
+            rows = [row for _, row in run]
+            if kind == FIRED:
+                # Another worker may already have opened this series' alert
+                db.execute(
+                    insert(events).on_conflict_do_nothing(
+                        index_elements=["rule_id", "agent_id"],
+                        index_where=events.c.resolved_at.is_(None)
+                    ),
+                    rows
+                )
+            else:
+                db.execute(
+                    update(events)
+                    .where(events.c.rule_id == bindparam("b_rule_id"))
+                    .where(events.c.agent_id == bindparam("b_agent_id"))
+                    .where(events.c.resolved_at.is_(None))
+                    .values(
+                        resolved_at=bindparam("b_resolved_at"),
+                        resolved_value=bindparam("b_resolved_value")
+                    ),
+                    rows
+                )
+
+    def _existing(self, db: Session, transitions: List[Transition]) -> List[Transition]:
+        """The transitions whose rule and agent are both still stored"""
+        keys = [_series_key(t) for t in transitions]
+        rule_ids = set(db.execute(
+            select(models.AlertRule.id).where(models.AlertRule.id.in_({rule_id for rule_id, _ in keys}))
+        ).scalars())
+        agent_ids = metric_service.existing_agent_ids(db, {agent_id for _, agent_id in keys})
+        return [
+            t for t, (rule_id, agent_id) in zip(transitions, keys)
+            if rule_id in rule_ids and agent_id in agent_ids
+        ]
+
+    def flush(self, db: Session) -> int:
+        """Write pending transitions in order; those of deleted rules or agents are dropped"""
+        with self._lock:
+            transitions, self._transitions = self._transitions, []
+        if not transitions:
+            return 0
+        try:
+            try:
+                self._write(db, transitions)
+                db.commit()
+                return len(transitions)
+            except IntegrityError:
+                # A rule or agent was deleted after its samples were evaluated;
+                # write the rest of the batch without them
+                db.rollback()
+            remaining = self._existing(db, transitions)
+            dropped = len(transitions) - len(remaining)
+            self.dropped_transitions += dropped
+            logger.warning("Dropped %d alert transitions of deleted rules or agents", dropped)
+            self._write(db, remaining)
+            db.commit()
+            return len(remaining)
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._transitions[:0] = transitions
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules": len(self._rules),
+            "series": len(self._series),
+            "firing": sum(1 for series in self._series.values() if series.firing),
+            "pending_transitions": len(self._transitions),
+            "evaluated_samples": self.evaluated_samples,
+            "untracked_samples": self.untracked_samples,
+            "fired": self.fired,
+            "resolved": self.resolved,
+            "dropped_transitions": self.dropped_transitions,
+        }
+
+alert_engine = AlertEngine(max_series=settings.ALERT_MAX_SERIES)
+
+metric_service.after_commit_hooks.append(alert_engine.observe)
+
+def rules_changed(db: Session, rule_id: uuid.UUID, drop: bool = False):
+    """Close (or with `drop`, delete) the rule's alerts and tell other workers to reload rules"""
+    events = models.AlertEvent
+    if drop:
+        db.execute(delete(events).where(events.rule_id == rule_id))
+    else:
+        db.execute(
+            update(events)
+            .where(events.rule_id == rule_id, events.resolved_at.is_(None))
+            .values(resolved_at=datetime.utcnow())
+        )
+    if notify_enabled(db.get_bind()):
+        notify(db, NOTIFY_CHANNEL, str(rule_id))
+
+def active_alerts(
+    db: Session,
+    environment: Optional[str] = None,
+    rule_id: Optional[uuid.UUID] = None,
+    limit: int = 1000
+) -> List[Dict[str, Any]]:
+    """Open alerts, newest first, read through the open-alerts partial index"""
+    events = models.AlertEvent
+    query = select(
+        events.id,
+        events.rule_id,
+        models.AlertRule.name.label("rule_name"),
+        events.agent_id,
+        models.Agent.hostname,
+        models.Agent.environment,
+        events.value,
+        events.started_at,
+        events.fired_at,
+    ).join(models.AlertRule, models.AlertRule.id == events.rule_id).join(
+        models.Agent, models.Agent.id == events.agent_id
+    ).where(events.resolved_at.is_(None))
+    if environment:
+        query = query.where(models.Agent.environment == environment)
+    if rule_id:
+        query = query.where(events.rule_id == rule_id)
+    query = query.order_by(events.fired_at.desc(), events.id).limit(limit)
+    return [dict(row) for row in db.execute(query).mappings()]
+
+def _with_session(func):
+    db = SessionLocal()
+    try:
+        return func(db)
+    finally:
+        db.close()
+
+def warm_alerts():
+    count = _with_session(alert_engine.warm)
+    logger.info("Loaded %d open alerts", count)
+
+def flush_alerts():
+    _with_session(alert_engine.flush)
+
+def reload_alert_rules():
+    _with_session(alert_engine.load)
+
+notify_listener.listen(NOTIFY_CHANNEL, lambda payload: reload_alert_rules())
@@ -0,0 +1,518 @@
+# app/services/archive.py
+"""Cold storage of aged metrics and logs as Arrow IPC files.
+
+Rows older than the hot window move out of the database oldest first,
+each run writing one file per day and agent environment:
+    {ARCHIVE_DIR}/{table}/day=YYYY-MM-DD/environment={env}/part-HHMMSS-HHMMSS-{token}.arrow
+The two times bound the rows' timestamps, so reads skip files outside
+their window without opening them. Files are memory-mapped and filtered
+with Arrow compute when a request's window reaches past the hot data.
+"""
+import logging
+import os
+import shutil
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import orjson
+from sqlalchemy import delete, func, select, text, tuple_
+
+from ..core import instrumentation
+from ..core.database import get_engine
+from ..core.pagination import ArchiveReader, decode_cursor
+from ..config.settings import get_settings
+from ..models import models
+from . import partitions
+from .log_search import FTS_TERM
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+Cursor = Tuple[datetime, uuid.UUID]
+# Where rows of agents without an environment, or deleted agents, are archived
+UNKNOWN_ENVIRONMENT = "unknown"
+
+@dataclass(frozen=True)
+class ArchiveTable:
+    model: Any
+    # (column, Arrow type name, whether the value is JSON) in schema order
+    columns: Tuple[Tuple[str, str, bool], ...]
+    after_days: str
+
+    @property
+    def name(self) -> str:
+        return self.model.__tablename__
+
+    @property
+    def archive_after_days(self) -> int:
+        return getattr(settings, self.after_days)
+
+METRICS = ArchiveTable(
+    model=models.AgentMetric,
+    columns=(
+        ("id", "uuid", False),
+        ("agent_id", "uuid", False),
+        ("metric_type", "string", False),
+        ("value", "string", True),
+        ("timestamp", "timestamp", False),
+    ),
+    after_days="METRICS_ARCHIVE_AFTER_DAYS",
+)
+LOGS = ArchiveTable(
+    model=models.AgentLog,
+    columns=(
+        ("id", "uuid", False),
+        ("agent_id", "uuid", False),
+        ("level", "string", False),
+        ("category", "string", False),
+        ("message", "string", False),
+        ("details", "string", True),
+        ("timestamp", "timestamp", False),
+        ("repeat_count", "int32", False),
+        ("last_timestamp", "timestamp", False),
+    ),
+    after_days="LOGS_ARCHIVE_AFTER_DAYS",
+)
+TABLES = (METRICS, LOGS)
+
+def _arrow():
+    # Imported on first use; workers that never touch the archive do not pay for pyarrow
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+    return pyarrow
+
+def _schema(spec: ArchiveTable):
+    pa = _arrow()
+    types = {"uuid": pa.string(), "string": pa.string(), "timestamp": pa.timestamp("us"), "int32": pa.int32()}
+    return pa.schema([(name, types[kind]) for name, kind, _ in spec.columns])
+
+def enabled() -> bool:
+    return bool(settings.ARCHIVE_DIR)
+
+def hot_cutoff(spec: ArchiveTable, today: Optional[date] = None) -> datetime:
+    """Rows before this moment are archived on the next run"""
+    today = today or datetime.utcnow().date()
+    return datetime.combine(today - timedelta(days=spec.archive_after_days), time())
+
+def reaches_archive(spec: ArchiveTable, since: datetime) -> bool:
+    """Whether a window starting at `since` may include archived rows"""
+    return enabled() and since < hot_cutoff(spec) and os.path.isdir(_table_dir(spec))
+
+def _table_dir(spec: ArchiveTable) -> str:
+    return os.path.join(settings.ARCHIVE_DIR, spec.name)
+
+def _day_dir(spec: ArchiveTable, day: date) -> str:
+    return os.path.join(_table_dir(spec), f"day={day.isoformat()}")
+
+def _env_dir(spec: ArchiveTable, day: date, environment: str) -> str:
+    return os.path.join(_day_dir(spec, day), f"environment={quote(environment, safe='')}")
+
+def _clock(moment: datetime, day: date) -> str:
+    seconds = int((moment - datetime.combine(day, time())).total_seconds())
+    return f"{seconds // 3600:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}"
+
+def _file_span(day: date, filename: str) -> Optional[Tuple[datetime, datetime]]:
+    """[first, past-last) timestamps of a part file, from its name"""
+    try:
+        _, start, end, _ = filename.split("-", 3)
+        midnight = datetime.combine(day, time())
+        to_time = lambda hhmmss: midnight + timedelta(
+            hours=int(hhmmss[:2]), minutes=int(hhmmss[2:4]), seconds=int(hhmmss[4:6])
+        )
+        return to_time(start), to_time(end)
+    except ValueError:
+        return None
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class _DayWriter:
+    """Part files per environment for the rows of one day, published on close.
+
+    An environment's file is finished once it holds ARCHIVE_FILE_MAX_ROWS
+    rows and the next rows go to a new one.
+    """
+
+    def __init__(self, spec: ArchiveTable, day: date):
+        self.spec = spec
+        self.day = day
+        self.schema = _schema(spec)
+        self._files: Dict[str, Tuple[Any, Any, str, str]] = {}
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._spans: Dict[str, Tuple[datetime, datetime]] = {}
+        self._rows: Dict[str, int] = {}
+        self.published: List[str] = []
+
+    def add(self, environment: str, row: Dict[str, Any]):
+        pending = self._pending.setdefault(environment, [])
+        pending.append(row)
+        first, last = self._spans.get(environment, (row["timestamp"], row["timestamp"]))
+        self._spans[environment] = (min(first, row["timestamp"]), max(last, row["timestamp"]))
+        rows = self._rows[environment] = self._rows.get(environment, 0) + 1
+        if rows >= settings.ARCHIVE_FILE_MAX_ROWS:
+            self._finish(environment)
+        elif len(pending) >= settings.ARCHIVE_BATCH_ROWS:
+            self._write(environment)
+
+    def _write(self, environment: str):
+        pa = _arrow()
+        rows = self._pending.pop(environment, [])
+        if not rows:
+            return
+        if environment not in self._files:
+            directory = _env_dir(self.spec, self.day, environment)
+            os.makedirs(directory, exist_ok=True)
+            token = uuid.uuid4().hex[:8]
+            path = os.path.join(directory, f".{token}.arrow.tmp")
+            sink = open(path, "wb")
+            compression = None if settings.ARCHIVE_COMPRESSION == "none" else settings.ARCHIVE_COMPRESSION
+            writer = pa.ipc.new_file(sink, self.schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+            self._files[environment] = (sink, writer, path, token)
+        columns = {}
+        for name, kind, is_json in self.spec.columns:
+            values = [row[name] for row in rows]
+            if kind == "uuid":
+                values = [str(value) for value in values]
+            elif is_json:
+                values = [None if value is None else orjson.dumps(value).decode() for value in values]
+            columns[name] = values
+        self._files[environment][1].write_batch(pa.RecordBatch.from_pydict(columns, schema=self.schema))
+
+    def _finish(self, environment: str):
+        """Write an environment's pending rows and publish its file durably under its final name"""
+        self._write(environment)
+        sink, writer, path, token = self._files.pop(environment)
+        writer.close()
+        sink.flush()
+        os.fsync(sink.fileno())
+        sink.close()
+        first, last = self._spans.pop(environment)
+        self._rows.pop(environment, None)
+        name = f"part-{_clock(first, self.day)}-{_clock(last + timedelta(seconds=1), self.day)}-{token}.arrow"
+        final = os.path.join(os.path.dirname(path), name)
+        os.replace(path, final)
+        _fsync_dir(os.path.dirname(final))
+        self.published.append(final)
+
+    def close(self) -> List[str]:
+        """Finish every open file; returns the paths of all files published"""
+        for environment in list(self._spans):
+            self._finish(environment)
+        return self.published
+
+    def discard(self):
+        """Remove whatever this writer created, published or not"""
+        for sink, writer, path, token in self._files.values():
+            try:
+                sink.close()
+            except Exception:
+                pass
+            self.published.append(path)
+        self._files.clear()
+        for path in self.published:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.published = []
+
+def _day_rows(spec: ArchiveTable, day_start: datetime, day_end: datetime):
+    """Rows of [day_start, day_end) with their agent's environment, in (timestamp, id) order"""
+    model = spec.model
+    columns = [getattr(model, name) for name, _, _ in spec.columns]
+    return (
+        select(*columns, func.coalesce(models.Agent.environment, UNKNOWN_ENVIRONMENT).label("environment"))
+        .outerjoin(models.Agent, models.Agent.id == model.agent_id)
+        .where(model.timestamp >= day_start, model.timestamp < day_end)
+        .order_by(model.timestamp, model.id)
+    )
+
+def _export(connection, spec: ArchiveTable, day: date, query) -> Tuple["_DayWriter", int, Optional[Cursor]]:
+    """Stream `query` into part files; returns the writer, rows written and the last (timestamp, id)"""
+    result = connection.execution_options(
+        stream_results=True, yield_per=settings.ARCHIVE_BATCH_ROWS
+    ).execute(query)
+    writer = _DayWriter(spec, day)
+    moved = 0
+    last = None
+    try:
+        for rows in result.partitions():
+            for row in rows:
+                writer.add(row.environment, row._asdict())
+            moved += len(rows)
+            last = (rows[-1].timestamp, rows[-1].id)
+        writer.close()
+    except BaseException:
+        writer.discard()
+        raise
+    return writer, moved, last
+
+def _day_partition(connection, spec: ArchiveTable, day: date) -> Optional[str]:
+    """The partition holding exactly `day` of the table, if it is partitioned by day"""
+    if connection.dialect.name != "postgresql" or not partitions.is_partitioned(connection, spec.name):
+        return None
+    name = partitions.partition_name(spec.name, day)
+    return name if name in {name for name, _ in partitions.list_partitions(connection, spec.name)} else None
+
+def archive_partition(spec: ArchiveTable, day: date, partition: str) -> Optional[int]:
+    """Export a whole day's partition, then detach and drop it; returns rows moved.
+
+    Dropping the partition leaves nothing for vacuum, unlike deleting its
+    rows. The detach waits for writers of the day, and the rows counted
+    after it must be the rows exported; otherwise rows arrived meanwhile,
+    nothing is changed and None is returned.
+    """
+    day_start = datetime.combine(day, time())
+    with get_engine().connect() as connection:
+        transaction = connection.begin()
+        writer = None
+        try:
+            writer, moved, _ = _export(
+                connection, spec, day, _day_rows(spec, day_start, day_start + timedelta(days=1))
+            )
+            connection.execute(text(f'ALTER TABLE "{spec.name}" DETACH PARTITION "{partition}"'))
+            stored = connection.execute(text(f'SELECT count(*) FROM "{partition}"')).scalar()
+            if stored != moved:
+                logger.info("%s changed while it was archived; archiving its rows instead", partition)
+                writer.discard()
+                transaction.rollback()
+                return None
+            connection.execute(text(f'DROP TABLE "{partition}"'))
+            transaction.commit()
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            if transaction.is_active:
+                transaction.rollback()
+            raise
+    return moved
+
+def archive_rows(spec: ArchiveTable, day_start: datetime, day_end: datetime) -> int:
+    """Move up to ARCHIVE_FILE_MAX_ROWS of the rows in [day_start, day_end); returns rows moved.
+
+    The rows are read, written out and deleted in one transaction. Under
+    REPEATABLE READ the delete only sees the rows the read saw, so rows
+    that arrive meanwhile for the same day stay for the next run.
+    """
+    model = spec.model
+    with get_engine().connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        transaction = connection.begin()
+        writer = None
+        try:
+            writer, moved, last = _export(
+                connection, spec, day_start.date(),
+                _day_rows(spec, day_start, day_end).limit(settings.ARCHIVE_FILE_MAX_ROWS)
+            )
+            if moved:
+                connection.execute(delete(model).where(
+                    model.timestamp >= day_start,
+                    model.timestamp <= last[0],
+                    tuple_(model.timestamp, model.id) <= tuple_(*last),
+                ))
+            transaction.commit()
+        except BaseException:
+            # Files of rows that stay in the database would be read twice
+            if writer is not None:
+                writer.discard()
+            if transaction.is_active:
+                transaction.rollback()
+            raise
+    return moved
+
+def archive_oldest_day(spec: ArchiveTable, cutoff: datetime) -> int:
+    """Move the oldest day's rows before `cutoff` to the archive; returns rows moved.
+
+    A whole day with its own partition goes at once, with the partition;
+    otherwise (a partial day, or rows the default partition holds) up to
+    ARCHIVE_FILE_MAX_ROWS rows are moved and deleted row by row.
+    """
+    model = spec.model
+    with get_engine().connect() as connection:
+        first = connection.execute(
+            select(model.timestamp).where(model.timestamp < cutoff).order_by(model.timestamp).limit(1)
+        ).scalar()
+        if first is None:
+            return 0
+        day = first.date()
+        partition = _day_partition(connection, spec, day)
+    day_start = datetime.combine(day, time())
+    day_end = min(day_start + timedelta(days=1), cutoff)
+
+    moved = None
+    if partition and day_end == day_start + timedelta(days=1):
+        moved = archive_partition(spec, day, partition)
+    if moved is None:
+        moved = archive_rows(spec, day_start, day_end)
+
+    instrumentation.ROWS_ARCHIVED.labels(spec.name).inc(moved)
+    logger.info("Archived %d %s rows of %s", moved, spec.name, day)
+    return moved
+
+def expire_archive(spec: ArchiveTable, today: Optional[date] = None) -> List[str]:
+    """Delete archived days older than ARCHIVE_RETENTION_DAYS"""
+    today = today or datetime.utcnow().date()
+    cutoff = today - timedelta(days=settings.ARCHIVE_RETENTION_DAYS)
+    removed = []
+    for day in _archived_days(spec):
+        if day >= cutoff:
+            break
+        shutil.rmtree(_day_dir(spec, day), ignore_errors=True)
+        removed.append(day.isoformat())
+    return removed
+
+def archive_aged_rows():
+    """Move every table's rows past its hot window to the archive, and expire old archive days"""
+    if not enabled():
+        return
+    for spec in TABLES:
+        cutoff = hot_cutoff(spec)
+        moved = total = 0
+        while total < settings.ARCHIVE_RUN_MAX_ROWS:
+            moved = archive_oldest_day(spec, cutoff)
+            if not moved:
+                break
+            total += moved
+        removed = expire_archive(spec)
+        if removed:
+            logger.info("Expired archived %s days: %s", spec.name, removed)
+
+def _archived_days(spec: ArchiveTable) -> List[date]:
+    """Archived days of a table, oldest first"""
+    days = []
+    try:
+        entries = os.scandir(_table_dir(spec))
+    except FileNotFoundError:
+        return days
+    with entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name.startswith("day="):
+                try:
+                    days.append(date.fromisoformat(entry.name[4:]))
+                except ValueError:
+                    continue
+    return sorted(days)
+
+def _day_files(
+    spec: ArchiveTable, day: date, environment: Optional[str], since: datetime, before: Optional[datetime]
+) -> List[str]:
+    day_dir = _day_dir(spec, day)
+    if environment is not None:
+        directories = [_env_dir(spec, day, environment)]
+    else:
+        try:
+            directories = [entry.path for entry in os.scandir(day_dir) if entry.is_dir()]
+        except FileNotFoundError:
+            return []
+    files = []
+    for directory in directories:
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for name in names:
+            span = _file_span(day, name) if name.endswith(".arrow") else None
+            if span is None or span[1] <= since or (before is not None and span[0] > before):
+                continue
+            files.append(os.path.join(directory, name))
+    return files
+
+def _condition(pc, table, filters: Dict[str, Any], since: datetime, cursor: Optional[Cursor], q: Optional[str]):
+    pa = _arrow()
+    timestamp = pa.scalar(since, pa.timestamp("us"))
+    mask = pc.greater_equal(table["timestamp"], timestamp)
+    for name, value in filters.items():
+        if value is not None:
+            mask = pc.and_(mask, pc.equal(table[name], str(value)))
+    if cursor:
+        cursor_time = pa.scalar(cursor[0], pa.timestamp("us"))
+        mask = pc.and_(mask, pc.or_(
+            pc.less(table["timestamp"], cursor_time),
+            pc.and_(pc.equal(table["timestamp"], cursor_time), pc.less(table["id"], str(cursor[1])))
+        ))
+    if q:
+        # FTS terms as case-insensitive substrings of the message or details
+        text = pc.binary_join_element_wise(table["message"], pc.fill_null(table["details"], ""), " ")
+        for negated, phrase, word in FTS_TERM.findall(q):
+            term = (phrase or word).strip()
+            if term:
+                found = pc.match_substring(text, term, ignore_case=True)
+                mask = pc.and_(mask, pc.invert(found) if negated else found)
+    return mask
+
+def _to_rows(spec: ArchiveTable, table) -> List[Dict[str, Any]]:
+    rows = table.to_pylist()
+    for row in rows:
+        for name, kind, is_json in spec.columns:
+            value = row[name]
+            if value is None:
+                continue
+            if kind == "uuid":
+                row[name] = uuid.UUID(value)
+            elif is_json:
+                row[name] = orjson.loads(value)
+    return rows
+
+def read_newest(
+    spec: ArchiveTable,
+    since: datetime,
+    filters: Dict[str, Any],
+    cursor: Optional[Cursor] = None,
+    limit: Optional[int] = None,
+    environment: Optional[str] = None,
+    q: Optional[str] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Archived rows matching `filters` from `since` on, newest first, one day per batch.
+
+    Rows are ordered like the database pages, on (timestamp, id) descending,
+    and resume after `cursor`; `filters` compare columns for equality.
+    """
+    pa = _arrow()
+    pc = pa.compute
+    before = cursor[0] if cursor else None
+    remaining = limit
+    for day in reversed(_archived_days(spec)):
+        if datetime.combine(day, time()) + timedelta(days=1) <= since:
+            break
+        if before is not None and datetime.combine(day, time()) > before:
+            continue
+        matched = []
+        for path in _day_files(spec, day, environment, since, before):
+            # Uncompressed files are read without copying; the map lives as long as its buffers
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            table = table.filter(_condition(pc, table, filters, since, cursor, q))
+            if table.num_rows:
+                matched.append(table)
+        if not matched:
+            continue
+        table = pa.concat_tables(matched).sort_by([("timestamp", "descending"), ("id", "descending")])
+        if remaining is not None:
+            table = table.slice(0, remaining)
+            remaining -= table.num_rows
+        yield _to_rows(spec, table)
+        if remaining is not None and remaining <= 0:
+            return
+
+def reader(
+    spec: ArchiveTable,
+    since: datetime,
+    filters: Dict[str, Any],
+    cursor: Optional[str] = None,
+    environment: Optional[str] = None,
+    q: Optional[str] = None,
+) -> ArchiveReader:
+    """read_newest bound to one listing request, for pagination's `archived` readers"""
+    position = decode_cursor(cursor) if cursor else None
+    return ArchiveReader(
+        read=lambda limit: read_newest(spec, since, filters, position, limit, environment, q),
+        before=hot_cutoff(spec)
+    )
@@ -0,0 +1,161 @@
+# app/services/config_bundles.py
+import asyncio
+import hashlib
+import json
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from ..core import pagination
+from ..core.cache import SingleFlightCache
+from ..core.codecs import dumps
+from ..core.database import AsyncSessionLocal
+from ..core.notify import notify, notify_enabled, notify_listener
+from ..config.settings import get_settings
+from ..models import models
+from ..schemas import schemas
+
+settings = get_settings()
+
+NOTIFY_CHANNEL = "agent_config_changed"
+CONFIG_COLUMNS = pagination.schema_columns(schemas.NginxConfig, models.NginxConfig)
+
+@dataclass(frozen=True)
+class ConfigBundle:
+    """An agent's rendered config list at one revision"""
+    revision: int
+    etag: str
+    body: bytes
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match semantics: weak comparison, comma-separated lists and *"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def _render(revision: int, configs) -> ConfigBundle:
+    body = b"[" + b",".join(map(dumps, configs)) + b"]"
+    digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+    return ConfigBundle(revision=revision, etag=f'"{revision}-{digest}"', body=body)
+
+class ConfigDistributor:
+    """Per-agent config bundles served from memory until the agent's revision moves.
+
+    Every config change bumps agents.config_revision in its own transaction;
+    on commit the cached bundle is dropped and long-polling fetches wake up,
+    in this worker directly and in the others through NOTIFY.
+    """
+
+    def __init__(self, cache_size: int, ttl: float):
+        self.bundles = SingleFlightCache(max_size=cache_size, ttl=ttl)
+        # Newest revision this worker has been told about, per agent
+        self._latest: Dict[uuid.UUID, int] = {}
+        self._changed: Dict[uuid.UUID, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        for changed in self._changed.values():
+            changed.set()
+        self._changed.clear()
+        self._loop = None
+
+    async def _load(self, agent_id: uuid.UUID) -> Optional[ConfigBundle]:
+        # One statement, so the revision and the configs come from the same snapshot
+        query = select(models.Agent.config_revision, *CONFIG_COLUMNS).select_from(
+            models.Agent
+        ).outerjoin(
+            models.NginxConfig, models.NginxConfig.agent_id == models.Agent.id
+        ).where(models.Agent.id == agent_id).order_by(
+            models.NginxConfig.name, models.NginxConfig.id
+        )
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+        if not rows:
+            return None
+        names = [column.key for column in CONFIG_COLUMNS]
+        configs = [dict(zip(names, row[1:])) for row in rows if row.id is not None]
+        return _render(rows[0].config_revision, configs)
+
+    async def bundle(self, agent_id: uuid.UUID) -> Optional[ConfigBundle]:
+        """The agent's current bundle, or None if there is no such agent"""
+        bundle = await self.bundles.get_or_compute(agent_id, lambda: self._load(agent_id))
+        if bundle is not None and bundle.revision < self._latest.get(agent_id, 0):
+            # Loaded just before a change committed; the reload sees it
+            self.bundles.cache.pop(agent_id)
+            bundle = await self.bundles.get_or_compute(agent_id, lambda: self._load(agent_id))
+        return bundle
+
+    async def wait_for_change(
+        self, agent_id: uuid.UUID, revision: int, timeout: float
+    ) -> Optional[ConfigBundle]:
+        """The agent's bundle once its revision passes `revision`, or the current one on timeout"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Taken before the check so a change landing in between still wakes us
+            changed = self._changed.setdefault(agent_id, asyncio.Event())
+            bundle = await self.bundle(agent_id)
+            remaining = deadline - loop.time()
+            # Without a running distributor nothing would wake us, so do not wait
+            if bundle is None or bundle.revision > revision or remaining <= 0 or self._loop is None:
+                return bundle
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return bundle
+
+    def changed(self, agent_id: uuid.UUID, revision: int):
+        """Drop the agent's cached bundle and wake its long-polls; callable from any thread"""
+        if revision > self._latest.get(agent_id, 0):
+            self._latest[agent_id] = revision
+        self.bundles.cache.pop(agent_id)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake, agent_id)
+
+    def _wake(self, agent_id: uuid.UUID):
+        changed = self._changed.pop(agent_id, None)
+        if changed is not None:
+            changed.set()
+
+config_bundles = ConfigDistributor(
+    cache_size=settings.CONFIG_CACHE_SIZE,
+    ttl=settings.CONFIG_CACHE_TTL
+)
+
+def bump_revision(db: Session, agent_id: uuid.UUID) -> int:
+    """Advance the agent's config revision in the caller's transaction"""
+    revision = db.execute(
+        update(models.Agent)
+        .where(models.Agent.id == agent_id)
+        .values(config_revision=models.Agent.config_revision + 1)
+        .returning(models.Agent.config_revision)
+    ).scalar_one()
+    db.info.setdefault("config_revisions", {})[agent_id] = revision
+    if notify_enabled(db.get_bind()):
+        notify(db, NOTIFY_CHANNEL, json.dumps({"agent_id": str(agent_id), "revision": revision}))
+    return revision
+
+@event.listens_for(Session, "after_commit")
+def _publish_config_changes(session):
+    for agent_id, revision in session.info.pop("config_revisions", {}).items():
+        config_bundles.changed(agent_id, revision)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_config_changes(session):
+    session.info.pop("config_revisions", None)
+
+def _on_config_notify(payload: str):
+    change = json.loads(payload)
+    config_bundles.changed(uuid.UUID(change["agent_id"]), change["revision"])
+
+notify_listener.listen(NOTIFY_CHANNEL, _on_config_notify)
@@ -0,0 +1,124 @@
+# app/services/fleet.py
+import logging
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionLocal
+from ..config.settings import get_settings
+from ..models import models
+from .heartbeats import heartbeats
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+UNKNOWN = "unknown"
+# Agents registered by other workers are picked up from this far behind the newest one seen
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+def _facet_value(value: Any) -> str:
+    return UNKNOWN if value is None or value == "" else str(value)
+
+class FleetSnapshot:
+    """Agent counts by environment, status, version and selected os_info keys.
+
+    Loaded once at startup, then kept current incrementally: registrations in
+    this worker are added as they commit, status changes arrive from the
+    heartbeat tracker, and a periodic refresh picks up agents registered by
+    other workers and check-ins other workers recorded. Reading the counts
+    never touches the database.
+    """
+
+    def __init__(self, os_info_keys: List[str]):
+        self.facets = ["environment", "status", "version"] + [f"os_info.{key}" for key in os_info_keys]
+        self.os_info_keys = os_info_keys
+        self._agents: Dict[uuid.UUID, Tuple[str, ...]] = {}
+        self._counts: Dict[str, Counter] = {facet: Counter() for facet in self.facets}
+        self._newest: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self.refreshed_at: Optional[datetime] = None
+
+    def _values(self, agent: Dict[str, Any]) -> Tuple[str, ...]:
+        os_info = agent.get("os_info") or {}
+        if not isinstance(os_info, dict):
+            os_info = {}
+        live = heartbeats.live(agent["id"])
+        return (
+            _facet_value(agent.get("environment")),
+            _facet_value(live[1] if live else agent.get("status")),
+            _facet_value(agent.get("version")),
+            *(_facet_value(os_info.get(key)) for key in self.os_info_keys),
+        )
+
+    def add(self, agents: Iterable[Dict[str, Any]]) -> int:
+        """Count agents not seen before; returns how many were new"""
+        added = 0
+        with self._lock:
+            for agent in agents:
+                created_at = agent.get("created_at")
+                if created_at and (self._newest is None or created_at > self._newest):
+                    self._newest = created_at
+                if agent["id"] in self._agents:
+                    continue
+                values = self._agents[agent["id"]] = self._values(agent)
+                for facet, value in zip(self.facets, values):
+                    self._counts[facet][value] += 1
+                added += 1
+        return added
+
+    def status_changed(self, agent_id: uuid.UUID, status: str):
+        """Heartbeat hook: move the agent between status counts"""
+        with self._lock:
+            values = self._agents.get(agent_id)
+            if values is None or values[1] == status:
+                return
+            counts = self._counts["status"]
+            counts[values[1]] -= 1
+            if not counts[values[1]]:
+                del counts[values[1]]
+            counts[status] += 1
+            self._agents[agent_id] = (values[0], status, *values[2:])
+
+    def refresh(self, db: Session) -> int:
+        """Add agents registered since the newest one counted; the first call loads them all.
+
+        Statuses are brought up to date first, through the heartbeat
+        tracker's status listeners, since with agent affinity most
+        heartbeats reach other workers.
+        """
+        heartbeats.sync(db)
+        query = select(
+            models.Agent.id, models.Agent.environment, models.Agent.status,
+            models.Agent.version, models.Agent.os_info, models.Agent.created_at
+        )
+        if self._newest is not None:
+            query = query.where(models.Agent.created_at >= self._newest - REFRESH_OVERLAP)
+        added = self.add(dict(row) for row in db.execute(query).mappings())
+        self.refreshed_at = datetime.utcnow()
+        return added
+
+    def counts(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total": len(self._agents),
+                "refreshed_at": self.refreshed_at,
+                "facets": {facet: dict(counts) for facet, counts in self._counts.items()},
+            }
+
+fleet_snapshot = FleetSnapshot(os_info_keys=settings.FLEET_FACET_OS_INFO_KEYS)
+
+heartbeats.status_listeners.append(fleet_snapshot.status_changed)
+
+def refresh_fleet_snapshot():
+    db = SessionLocal()
+    try:
+        added = fleet_snapshot.refresh(db)
+    finally:
+        db.close()
+    if added:
+        logger.info("Fleet snapshot counted %d new agents", added)
@@ -0,0 +1,209 @@
+# app/services/heartbeats.py
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, String, bindparam, column, or_, select, update, values
+from sqlalchemy.orm import Session
+
+from ..core.cluster import leadership
+from ..core.database import SessionLocal
+from ..config.settings import get_settings
+from ..models import models
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+REGISTERED = "registered"
+ONLINE = "online"
+STALE = "stale"
+OFFLINE = "offline"
+
+class HeartbeatTracker:
+    """In-memory last_seen/status per agent, written to `agents` in periodic bulk updates"""
+
+    def __init__(self, stale_after: float, offline_after: float):
+        self.stale_after = timedelta(seconds=stale_after)
+        self.offline_after = timedelta(seconds=offline_after)
+        self._seen: Dict[uuid.UUID, Tuple[datetime, str]] = {}
+        # Agents whose last_seen/status changed since the last flush
+        self._dirty: Dict[uuid.UUID, Tuple[datetime, str]] = {}
+        self._lock = threading.Lock()
+        # Called with (agent_id, status) whenever an agent's in-memory status changes
+        self.status_listeners: List[Callable[[uuid.UUID, str], None]] = []
+
+    def beat(self, agent_id: uuid.UUID, at: Optional[datetime] = None) -> Tuple[datetime, str]:
+        """Record a check-in; only touches memory"""
+        at = at or datetime.utcnow()
+        with self._lock:
+            current = self._seen.get(agent_id)
+            if current and current[0] > at:
+                at = current[0]
+            self._seen[agent_id] = self._dirty[agent_id] = (at, ONLINE)
+            if current is None or current[1] != ONLINE:
+                self._status_changed(agent_id, ONLINE)
+        return at, ONLINE
+
+    def _status_changed(self, agent_id: uuid.UUID, status: str):
+        for listener in self.status_listeners:
+            try:
+                listener(agent_id, status)
+            except Exception:
+                logger.exception("Heartbeat status listener %r failed", listener)
+
+    def live(self, agent_id: uuid.UUID) -> Optional[Tuple[datetime, str]]:
+        """Last seen time and status from the in-memory view, if this process knows the agent"""
+        return self._seen.get(agent_id)
+
+    def warm(self, db: Session) -> int:
+        """Load last_seen and status for every agent, in one query"""
+        self._merge_stored(db, notify=False)
+        return len(self._seen)
+
+    def sync(self, db: Session) -> int:
+        """Adopt check-ins other workers wrote since this view last saw the agent.
+
+        Agents checking in elsewhere (another worker owns them) would
+        otherwise keep the status this worker last saw, offline included.
+        Returns how many statuses changed.
+        """
+        return self._merge_stored(db, notify=True)
+
+    def _merge_stored(self, db: Session, notify: bool) -> int:
+        rows = db.execute(select(models.Agent.id, models.Agent.last_seen, models.Agent.status))
+        changed = 0
+        with self._lock:
+            for agent_id, last_seen, status in rows:
+                current = self._seen.get(agent_id)
+                if current is None or (last_seen and last_seen > current[0]):
+                    entry = self._seen[agent_id] = (last_seen or datetime.min, status or REGISTERED)
+                    if notify and current is not None and current[1] != entry[1]:
+                        self._status_changed(agent_id, entry[1])
+                        changed += 1
+        return changed
+
+    def _take_dirty(self) -> Dict[uuid.UUID, Tuple[datetime, str]]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return dirty
+
+    def _restore_dirty(self, dirty: Dict[uuid.UUID, Tuple[datetime, str]]):
+        with self._lock:
+            for agent_id, entry in dirty.items():
+                newer = self._dirty.get(agent_id)
+                if newer is None or newer[0] < entry[0]:
+                    self._dirty[agent_id] = entry
+
+    def flush(self, db: Session) -> int:
+        """Write pending check-ins as one UPDATE ... FROM (VALUES ...); newest last_seen wins"""
+        dirty = self._take_dirty()
+        if not dirty:
+            return 0
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                pending = values(
+                    column("id", models.Agent.id.type),
+                    column("last_seen", DateTime),
+                    column("status", String),
+                    name="pending"
+                ).data([(agent_id, at, status) for agent_id, (at, status) in dirty.items()])
+                db.execute(
+                    update(models.Agent)
+                    .where(models.Agent.id == pending.c.id)
+                    .where(or_(
+                        models.Agent.last_seen.is_(None),
+                        models.Agent.last_seen <= pending.c.last_seen
+                    ))
+                    .values(last_seen=pending.c.last_seen, status=pending.c.status)
+                )
+            else:
+                # SQLite has no column-aliased VALUES; an executemany is its nearest equivalent
+                agents = models.Agent.__table__
+                db.execute(
+                    agents.update()
+                    .where(agents.c.id == bindparam("agent_id"))
+                    .where(or_(agents.c.last_seen.is_(None), agents.c.last_seen <= bindparam("seen")))
+                    .values(last_seen=bindparam("seen"), status=bindparam("new_status")),
+                    [
+                        {"agent_id": agent_id, "seen": at, "new_status": status}
+                        for agent_id, (at, status) in dirty.items()
+                    ]
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore_dirty(dirty)
+            raise
+        return len(dirty)
+
+    def sweep(self, db: Session, now: Optional[datetime] = None, persist: bool = True) -> Dict[str, int]:
+        """Downgrade agents that stopped checking in to stale/offline.
+
+        Every worker sweeps its own view; only with `persist` are the new
+        statuses queued for writing, so one worker writes them per cluster.
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            candidates = {
+                agent_id: entry for agent_id, entry in self._seen.items()
+                if entry[1] in (ONLINE, STALE) and now - entry[0] >= self.stale_after
+            }
+        if not candidates:
+            return {}
+
+        # Other workers may have seen these agents more recently; one read settles it
+        stored = dict(db.execute(
+            select(models.Agent.id, models.Agent.last_seen).where(models.Agent.id.in_(candidates))
+        ).all())
+
+        changed: Dict[str, int] = {}
+        with self._lock:
+            for agent_id, (seen, status) in candidates.items():
+                if stored.get(agent_id) and stored[agent_id] > seen:
+                    seen = stored[agent_id]
+                current = self._seen.get(agent_id)
+                if current and current[0] > seen:
+                    continue
+                age = now - seen
+                if age >= self.offline_after:
+                    new_status = OFFLINE
+                elif age >= self.stale_after:
+                    new_status = STALE
+                else:
+                    new_status = ONLINE
+                self._seen[agent_id] = (seen, new_status)
+                if new_status != status:
+                    if persist:
+                        self._dirty[agent_id] = (seen, new_status)
+                    self._status_changed(agent_id, new_status)
+                    changed[new_status] = changed.get(new_status, 0) + 1
+        return changed
+
+heartbeats = HeartbeatTracker(
+    stale_after=settings.HEARTBEAT_STALE_SECONDS,
+    offline_after=settings.HEARTBEAT_OFFLINE_SECONDS
+)
+
+def _with_session(func):
+    db = SessionLocal()
+    try:
+        return func(db)
+    finally:
+        db.close()
+
+def warm_heartbeats():
+    count = _with_session(heartbeats.warm)
+    logger.info("Loaded heartbeat state for %d agents", count)
+
+def flush_heartbeats():
+    _with_session(heartbeats.flush)
+
+def sweep_heartbeats():
+    persist = leadership.holds("heartbeat-sweep")
+    changed = _with_session(lambda db: heartbeats.sweep(db, persist=persist))
+    if changed:
+        logger.info("Heartbeat sweep changed statuses: %s", changed)
+        if persist:
+            flush_heartbeats()
@@ -0,0 +1,190 @@
+# app/services/idempotency.py
+"""Retry-safe ingest: a resubmitted sample is stored once.
+
+Agents key a request with an Idempotency-Key header, or each sample with
+its sequence number `seq`. Sequence numbers restart with the agent, so
+they key a sample only together with the X-Agent-Session header, an id
+the agent picks anew each time it starts. The rows of a keyed submission get
+ids derived from the agent and key, so a retry rebuilds the same rows and
+the primary key (id, timestamp) turns the second insert into a no-op
+under ON CONFLICT DO NOTHING. Before that, a window of recent keys hands
+in-flight retries the rows of the first attempt, timestamps included,
+or, for writes that are not safe to repeat, tells them it is in flight,
+and answers retries of committed submissions with the first response
+without touching the database. Past the window, only samples that carry
+their own timestamp are recognised, as a server-assigned one differs.
+"""
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert as sa_insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..core.cache import TTLCache, MISSING
+from ..config.settings import get_settings
+
+settings = get_settings()
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+SESSION_HEADER = "X-Agent-Session"
+# Ids of keyed rows are version 5 UUIDs in this namespace; other rows get uuid4
+ROW_ID_NAMESPACE = uuid.UUID("4f8d2c51-9a3e-4c7b-8e06-2b1f5d7a9c34")
+# Response of an exclusive claim whose key's first attempt is still being written
+IN_FLIGHT = object()
+
+Rows = List[Dict[str, Any]]
+Claim = Tuple[str, str]
+
+def key_scope(kind: str, agent_id: Optional[uuid.UUID]) -> str:
+    """Keys are unique per agent and kind of submission"""
+    return f"{kind}:{agent_id}"
+
+def caller_scope(kind: str, caller_id: str) -> str:
+    """Request keys of fleet-wide batches are unique per caller, whatever agents they carry"""
+    return f"{kind}:batch-from:{caller_id}"
+
+def submission_key(
+    idempotency_key: Optional[str], seq: Optional[int] = None, session: Optional[str] = None
+) -> Optional[str]:
+    """The key a submission is deduplicated on: the header if sent, else the session's seq"""
+    if idempotency_key:
+        return f"key:{idempotency_key}"
+    if seq is not None and session:
+        return f"seq:{session}:{seq}"
+    return None
+
+def is_keyed(row: Dict[str, Any]) -> bool:
+    """Whether a row belongs to a keyed submission, and so may already be stored"""
+    return row["id"].version == 5
+
+def assign_ids(scope: str, key: str, rows: Rows) -> Rows:
+    """Give rows ids that depend only on the submission, so every retry has the same ones"""
+    for index, row in enumerate(rows):
+        row["id"] = uuid.uuid5(ROW_ID_NAMESPACE, f"{scope}/{key}/{index}")
+    return rows
+
+def insert_rows(db: Session, model, rows: Rows) -> Rows:
+    """Insert rows in bulk, skipping keyed rows already stored; returns the rows inserted"""
+    keyed = [row for row in rows if is_keyed(row)]
+    plain = [row for row in rows if not is_keyed(row)] if keyed else rows
+    table = model.__table__
+    if plain:
+        db.execute(sa_insert(table), plain)
+    if not keyed:
+        return rows
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stored = set(db.execute(
+        insert(table).on_conflict_do_nothing(index_elements=["id", "timestamp"]).returning(table.c.id),
+        keyed
+    ).scalars())
+    return plain + [row for row in keyed if row["id"] in stored]
+
+class RecentKeys:
+    """Bounded window of recent submission keys, each with its rows and, once stored, its response"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._entries = TTLCache(max_size=max_size, ttl=ttl)
+        self.duplicates = 0
+
+    def claim(self, scope: str, key: str, rows: Rows, exclusive: bool = False) -> Tuple[Rows, Any]:
+        """The rows to write for a keyed submission, and its response or MISSING.
+
+        The first claim of a key keeps `rows`; a retry gets those same rows
+        back, so concurrent attempts write identical (id, timestamp) pairs.
+        An `exclusive` retry of a key still in flight gets IN_FLIGHT instead,
+        for writes that must happen once, such as those counting log repeats.
+        """
+        entry = [assign_ids(scope, key, rows), MISSING]
+        claimed = self._entries.get_or_set((scope, key), entry)
+        rows, response = claimed
+        if response is MISSING and exclusive and claimed is not entry:
+            response = IN_FLIGHT
+        if response is not MISSING:
+            self.duplicates += 1
+        return rows, response
+
+    def response(self, scope: str, key: str) -> Any:
+        """The response of a stored keyed submission, or MISSING; claims nothing"""
+        entry = self._entries.get((scope, key))
+        response = MISSING if entry is MISSING else entry[1]
+        if response is not MISSING:
+            self.duplicates += 1
+        return response
+
+    def complete(self, scope: str, key: str, response: Any):
+        """Record the response retries of this key get from now on"""
+        entry = self._entries.get((scope, key))
+        if entry is not MISSING:
+            # The rows are no longer needed once retries are answered from memory
+            entry[:] = [None, response]
+
+    def release(self, scope: str, key: str):
+        """Forget a key whose submission failed, so its retry is a fresh attempt"""
+        self._entries.pop((scope, key))
+
+    def claim_items(self, scope_items: Sequence[Tuple[str, Optional[str], Rows]]) -> Tuple[Rows, int, List[Claim]]:
+        """Claim each (scope, key, rows) item of a batch; unkeyed items pass through.
+
+        Returns the rows to write, the number of items already stored, and
+        the claims to complete or release with the batch.
+        """
+        rows: Rows = []
+        duplicates = 0
+        claims: List[Claim] = []
+        for scope, key, item_rows in scope_items:
+            if key is None:
+                rows.extend(item_rows)
+                continue
+            item_rows, response = self.claim(scope, key, item_rows)
+            if response is not MISSING:
+                duplicates += 1
+                continue
+            rows.extend(item_rows)
+            claims.append((scope, key))
+        return rows, duplicates, claims
+
+    def claim_batch(
+        self,
+        scope: str,
+        request_key: Optional[str],
+        items: Sequence[Tuple[str, Optional[str], Rows]],
+        exclusive: bool = False
+    ) -> Tuple[Rows, int, List[Claim], Any]:
+        """Claim a batch as a whole by its request key if it has one, else item by item.
+
+        Returns claim_items' rows, duplicates and claims, and the stored
+        response of the whole batch, IN_FLIGHT, or MISSING.
+        """
+        if request_key:
+            rows, response = self.claim(
+                scope, request_key, [row for _, _, item_rows in items for row in item_rows], exclusive
+            )
+            return rows, 0, [(scope, request_key)], response
+        return (*self.claim_items(items), MISSING)
+
+    def settle_later(self, claims: List[Claim], response: Any) -> Callable[[bool], None]:
+        """Callback for write-behind submissions: complete the claims once their rows are
+        stored, or release them if the write failed so a retry is written again"""
+        def settle(stored: bool):
+            if stored:
+                self.complete_all(claims, response)
+            else:
+                self.release_all(claims)
+        return settle
+
+    def complete_all(self, claims: List[Claim], response: Any = True):
+        for scope, key in claims:
+            self.complete(scope, key, response)
+
+    def release_all(self, claims: List[Claim]):
+        for scope, key in claims:
+            self.release(scope, key)
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": len(self._entries), "duplicates": self.duplicates}
+
+recent_keys = RecentKeys(
+    max_size=settings.IDEMPOTENCY_WINDOW_SIZE,
+    ttl=settings.IDEMPOTENCY_WINDOW_SECONDS
+)
@@ -0,0 +1,213 @@
+# app/services/ingest_queue.py
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ..core.database import SessionLocal
+from ..config.settings import get_settings
+from . import metric_service, log_service
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+METRIC = "metric"
+LOG = "log"
+
+_STOP = object()
+
+class _Submission:
+    """Rows of one submission, which may be flushed in several batches"""
+    __slots__ = ("remaining", "stored", "done")
+
+    def __init__(self, rows: int, done: Callable[[bool], None]):
+        self.remaining = rows
+        self.stored = True
+        self.done = done
+
+    def settle(self, stored: bool):
+        self.stored = self.stored and stored
+        self.remaining -= 1
+        if self.remaining == 0:
+            try:
+                self.done(self.stored)
+            except Exception:
+                logger.exception("Ingest submission callback failed")
+
+class IngestQueue:
+    """Bounded write-behind queue that batches metric and log rows into the database.
+
+    Submissions are acknowledged as soon as their rows are queued; a single
+    background task flushes the queue when a batch fills up or the flush
+    interval elapses, whichever comes first.
+    """
+
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = True
+
+        # Counters
+        self.enqueued_rows = 0
+        self.rejected_rows = 0
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """Start the background flusher"""
+        if self._task:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting rows and flush everything already queued"""
+        if not self._task:
+            return
+        self._closed = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def enqueue(
+        self, kind: str, rows: List[Dict[str, Any]], done: Optional[Callable[[bool], None]] = None
+    ) -> bool:
+        """Queue rows for writing; returns False if the queue cannot take all of them.
+
+        `done`, if given, is called from the flusher thread once every row is
+        written, with whether they were all stored.
+        """
+        if self._closed:
+            return False
+        if self._queue.qsize() + len(rows) > self.max_size:
+            self.rejected_rows += len(rows)
+            return False
+        submission = _Submission(len(rows), done) if done and rows else None
+        for row in rows:
+            self._queue.put_nowait((kind, row, submission))
+        self.enqueued_rows += len(rows)
+        if done and not rows:
+            done(True)
+        return True
+
+    def submit(
+        self, kind: str, rows: List[Dict[str, Any]], done: Optional[Callable[[bool], None]] = None
+    ) -> int:
+        """Queue rows or raise 429 with Retry-After when the queue is full"""
+        if not self.enqueue(kind, rows, done):
+            headers = {"Retry-After": str(settings.INGEST_RETRY_AFTER)}
+            if self._closed:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Ingestion is shutting down",
+                    headers=headers
+                )
+            raise HTTPException(
+                status_code=429,
+                detail="Ingestion queue is full",
+                headers=headers
+            )
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.depth,
+            "queue_max_size": self.max_size,
+            "enqueued_rows": self.enqueued_rows,
+            "rejected_rows": self.rejected_rows,
+            "flushed_rows": self.flushed_rows,
+            "dropped_rows": self.dropped_rows,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "flush_seconds_avg": (
+                self.flush_seconds_total / self.flush_count if self.flush_count else 0.0
+            ),
+            "flush_seconds_max": self.flush_seconds_max,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0 or self._closed:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await asyncio.to_thread(self._flush, batch)
+
+    def _flush(self, batch: List[Tuple[str, Dict[str, Any], Optional[_Submission]]]):
+        """Write one batch in a single transaction (runs in a worker thread)"""
+        started = time.perf_counter()
+        db = SessionLocal()
+        stored = False
+        try:
+            # Rows for unknown agents would fail the foreign key for the whole batch
+            known_agents = metric_service.existing_agent_ids(
+                db, {row["agent_id"] for _, row, _ in batch}
+            )
+            metric_rows = [row for kind, row, _ in batch if kind == METRIC and row["agent_id"] in known_agents]
+            log_rows = [row for kind, row, _ in batch if kind == LOG and row["agent_id"] in known_agents]
+
+            metric_service.insert_metric_rows(db, metric_rows)
+            log_service.insert_log_rows(db, log_rows)
+            db.commit()
+
+            self.flushed_rows += len(metric_rows) + len(log_rows)
+            self.dropped_rows += len(batch) - len(metric_rows) - len(log_rows)
+            stored = True
+        except Exception:
+            db.rollback()
+            self.flush_errors += 1
+            self.dropped_rows += len(batch)
+            logger.exception("Failed to flush %d queued rows", len(batch))
+        finally:
+            db.close()
+        for _, _, submission in batch:
+            if submission is not None:
+                submission.settle(stored)
+
+        elapsed = time.perf_counter() - started
+        self.flush_count += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+        self.last_flush_seconds = elapsed
+
+ingest_queue = IngestQueue(
+    max_size=settings.INGEST_QUEUE_MAX_SIZE,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL
+)
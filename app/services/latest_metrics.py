@@ -0,0 +1,163 @@
+# app/services/latest_metrics.py
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionLocal
+from ..core.notify import (
+    MAX_PAYLOAD_BYTES, chunk_payloads, json_default, notify, notify_enabled, notify_listener
+)
+from ..config.settings import get_settings
+from ..models import models
+from . import metric_service
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+NOTIFY_CHANNEL = "agent_metrics_latest"
+
+def _sample(row) -> Dict[str, Any]:
+    """Normalize an insert row or ORM object into a stored sample"""
+    get = row.get if isinstance(row, dict) else lambda key: getattr(row, key)
+    return {
+        "id": str(get("id")),
+        "agent_id": str(get("agent_id")),
+        "metric_type": get("metric_type"),
+        "value": get("value"),
+        "timestamp": get("timestamp"),
+    }
+
+class LatestMetricStore:
+    """Process-local newest sample per (agent_id, metric_type)"""
+
+    def __init__(self):
+        self._samples: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, rows) -> List[Dict[str, Any]]:
+        """Apply samples, keeping the newest per series; returns the samples that won"""
+        newest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for row in rows:
+            sample = _sample(row)
+            key = (sample["agent_id"], sample["metric_type"])
+            current = newest.get(key)
+            if current is None or sample["timestamp"] >= current["timestamp"]:
+                newest[key] = sample
+
+        applied = []
+        with self._lock:
+            for key, sample in newest.items():
+                current = self._samples.get(key)
+                if current is None or sample["timestamp"] >= current["timestamp"]:
+                    self._samples[key] = sample
+                    applied.append(sample)
+        return applied
+
+    def get(self, agent_id: str, metric_type: str) -> Optional[Dict[str, Any]]:
+        return self._samples.get((str(agent_id), metric_type))
+
+    def snapshot(self, metric_type: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Newest sample of every metric type for every agent"""
+        fleet: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with self._lock:
+            samples = list(self._samples.values())
+        for sample in samples:
+            if metric_type and sample["metric_type"] != metric_type:
+                continue
+            fleet.setdefault(sample["agent_id"], {})[sample["metric_type"]] = sample
+        return fleet
+
+    def warm(self, db: Session, hours: int):
+        """Load the newest sample of every series seen within the last `hours`"""
+        newest = db.query(
+            models.AgentMetric.agent_id,
+            models.AgentMetric.metric_type,
+            func.max(models.AgentMetric.timestamp).label("timestamp")
+        ).filter(
+            models.AgentMetric.timestamp >= datetime.utcnow() - timedelta(hours=hours)
+        ).group_by(
+            models.AgentMetric.agent_id,
+            models.AgentMetric.metric_type
+        ).subquery()
+
+        rows = db.query(models.AgentMetric).join(
+            newest,
+            (models.AgentMetric.agent_id == newest.c.agent_id)
+            & (models.AgentMetric.metric_type == newest.c.metric_type)
+            & (models.AgentMetric.timestamp == newest.c.timestamp)
+        ).yield_per(1000)
+        self.update(rows)
+
+    def load_series(self, db: Session, agent_id, metric_type: str) -> Optional[Dict[str, Any]]:
+        """Read one series from the database into the store"""
+        agent_id = metric_service.parse_agent_id(agent_id)
+        if agent_id is None:
+            return None
+        metric = db.query(models.AgentMetric).filter(
+            models.AgentMetric.agent_id == agent_id,
+            models.AgentMetric.metric_type == metric_type
+        ).order_by(models.AgentMetric.timestamp.desc()).first()
+        if metric is None:
+            return None
+        self.update([metric])
+        return self.get(agent_id, metric_type)
+
+latest_metrics = LatestMetricStore()
+
+def warm_latest_metrics():
+    db = SessionLocal()
+    try:
+        latest_metrics.warm(db, settings.LATEST_METRICS_WARM_HOURS)
+    finally:
+        db.close()
+
+# Keep the store current from every committed insert in this worker
+metric_service.after_commit_hooks.append(latest_metrics.update)
+
+# Tell other workers about new samples in the same transaction as the insert
+def _notify_latest(session: Session, rows: List[Dict[str, Any]]):
+    if not notify_enabled(session.get_bind()):
+        return
+    newest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for row in rows:
+        key = (str(row["agent_id"]), row["metric_type"])
+        if key not in newest or row["timestamp"] >= newest[key]["timestamp"]:
+            newest[key] = row
+
+    samples = [_sample(row) for row in newest.values()]
+    for payload in chunk_payloads(samples):
+        notify(session, NOTIFY_CHANNEL, payload)
+
+    # Samples too large for a payload are announced by key so peers reload them
+    oversized = [
+        {"agent_id": s["agent_id"], "metric_type": s["metric_type"], "reload": True}
+        for s in samples
+        if len(json.dumps(s, default=json_default, separators=(",", ":")).encode()) + 2 > MAX_PAYLOAD_BYTES
+    ]
+    for payload in chunk_payloads(oversized):
+        notify(session, NOTIFY_CHANNEL, payload)
+
+metric_service.before_commit_hooks.append(_notify_latest)
+
+def _on_latest_notify(payload: str):
+    samples = json.loads(payload)
+    reloads = [s for s in samples if s.get("reload")]
+    fresh = [s for s in samples if not s.get("reload")]
+    for sample in fresh:
+        sample["timestamp"] = datetime.fromisoformat(sample["timestamp"])
+    latest_metrics.update(fresh)
+
+    if reloads:
+        db = SessionLocal()
+        try:
+            for sample in reloads:
+                latest_metrics.load_series(db, sample["agent_id"], sample["metric_type"])
+        finally:
+            db.close()
+
+notify_listener.listen(NOTIFY_CHANNEL, _on_latest_notify)
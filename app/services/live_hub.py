@@ -0,0 +1,221 @@
+# app/services/live_hub.py
+import asyncio
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..core.database import get_engine
+from ..core.notify import chunk_payloads, json_default, notify, notify_enabled, notify_listener
+from ..config.settings import get_settings
+from . import log_service, metric_service
+
+settings = get_settings()
+
+NOTIFY_CHANNEL = "agent_live_events"
+PRESENCE_CHANNEL = "agent_live_presence"
+METRIC = "metric"
+LOG = "log"
+
+# Tags this worker's NOTIFY payloads so it does not publish its own events twice
+WORKER_ID = uuid.uuid4().hex[:12]
+
+SAMPLE = "sample"
+DISCONNECT = "disconnect"
+
+@dataclass(frozen=True)
+class LiveFilter:
+    """Subscription filter; an empty set matches everything"""
+    kinds: FrozenSet[str] = frozenset()
+    agent_ids: FrozenSet[str] = frozenset()
+    environments: FrozenSet[str] = frozenset()
+    metric_types: FrozenSet[str] = frozenset()
+    levels: FrozenSet[str] = frozenset()
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.kinds and event["kind"] not in self.kinds:
+            return False
+        if self.agent_ids and event["agent_id"] not in self.agent_ids:
+            return False
+        if self.environments and event.get("environment") not in self.environments:
+            return False
+        if event["kind"] == METRIC:
+            return not self.metric_types or event["metric_type"] in self.metric_types
+        return not self.levels or str(event["level"]).upper() in self.levels
+
+@dataclass(eq=False)
+class Subscription:
+    """Bounded queue of encoded event batches for one connected viewer"""
+    filter: LiveFilter
+    policy: str
+    queue: asyncio.Queue
+    dropped: int = 0
+    closed: bool = False
+
+    async def next_batch(self, timeout: float) -> Tuple[Optional[List[str]], int]:
+        """Next batch of encoded events (None on timeout) and events dropped since the last call"""
+        try:
+            batch = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            batch = None
+        dropped, self.dropped = self.dropped, 0
+        return batch, dropped
+
+class LiveHub:
+    """In-process fan-out of committed metrics and logs to live subscribers.
+
+    publish() may be called from any thread; delivery happens on the event
+    loop, and a full subscriber queue never blocks the publisher.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscriptions: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Peer workers with live subscribers, until when their last announcement holds
+        self._peers: Dict[str, float] = {}
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        for subscription in list(self._subscriptions):
+            self.close(subscription)
+        self._loop = None
+
+    def subscribe(self, live_filter: LiveFilter, policy: str = SAMPLE) -> Subscription:
+        subscription = Subscription(live_filter, policy, asyncio.Queue(self.queue_size))
+        self._subscriptions.add(subscription)
+        if len(self._subscriptions) == 1 and self._loop is not None:
+            # Peers start sending this worker events now rather than at the next announcement
+            self._loop.run_in_executor(None, self.announce)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def announce(self):
+        """Tell peer workers this worker has live subscribers; blocking"""
+        if not self._subscriptions or not settings.LIVE_NOTIFY_ENABLED or not notify_enabled():
+            return
+        with get_engine().begin() as connection:
+            notify(connection, PRESENCE_CHANNEL, json.dumps({"worker": WORKER_ID}))
+
+    def peer_seen(self, worker: str):
+        self._peers[worker] = time.monotonic() + 3 * settings.LIVE_PRESENCE_INTERVAL
+
+    def peers_subscribed(self) -> bool:
+        """Whether any other worker announced live subscribers recently"""
+        now = time.monotonic()
+        for worker, until in list(self._peers.items()):
+            if until > now:
+                return True
+            self._peers.pop(worker, None)
+        return False
+
+    def publish(self, events: List[Dict[str, Any]]):
+        if not events or not self._subscriptions or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._dispatch, events)
+
+    def _dispatch(self, events: List[Dict[str, Any]]):
+        # Each event is encoded once, however many subscribers receive it
+        encoded = [
+            (event, json.dumps(event, default=json_default, separators=(",", ":")))
+            for event in events
+        ]
+        for subscription in list(self._subscriptions):
+            batch = [text for event, text in encoded if subscription.filter.matches(event)]
+            if not batch:
+                continue
+            try:
+                subscription.queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                if subscription.policy == DISCONNECT:
+                    self.close(subscription)
+                else:
+                    subscription.dropped += len(batch)
+
+    def close(self, subscription: Subscription):
+        subscription.closed = True
+        self._subscriptions.discard(subscription)
+        # Wake a consumer blocked on an empty queue; a full queue is drained first anyway
+        if subscription.queue.empty():
+            subscription.queue.put_nowait([])
+
+live_hub = LiveHub(queue_size=settings.LIVE_QUEUE_SIZE)
+
+def _metric_event(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "kind": METRIC,
+        "id": str(row["id"]),
+        "agent_id": str(row["agent_id"]),
+        "environment": metric_service.cached_agent_environment(row["agent_id"]),
+        "metric_type": row["metric_type"],
+        "value": row["value"],
+        "timestamp": row["timestamp"],
+    }
+
+def _log_event(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "kind": LOG,
+        "id": str(row["id"]),
+        "agent_id": str(row["agent_id"]),
+        "environment": metric_service.cached_agent_environment(row["agent_id"]),
+        "level": row["level"],
+        "category": row.get("category"),
+        "message": row["message"],
+        "details": row.get("details"),
+        "timestamp": row["timestamp"],
+    }
+
+# Local subscribers get events as soon as this worker commits them
+def _publish_local(to_event):
+    def hook(rows: List[Dict[str, Any]]):
+        if live_hub.subscriber_count:
+            live_hub.publish([to_event(row) for row in rows])
+    return hook
+
+metric_service.after_commit_hooks.append(_publish_local(_metric_event))
+log_service.after_commit_hooks.append(_publish_local(_log_event))
+
+# Peer workers get them through NOTIFY, delivered only if the insert commits. Only
+# while some peer has subscribers, and as one payload per commit: the rows of a large
+# batch beyond what fits are not sent to peers, as a slow subscriber's are not either.
+def _notify_peers(to_event):
+    def hook(session: Session, rows: List[Dict[str, Any]]):
+        if not settings.LIVE_NOTIFY_ENABLED or not live_hub.peers_subscribed():
+            return
+        if not notify_enabled(session.get_bind()):
+            return
+        payload = next(chunk_payloads({**to_event(row), "origin": WORKER_ID} for row in rows), None)
+        if payload:
+            notify(session, NOTIFY_CHANNEL, payload)
+    return hook
+
+metric_service.before_commit_hooks.append(_notify_peers(_metric_event))
+log_service.before_commit_hooks.append(_notify_peers(_log_event))
+
+def _on_live_notify(payload: str):
+    if not live_hub.subscriber_count:
+        return
+    events = [event for event in json.loads(payload) if event.pop("origin", None) != WORKER_ID]
+    live_hub.publish(events)
+
+def _on_presence_notify(payload: str):
+    worker = json.loads(payload)["worker"]
+    if worker != WORKER_ID:
+        live_hub.peer_seen(worker)
+
+notify_listener.listen(NOTIFY_CHANNEL, _on_live_notify)
+notify_listener.listen(PRESENCE_CHANNEL, _on_presence_notify)
+
+def announce_live_presence():
+    live_hub.announce()
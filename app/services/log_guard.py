@@ -0,0 +1,305 @@
+# app/services/log_guard.py
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionLocal
+from ..core.instrumentation import LOGS_COLLAPSED, LOGS_RATE_LIMITED
+from ..config.settings import get_settings
+from ..models import models
+from . import log_service
+from .metric_service import cached_agent_environment
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DedupKey = Tuple[uuid.UUID, str, str]
+
+@dataclass
+class _OpenRow:
+    """A log row that absorbs identical messages until its window closes"""
+    row: Dict[str, Any]
+    opened: float
+    expires: float
+    last_timestamp: datetime
+    # Repeats not yet added to the stored row
+    pending: int = 0
+    # Set once the row's INSERT has committed; only then can repeats be written to it
+    committed: bool = False
+    # Called with whether the row was stored, once its INSERT commits or it closes without
+    waiters: List[Callable[[bool], None]] = field(default_factory=list)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.row,
+            "repeat_count": self.row["repeat_count"] + self.pending,
+            "last_timestamp": self.last_timestamp,
+        }
+
+@dataclass
+class _Bucket:
+    tokens: float
+    refilled: float
+
+@dataclass
+class Admission:
+    """Outcome of admitting a batch of log rows"""
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    collapsed: List[Dict[str, Any]] = field(default_factory=list)
+    dropped: int = 0
+
+class LogGuard:
+    """Ingest-time deduplication and per-agent rate limiting of log rows.
+
+    A message repeating an (agent_id, level, message) seen within the window
+    is not inserted; it adds to the repeat count of the earlier row, which a
+    periodic flush writes in bulk. New rows spend a token from the agent's
+    bucket, and rows that find it empty are dropped.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        max_span: float,
+        max_keys: int,
+        rate: float,
+        burst: int
+    ):
+        self.window = window
+        self.max_span = max_span
+        self.max_keys = max_keys
+        self.rate = rate
+        self.burst = burst
+        self._open: Dict[DedupKey, _OpenRow] = {}
+        self._keys_by_row: Dict[uuid.UUID, DedupKey] = {}
+        self._buckets: Dict[uuid.UUID, _Bucket] = {}
+        # Repeats of rows no longer open, still to be written by the next flush
+        self._retired: List[Tuple[Dict[str, Any], int, datetime]] = []
+        # Waiters of rows that closed without committing, told once the lock is released
+        self._unstored: List[Callable[[bool], None]] = []
+        self._lock = threading.Lock()
+
+        # Counters
+        self.admitted_rows = 0
+        self.collapsed_rows = 0
+        self.dropped_rows = 0
+        self.flushed_repeats = 0
+        self.lost_repeats = 0
+
+    def _take_token(self, agent_id: uuid.UUID, now: float) -> bool:
+        if self.rate <= 0:
+            return True
+        bucket = self._buckets.get(agent_id)
+        if bucket is None:
+            bucket = self._buckets[agent_id] = _Bucket(float(self.burst), now)
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.refilled) * self.rate)
+        bucket.refilled = now
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def retry_after(self, agent_id: uuid.UUID) -> int:
+        """Whole seconds until the agent's bucket holds a token again"""
+        bucket = self._buckets.get(agent_id)
+        if bucket is None or self.rate <= 0:
+            return 1
+        return max(1, int((1 - bucket.tokens) / self.rate + 0.999))
+
+    def admit(self, rows: List[Dict[str, Any]]) -> Admission:
+        """Split rows into new rows to insert, repeats folded into open rows, and drops"""
+        admission = Admission()
+        batch_ids = set()
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                key = (row["agent_id"], row["level"], row["message"])
+                entry = self._open.get(key)
+                if entry and entry.expires >= now and now - entry.opened <= self.max_span:
+                    if entry.row["id"] not in batch_ids:
+                        entry.pending += 1
+                    else:
+                        # Still part of this batch, so the row itself can carry the repeat
+                        entry.row["repeat_count"] += 1
+                    entry.last_timestamp = max(entry.last_timestamp, row["timestamp"])
+                    entry.expires = now + self.window
+                    admission.collapsed.append(entry.snapshot())
+                    continue
+
+                if not self._take_token(row["agent_id"], now):
+                    admission.dropped += 1
+                    continue
+
+                row["repeat_count"] = 1
+                row["last_timestamp"] = row["timestamp"]
+                admission.rows.append(row)
+                batch_ids.add(row["id"])
+                if entry or len(self._open) < self.max_keys:
+                    if entry:
+                        self._retire(key, entry)
+                    self._open[key] = _OpenRow(row, now, now + self.window, row["timestamp"])
+                    self._keys_by_row[row["id"]] = key
+
+            self.admitted_rows += len(admission.rows)
+            self.collapsed_rows += len(admission.collapsed)
+            self.dropped_rows += admission.dropped
+        self._notify_unstored()
+
+        if rows and (admission.collapsed or admission.dropped):
+            environment = cached_agent_environment(rows[0]["agent_id"]) or "unknown"
+            if admission.collapsed:
+                LOGS_COLLAPSED.labels(environment).inc(len(admission.collapsed))
+            if admission.dropped:
+                LOGS_RATE_LIMITED.labels(environment).inc(admission.dropped)
+        return admission
+
+    def _retire(self, key: DedupKey, entry: _OpenRow):
+        """Forget an open row (lock held), keeping its unwritten repeats for the next flush"""
+        if entry.pending and entry.committed:
+            self._retired.append((entry.row, entry.pending, entry.last_timestamp))
+        elif entry.pending:
+            # Its INSERT never committed (rolled back, or dropped by the queue)
+            self.lost_repeats += entry.pending
+        if not entry.committed:
+            self._unstored.extend(entry.waiters)
+        self._keys_by_row.pop(entry.row["id"], None)
+        if self._open.get(key) is entry:
+            del self._open[key]
+
+    def when_stored(self, row_id: uuid.UUID, done: Callable[[bool], None]):
+        """Call `done` once the open row `row_id` has committed, or with False if it never does.
+
+        Repeats folded into a row are stored with it, so a keyed submission
+        that collapsed settles with the submission that queued the row.
+        """
+        with self._lock:
+            key = self._keys_by_row.get(row_id)
+            entry = self._open.get(key) if key else None
+            if entry and not entry.committed:
+                entry.waiters.append(done)
+                return
+        # A row no longer open may have closed uncommitted; a retry then writes again
+        _call(done, entry is not None)
+
+    def mark_committed(self, rows: List[Dict[str, Any]]):
+        """After-commit hook: repeats of these rows may now be written to them"""
+        waiters = []
+        with self._lock:
+            for row in rows:
+                key = self._keys_by_row.get(row["id"])
+                entry = self._open.get(key) if key else None
+                if entry and entry.row is row:
+                    entry.committed = True
+                    waiters.extend(entry.waiters)
+                    entry.waiters.clear()
+        for done in waiters:
+            _call(done, True)
+
+    def _notify_unstored(self):
+        with self._lock:
+            waiters, self._unstored = self._unstored, []
+        for done in waiters:
+            _call(done, False)
+
+    def _take_pending(self) -> List[Tuple[Dict[str, Any], int, datetime]]:
+        now = time.monotonic()
+        with self._lock:
+            pending, self._retired = self._retired, []
+            for key, entry in list(self._open.items()):
+                if entry.committed and entry.pending:
+                    pending.append((entry.row, entry.pending, entry.last_timestamp))
+                    entry.pending = 0
+                if entry.expires < now:
+                    self._retire(key, entry)
+            for row, repeats, _ in pending:
+                row["repeat_count"] += repeats
+            # Buckets that have refilled completely carry no state worth keeping
+            full_after = self.burst / self.rate if self.rate > 0 else 0
+            for agent_id, bucket in list(self._buckets.items()):
+                if now - bucket.refilled >= full_after:
+                    del self._buckets[agent_id]
+        self._notify_unstored()
+        return pending
+
+    def flush(self, db: Session) -> int:
+        """Add pending repeats to their stored rows in one executemany UPDATE"""
+        pending = self._take_pending()
+        if not pending:
+            return 0
+        logs = models.AgentLog.__table__
+        try:
+            db.execute(
+                logs.update()
+                .where(logs.c.id == bindparam("row_id"))
+                .where(logs.c.timestamp == bindparam("row_timestamp"))
+                .values(
+                    repeat_count=logs.c.repeat_count + bindparam("repeats"),
+                    last_timestamp=bindparam("last")
+                ),
+                [
+                    {
+                        "row_id": row["id"],
+                        "row_timestamp": row["timestamp"],
+                        "repeats": repeats,
+                        "last": last,
+                    }
+                    for row, repeats, last in pending
+                ]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for row, repeats, last in pending:
+                    row["repeat_count"] -= repeats
+                    key = self._keys_by_row.get(row["id"])
+                    entry = self._open.get(key) if key else None
+                    if entry and entry.row is row:
+                        entry.pending += repeats
+                    else:
+                        self._retired.append((row, repeats, last))
+            raise
+        repeats = sum(repeats for _, repeats, _ in pending)
+        self.flushed_repeats += repeats
+        return repeats
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "admitted_rows": self.admitted_rows,
+            "collapsed_rows": self.collapsed_rows,
+            "dropped_rows": self.dropped_rows,
+            "flushed_repeats": self.flushed_repeats,
+            "lost_repeats": self.lost_repeats,
+            "open_rows": len(self._open),
+            "rate_limited_agents": len(self._buckets),
+        }
+
+def _call(done: Callable[[bool], None], stored: bool):
+    try:
+        done(stored)
+    except Exception:
+        logger.exception("Log row callback failed")
+
+log_guard = LogGuard(
+    window=settings.LOG_DEDUP_WINDOW_SECONDS,
+    max_span=settings.LOG_DEDUP_MAX_SPAN_SECONDS,
+    max_keys=settings.LOG_DEDUP_MAX_KEYS,
+    rate=settings.LOG_RATE_LIMIT_PER_SECOND,
+    burst=settings.LOG_RATE_LIMIT_BURST
+)
+
+log_service.after_commit_hooks.append(log_guard.mark_committed)
+
+def flush_log_repeats():
+    db = SessionLocal()
+    try:
+        log_guard.flush(db)
+    finally:
+        db.close()
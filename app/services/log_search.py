@@ -0,0 +1,132 @@
+# app/services/log_search.py
+import html
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, column, func, literal_column, select, table, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from ..config.settings import get_settings
+from ..models import models
+
+settings = get_settings()
+
+# Inlined rather than bound so query expressions match the index expression exactly
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+DOCUMENT = literal_column(models.LOG_SEARCH_DOCUMENT)
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+# The database marks matches with control characters; the message is escaped
+# before they become tags, so agent text never reaches a client as markup
+MATCH_START = "\x02"
+MATCH_STOP = "\x03"
+HEADLINE_OPTIONS = f'StartSel="{MATCH_START}", StopSel="{MATCH_STOP}", HighlightAll=true'
+QUERY_CANCELED = "57014"
+
+fts = table(models.LOG_SEARCH_FTS_TABLE, column("rowid"), column("message"), column("details"))
+FTS_TABLE = literal_column(models.LOG_SEARCH_FTS_TABLE)
+LOG_ROWID = literal_column(f"{models.AgentLog.__tablename__}.rowid")
+# "quoted phrase", -excluded and bare terms, the subset of websearch syntax FTS5 is given
+FTS_TERM = re.compile(r'(-?)(?:"([^"]*)"|(\S+))')
+
+def _fts5_query(q: str) -> str:
+    include, exclude = [], []
+    for negated, phrase, word in FTS_TERM.findall(q):
+        term = (phrase or word).strip()
+        if term:
+            quoted = '"' + term.replace('"', '""') + '"'
+            (exclude if negated else include).append(quoted)
+    if not include:
+        raise ValueError("Search query needs at least one term that is not excluded")
+    return " ".join(include) + "".join(f" NOT {term}" for term in exclude)
+
+def _fts_match(q: str):
+    return FTS_TABLE.op("MATCH")(_fts5_query(q))
+
+def search_condition(dialect: str, q: str):
+    """WHERE clause matching logs whose message or indexed details keys contain `q`"""
+    if dialect == "postgresql":
+        return DOCUMENT.op("@@")(func.websearch_to_tsquery(SEARCH_CONFIG, q))
+    return LOG_ROWID.in_(select(fts.c.rowid).where(_fts_match(q)))
+
+def apply_time_budget(db: Session):
+    """Cap statements for the rest of this transaction at LOG_SEARCH_TIME_BUDGET_MS"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL statement_timeout = {int(settings.LOG_SEARCH_TIME_BUDGET_MS)}"))
+
+def is_over_budget(error: DBAPIError) -> bool:
+    return getattr(error.orig, "sqlstate", None) == QUERY_CANCELED
+
+def _highlight(marked: str) -> str:
+    """HTML-escape a marked message, turning only the match marks into tags"""
+    return (
+        html.escape(marked)
+        .replace(MATCH_START, HIGHLIGHT_START)
+        .replace(MATCH_STOP, HIGHLIGHT_STOP)
+    )
+
+def _log_fields(log: models.AgentLog) -> Dict[str, Any]:
+    return {
+        "id": log.id,
+        "agent_id": log.agent_id,
+        "level": log.level,
+        "category": log.category,
+        "message": log.message,
+        "details": log.details,
+        "timestamp": log.timestamp,
+    }
+
+def search(
+    db: Session,
+    q: str,
+    since: datetime,
+    agent_id: Optional[str] = None,
+    level: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """Best-ranked logs matching `q`, each with its message HTML-escaped and highlighted"""
+    filters = [models.AgentLog.timestamp >= since]
+    if agent_id:
+        filters.append(models.AgentLog.agent_id == agent_id)
+    if level:
+        filters.append(models.AgentLog.level == level)
+    if category:
+        filters.append(models.AgentLog.category == category)
+
+    apply_time_budget(db)
+    if db.get_bind().dialect.name == "postgresql":
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        rank = func.ts_rank_cd(DOCUMENT, tsquery).label("rank")
+        ranked = select(
+            models.AgentLog.id, models.AgentLog.timestamp, rank
+        ).where(DOCUMENT.op("@@")(tsquery), *filters).order_by(
+            rank.desc(), models.AgentLog.timestamp.desc()
+        ).limit(limit).subquery("ranked")
+        # ts_headline is costly, so it only runs on the page being returned
+        statement = select(
+            models.AgentLog,
+            ranked.c.rank,
+            func.ts_headline(
+                SEARCH_CONFIG, models.AgentLog.message, tsquery, HEADLINE_OPTIONS
+            ).label("highlight"),
+        ).join(ranked, and_(
+            models.AgentLog.id == ranked.c.id,
+            models.AgentLog.timestamp == ranked.c.timestamp,
+        )).order_by(ranked.c.rank.desc(), ranked.c.timestamp.desc())
+    else:
+        # bm25() is lower-is-better; it is negated so rank sorts like ts_rank_cd
+        statement = select(
+            models.AgentLog,
+            (-func.bm25(FTS_TABLE)).label("rank"),
+            func.highlight(FTS_TABLE, 0, MATCH_START, MATCH_STOP).label("highlight"),
+        ).join(fts, fts.c.rowid == LOG_ROWID).where(_fts_match(q), *filters).order_by(
+            func.bm25(FTS_TABLE), models.AgentLog.timestamp.desc()
+        ).limit(limit)
+
+    return [
+        {**_log_fields(log), "rank": float(rank or 0.0), "highlight": _highlight(highlight or log.message)}
+        for log, rank, highlight in db.execute(statement)
+    ]
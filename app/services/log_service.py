@@ -0,0 +1,104 @@
+# app/services/log_service.py
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Union
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..core.codecs import parse_timestamps
+from ..core.instrumentation import count_ingested
+from ..models import models
+from ..schemas import schemas
+from .idempotency import insert_rows
+from .metric_service import cached_agent_environment
+
+logger = logging.getLogger(__name__)
+
+# Hooks called with (session, rows) just before a transaction that inserted logs commits
+before_commit_hooks: List[Callable[[Session, List[Dict[str, Any]]], None]] = []
+# Hooks called with the inserted rows once that transaction has committed
+after_commit_hooks: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+def log_row(
+    agent_id: uuid.UUID,
+    log: Union[schemas.LogCreate, schemas.LogSubmit]
+) -> Dict[str, Any]:
+    """Build an insert row for the agent_logs table"""
+    return {
+        "id": uuid.uuid4(),
+        "agent_id": agent_id,
+        "level": log.level,
+        "category": log.category,
+        "message": log.message,
+        "details": log.details,
+        "timestamp": log.timestamp or datetime.utcnow(),
+    }
+
+def rows_from_columnar(agent_id: uuid.UUID, payload: Any) -> List[Dict[str, Any]]:
+    """Insert rows from {"timestamps": [...], "level": [...], "message": [...]} columns;
+    "category" and "details" columns are optional"""
+    if not isinstance(payload, dict) or not isinstance(payload.get("timestamps"), list):
+        raise ValueError("timestamps must be a list")
+    count = len(payload["timestamps"])
+    columns = {}
+    for name in ("level", "message", "category", "details"):
+        column = payload.get(name)
+        if column is None and name in ("category", "details"):
+            column = [None] * count
+        if not isinstance(column, list) or len(column) != count:
+            raise ValueError(f"{name} must be a list of {count} values")
+        columns[name] = column
+
+    rows = []
+    for timestamp, level, message, category, details in zip(
+        parse_timestamps(payload["timestamps"]), columns["level"], columns["message"],
+        columns["category"], columns["details"]
+    ):
+        if not isinstance(level, str) or not isinstance(message, str):
+            raise ValueError("level and message values must be strings")
+        rows.append({
+            "id": uuid.uuid4(),
+            "agent_id": agent_id,
+            "level": level,
+            "category": category,
+            "message": message,
+            "details": details,
+            "timestamp": timestamp,
+        })
+    return rows
+
+def insert_log_rows(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """Insert log rows as a multi-row INSERT; the caller owns the transaction.
+
+    Retried rows of keyed submissions are not inserted again; returns the number inserted.
+    """
+    if not rows:
+        return 0
+    rows = insert_rows(db, models.AgentLog, rows)
+    db.info.setdefault("inserted_logs", []).extend(rows)
+    return len(rows)
+
+@event.listens_for(Session, "before_commit")
+def _run_before_commit_hooks(session):
+    rows = session.info.get("inserted_logs")
+    if rows:
+        for hook in before_commit_hooks:
+            hook(session, rows)
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit_hooks(session):
+    rows = session.info.pop("inserted_logs", None)
+    if rows:
+        for hook in after_commit_hooks:
+            try:
+                hook(rows)
+            except Exception:
+                logger.exception("Log commit hook %r failed", hook)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_inserted_logs(session):
+    session.info.pop("inserted_logs", None)
+
+after_commit_hooks.append(lambda rows: count_ingested("log", rows, cached_agent_environment))
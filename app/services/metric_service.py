@@ -0,0 +1,180 @@
+# app/services/metric_service.py
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from ..core.cache import MISSING, TTLCache
+from ..core.codecs import parse_timestamps
+from ..core.instrumentation import count_ingested
+from ..models import models
+from ..schemas import schemas
+from .idempotency import insert_rows
+
+logger = logging.getLogger(__name__)
+
+# Fields of schemas.MetricsSubmit that each become one metric row
+SUBMIT_METRIC_TYPES = ("cpu", "memory", "disk", "network")
+
+# Hooks called with (session, rows) just before a transaction that inserted metrics commits
+before_commit_hooks: List[Callable[[Session, List[Dict[str, Any]]], None]] = []
+# Hooks called with the inserted rows once that transaction has committed
+after_commit_hooks: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+# Agent id -> environment, filled by existing_agent_ids for per-environment ingest counters
+agent_environments = TTLCache(max_size=100000, ttl=3600)
+
+def parse_agent_id(agent_id) -> Optional[uuid.UUID]:
+    """Parse an agent id, returning None if it is not a valid UUID"""
+    if isinstance(agent_id, uuid.UUID):
+        return agent_id
+    try:
+        return uuid.UUID(str(agent_id))
+    except ValueError:
+        return None
+
+def metric_row(
+    agent_id: uuid.UUID,
+    metric_type: str,
+    value: Dict[str, Any],
+    timestamp: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Build an insert row for the agent_metrics table"""
+    return {
+        "id": uuid.uuid4(),
+        "agent_id": agent_id,
+        "metric_type": metric_type,
+        "value": value,
+        "timestamp": timestamp or datetime.utcnow(),
+    }
+
+def rows_from_metric(agent_id: uuid.UUID, metric: schemas.MetricBase) -> List[Dict[str, Any]]:
+    """Build insert rows from a single metric sample"""
+    return [metric_row(agent_id, metric.metric_type, metric.value, metric.timestamp)]
+
+def rows_from_submit(agent_id: uuid.UUID, submit: schemas.MetricsSubmit) -> List[Dict[str, Any]]:
+    """Expand a MetricsSubmit into one row per metric type"""
+    return [
+        metric_row(agent_id, metric_type, getattr(submit, metric_type), submit.timestamp)
+        for metric_type in SUBMIT_METRIC_TYPES
+    ]
+
+def _columns(payload: Dict[str, Any], path: str, length: int) -> Dict[str, list]:
+    if not isinstance(payload, dict):
+        raise ValueError(f"{path} must be an object")
+    for name, column in payload.items():
+        if not isinstance(column, list) or len(column) != length:
+            raise ValueError(f"{path}.{name} must be a list of {length} values")
+    return payload
+
+def rows_from_columnar(agent_id: uuid.UUID, payload: Any) -> List[Dict[str, Any]]:
+    """Insert rows from a columnar batch without building per-sample models.
+
+    The batch is {"timestamps": [...], "metrics": {metric_type: {field: [...]}}};
+    sample i of a metric type is {field: column[i]} for its non-null fields.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("timestamps"), list):
+        raise ValueError("timestamps must be a list")
+    timestamps = parse_timestamps(payload["timestamps"])
+    metrics = payload.get("metrics")
+    if not isinstance(metrics, dict):
+        raise ValueError("metrics must be an object")
+
+    rows = []
+    for metric_type, fields in metrics.items():
+        names = list(_columns(fields, f"metrics.{metric_type}", len(timestamps)))
+        if not names:
+            continue
+        columns = [fields[name] for name in names]
+        for timestamp, values in zip(timestamps, zip(*columns)):
+            value = {name: v for name, v in zip(names, values) if v is not None}
+            if value:
+                rows.append(metric_row(agent_id, metric_type, value, timestamp))
+    return rows
+
+def validate_items(
+    items: Iterable[Dict[str, Any]],
+    model: Type[BaseModel],
+    section: str
+) -> Tuple[List[Tuple[int, BaseModel]], List[schemas.BatchItemError]]:
+    """Validate raw batch items, collecting per-item errors instead of failing the batch"""
+    valid = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, model.model_validate(item)))
+        except ValidationError as e:
+            errors.append(schemas.BatchItemError(
+                section=section,
+                index=index,
+                detail="; ".join(
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}"
+                    for err in e.errors()
+                )
+            ))
+    return valid, errors
+
+def existing_agent_ids(db: Session, agent_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+    """Return the subset of agent ids that exist, using a single query"""
+    agent_ids = set(agent_ids)
+    if not agent_ids:
+        return set()
+    result = db.query(models.Agent.id, models.Agent.environment).filter(models.Agent.id.in_(agent_ids))
+    found = set()
+    for row in result:
+        agent_environments.set(row.id, row.environment)
+        found.add(row.id)
+    return found
+
+def cached_agent_environment(agent_id) -> Optional[str]:
+    """Environment of an agent seen by existing_agent_ids, if still cached"""
+    return agent_environments.get(agent_id, None)
+
+def agent_environment(db: Session, agent_id: uuid.UUID) -> Optional[str]:
+    """Environment of an agent, cached or read; None if it has none or does not exist"""
+    environment = agent_environments.get(agent_id, MISSING)
+    if environment is not MISSING:
+        return environment
+    row = db.execute(select(models.Agent.environment).where(models.Agent.id == agent_id)).first()
+    if row is None:
+        return None
+    agent_environments.set(agent_id, row.environment)
+    return row.environment
+
+def insert_metric_rows(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """Insert metric rows as a multi-row INSERT; the caller owns the transaction.
+
+    Retried rows of keyed submissions are not inserted again; returns the number inserted.
+    """
+    if not rows:
+        return 0
+    rows = insert_rows(db, models.AgentMetric, rows)
+    db.info.setdefault("inserted_metrics", []).extend(rows)
+    return len(rows)
+
+@event.listens_for(Session, "before_commit")
+def _run_before_commit_hooks(session):
+    rows = session.info.get("inserted_metrics")
+    if rows:
+        for hook in before_commit_hooks:
+            hook(session, rows)
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit_hooks(session):
+    rows = session.info.pop("inserted_metrics", None)
+    if rows:
+        for hook in after_commit_hooks:
+            try:
+                hook(rows)
+            except Exception:
+                logger.exception("Metric commit hook %r failed", hook)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_inserted_metrics(session):
+    session.info.pop("inserted_metrics", None)
+
+after_commit_hooks.append(lambda rows: count_ingested("metric", rows, cached_agent_environment))
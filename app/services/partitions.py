@@ -0,0 +1,167 @@
+# app/services/partitions.py
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionLocal
+from ..config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+def retention_policy() -> Dict[str, int]:
+    """Days of data kept per partitioned table for this deployment"""
+    return {
+        "agent_metrics": settings.METRICS_RETENTION_DAYS,
+        "agent_logs": settings.LOGS_RETENTION_DAYS,
+    }
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+def _partition_day(table: str, name: str) -> Optional[date]:
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def is_partitioned(db: Session, table: str) -> bool:
+    return db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace"
+    ), {"table": table}).first() is not None
+
+def list_partitions(db: Session, table: str) -> List[Tuple[str, date]]:
+    """Daily partitions of `table`, oldest first (the default partition is excluded)"""
+    names = db.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": table}).scalars()
+    partitions = [(name, _partition_day(table, name)) for name in names]
+    return sorted((p for p in partitions if p[1]), key=lambda p: p[1])
+
+def default_partition(table: str) -> str:
+    return f"{table}_default"
+
+def _day_bounds(day: date) -> Tuple[str, str]:
+    return day.isoformat(), (day + timedelta(days=1)).isoformat()
+
+def default_days(db: Session, table: str, since: date) -> List[date]:
+    """Days from `since` on that the default partition holds rows for"""
+    return [row[0].date() for row in db.execute(text(
+        f'SELECT DISTINCT date_trunc(\'day\', "timestamp") FROM "{default_partition(table)}" '
+        'WHERE "timestamp" >= :since ORDER BY 1'
+    ), {"since": since})]
+
+def create_partition(db: Session, table: str, day: date):
+    """Create the partition of `day`, moving in any rows the default partition took for it.
+
+    A partition cannot be created over rows the default holds, so those
+    rows go into a plain table that is then attached in the same transaction.
+    """
+    name = partition_name(table, day)
+    low, high = _day_bounds(day)
+    bounds = {"low": low, "high": high}
+    in_default = db.execute(text(
+        f'SELECT 1 FROM "{default_partition(table)}" '
+        'WHERE "timestamp" >= :low AND "timestamp" < :high LIMIT 1'
+    ), bounds).first()
+    if not in_default:
+        db.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{low}') TO ('{high}')"
+        ))
+        return
+    db.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    moved = db.execute(text(
+        f'WITH moved AS (DELETE FROM "{default_partition(table)}" '
+        '    WHERE "timestamp" >= :low AND "timestamp" < :high RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved'
+    ), bounds).rowcount
+    db.execute(text(
+        f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" '
+        f"FOR VALUES FROM ('{low}') TO ('{high}')"
+    ))
+    logger.info("%s: moved %d rows from the default partition into %s", table, moved, name)
+
+def ensure_partitions(db: Session, table: str, start: date, days: int, retention_days: int) -> int:
+    """Create daily partitions from `start` for `days` days, plus a default partition.
+
+    Days within retention that the default partition took rows for get
+    their own partition too, so the default only holds rows in transit.
+    """
+    db.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{default_partition(table)}" PARTITION OF "{table}" DEFAULT'
+    ))
+    db.commit()
+    existing = {name for name, _ in list_partitions(db, table)}
+    wanted = {start + timedelta(days=offset) for offset in range(days)}
+    wanted.update(default_days(db, table, start + timedelta(days=1) - timedelta(days=retention_days)))
+
+    created = 0
+    for day in sorted(wanted):
+        if partition_name(table, day) in existing:
+            continue
+        try:
+            create_partition(db, table, day)
+            db.commit()
+            created += 1
+        except Exception:
+            # One day failing must not leave the days after it to the default partition
+            db.rollback()
+            logger.exception("%s: could not create the partition of %s", table, day)
+    return created
+
+def drop_expired_partitions(db: Session, table: str, retention_days: int, today: date) -> List[str]:
+    """Drop whole partitions whose day is entirely outside the retention window,
+    and delete expired rows from the default partition"""
+    cutoff = today - timedelta(days=retention_days)
+    dropped = []
+    for name, day in list_partitions(db, table):
+        if day >= cutoff:
+            break
+        db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        db.execute(text(f'DROP TABLE "{name}"'))
+        db.commit()
+        dropped.append(name)
+    expired = db.execute(text(
+        f'DELETE FROM "{default_partition(table)}" WHERE "timestamp" < :cutoff'
+    ), {"cutoff": cutoff}).rowcount
+    db.commit()
+    if expired:
+        logger.info("%s: deleted %d expired rows from the default partition", table, expired)
+    return dropped
+
+def maintain_partitions():
+    """Create upcoming partitions and drop expired ones for every partitioned table"""
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        today = datetime.utcnow().date()
+        for table, retention_days in retention_policy().items():
+            if not is_partitioned(db, table):
+                logger.warning("%s is not partitioned; skipping partition maintenance", table)
+                continue
+            created = ensure_partitions(
+                db, table, today - timedelta(days=1), settings.PARTITION_PREMAKE_DAYS + 2, retention_days
+            )
+            dropped = drop_expired_partitions(db, table, retention_days, today)
+            if created or dropped:
+                logger.info(
+                    "%s: created %d partitions, dropped %s", table, created, dropped or "none"
+                )
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
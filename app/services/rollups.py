@@ -0,0 +1,373 @@
+# app/services/rollups.py
+import logging
+from datetime import date, datetime, time, timedelta
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import Float, Text, cast, func, literal, literal_column, select, true, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..core.codecs import parse_timestamp
+from ..core.database import SessionLocal
+from ..config.settings import get_settings
+from ..models import models
+from . import archive, metric_service
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+BUCKET_WIDTHS = {"1m": 60, "5m": 300, "1h": 3600}
+# Bucket widths maintained in agent_metric_rollups
+ROLLUP_WIDTHS = (300, 3600)
+# Aggregates that can be recombined from rollup count/sum/min/max
+ROLLUP_AGGREGATES = ("avg", "min", "max")
+
+_ORIGIN = datetime(2000, 1, 1)
+# Late samples mark the hour they fall in; every rollup width divides it
+DIRTY_WIDTH = 3600
+DIRTY_BATCH = 1000
+
+def align(ts: datetime, width: int) -> datetime:
+    """Round a timestamp down to the start of its bucket"""
+    offset = (ts - _ORIGIN).total_seconds()
+    return _ORIGIN + timedelta(seconds=(offset // width) * width)
+
+def _bucket(column, width: int):
+    # Same origin as align() so SQL buckets and Python boundaries agree
+    return func.date_bin(
+        literal_column(f"INTERVAL '{int(width)} seconds'"),
+        column,
+        literal_column("TIMESTAMP '2000-01-01'")
+    )
+
+def _numeric_fields():
+    """Top-level key/value pairs of AgentMetric.value, one row per key"""
+    return func.json_each(models.AgentMetric.value).table_valued("key", "value").alias("field_values")
+
+def _raw_buckets(
+    db: Session,
+    agent_id,
+    metric_type: str,
+    fields: List[str],
+    width: int,
+    agg: str,
+    since: datetime
+) -> List[Dict[str, Any]]:
+    field_values = _numeric_fields()
+    number = cast(cast(field_values.c.value, Text), Float)
+    bucket = _bucket(models.AgentMetric.timestamp, width)
+    aggregate = {
+        "avg": func.avg(number),
+        "min": func.min(number),
+        "max": func.max(number),
+        "p95": func.percentile_cont(0.95).within_group(number),
+    }[agg]
+
+    query = db.query(
+        bucket.label("bucket"),
+        field_values.c.key.label("field"),
+        aggregate.label("value"),
+        func.count().label("count")
+    ).select_from(models.AgentMetric).join(field_values, true()).filter(
+        models.AgentMetric.agent_id == agent_id,
+        models.AgentMetric.metric_type == metric_type,
+        models.AgentMetric.timestamp >= since,
+        field_values.c.key.in_(fields),
+        func.json_typeof(field_values.c.value) == "number"
+    ).group_by(bucket, field_values.c.key)
+
+    return [dict(row._mapping, metric_type=metric_type) for row in query]
+
+def _rollup_buckets(
+    db: Session,
+    agent_id,
+    metric_type: str,
+    fields: List[str],
+    width: int,
+    agg: str,
+    since: datetime,
+    until: datetime
+) -> List[Dict[str, Any]]:
+    rollup = models.MetricRollup
+    value = {
+        "avg": rollup.sum / rollup.count,
+        "min": rollup.min,
+        "max": rollup.max,
+    }[agg]
+
+    query = db.query(
+        rollup.bucket_start.label("bucket"),
+        rollup.field,
+        value.label("value"),
+        rollup.count
+    ).filter(
+        rollup.agent_id == agent_id,
+        rollup.metric_type == metric_type,
+        rollup.field.in_(fields),
+        rollup.bucket_width == width,
+        rollup.bucket_start >= since,
+        rollup.bucket_start < until
+    )
+
+    return [dict(row._mapping, metric_type=metric_type) for row in query]
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Like percentile_cont: interpolated linearly between the two nearest ranks"""
+    values = sorted(values)
+    position = fraction * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+# The SQL aggregates of _raw_buckets, for samples gathered in Python
+VALUE_AGGREGATES = {
+    "avg": lambda values: sum(values) / len(values),
+    "min": min,
+    "max": max,
+    "p95": lambda values: _percentile(values, 0.95),
+}
+
+def _cold_values(
+    db: Session,
+    agent_id,
+    metric_type: str,
+    fields: List[str],
+    width: int,
+    since: datetime,
+    until: datetime
+) -> Dict[Tuple[datetime, str], List[float]]:
+    """Values per (bucket, field) in [since, until), from the archive and from rows not yet moved there"""
+    field_values = _numeric_fields()
+    number = cast(cast(field_values.c.value, Text), Float)
+    query = select(
+        models.AgentMetric.id, models.AgentMetric.timestamp, field_values.c.key, number
+    ).select_from(models.AgentMetric).join(field_values, true()).where(
+        models.AgentMetric.agent_id == agent_id,
+        models.AgentMetric.metric_type == metric_type,
+        models.AgentMetric.timestamp >= since,
+        models.AgentMetric.timestamp < until,
+        field_values.c.key.in_(fields),
+        func.json_typeof(field_values.c.value) == "number"
+    )
+    values: Dict[Tuple[datetime, str], List[float]] = defaultdict(list)
+    stored = set()
+    for row_id, timestamp, field, value in db.execute(query):
+        stored.add(row_id)
+        values[(align(timestamp, width), field)].append(value)
+
+    environment = metric_service.agent_environment(db, agent_id)
+    for rows in archive.read_newest(
+        archive.METRICS, since, {"agent_id": agent_id, "metric_type": metric_type},
+        environment=environment or archive.UNKNOWN_ENVIRONMENT
+    ):
+        for row in rows:
+            if row["timestamp"] >= until or row["id"] in stored or not isinstance(row["value"], dict):
+                continue
+            for field in fields:
+                value = row["value"].get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[(align(row["timestamp"], width), field)].append(float(value))
+    return values
+
+def rollup_watermark(db: Session, width: int) -> Optional[datetime]:
+    """End of the newest bucket that has been rolled up for `width`"""
+    last = db.query(func.max(models.MetricRollup.bucket_start)).filter(
+        models.MetricRollup.bucket_width == width
+    ).scalar()
+    return last + timedelta(seconds=width) if last else None
+
+def query_buckets(
+    db: Session,
+    agent_id,
+    metric_type: str,
+    fields: List[str],
+    bucket: str,
+    agg: str,
+    hours: int
+) -> List[Dict[str, Any]]:
+    """Downsample a metric series, reading rollups for closed buckets where possible.
+
+    Days past the archive's hot window are aggregated from the archive files
+    and the rows not yet moved there, like the raw listing reads them.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        raise ValueError("Downsampled metrics need PostgreSQL; omit bucket to read raw samples")
+    width = BUCKET_WIDTHS[bucket]
+    since = align(datetime.utcnow() - timedelta(hours=hours), width)
+
+    buckets = []
+    if archive.reaches_archive(archive.METRICS, since):
+        # The cutoff is a midnight, so no bucket spans both sides of it
+        cold_until = archive.hot_cutoff(archive.METRICS)
+        aggregate = VALUE_AGGREGATES[agg]
+        buckets.extend(
+            {"bucket": start, "field": field, "value": aggregate(values), "count": len(values),
+             "metric_type": metric_type}
+            for (start, field), values in _cold_values(
+                db, agent_id, metric_type, fields, width, since, cold_until
+            ).items()
+        )
+        since = cold_until
+
+    raw_since = since
+    if width in ROLLUP_WIDTHS and agg in ROLLUP_AGGREGATES:
+        watermark = rollup_watermark(db, width)
+        if watermark and watermark > since:
+            buckets.extend(_rollup_buckets(db, agent_id, metric_type, fields, width, agg, since, watermark))
+            raw_since = watermark
+
+    buckets.extend(_raw_buckets(db, agent_id, metric_type, fields, width, agg, raw_since))
+    buckets.sort(key=lambda b: (b["bucket"], b["field"]), reverse=True)
+    return buckets
+
+def _rollup_rows(width: int, *conditions):
+    """Rollup rows of the raw samples matching `conditions`, grouped into `width` buckets"""
+    field_values = _numeric_fields()
+    number = cast(cast(field_values.c.value, Text), Float)
+    bucket = _bucket(models.AgentMetric.timestamp, width)
+
+    return select(
+        models.AgentMetric.agent_id,
+        models.AgentMetric.metric_type,
+        field_values.c.key,
+        literal(width),
+        bucket,
+        func.count(),
+        func.sum(number),
+        func.min(number),
+        func.max(number)
+    ).select_from(models.AgentMetric).join(field_values, true()).where(
+        *conditions,
+        func.json_typeof(field_values.c.value) == "number"
+    ).group_by(
+        models.AgentMetric.agent_id,
+        models.AgentMetric.metric_type,
+        field_values.c.key,
+        bucket
+    )
+
+def _upsert_rollups(db: Session, rows) -> int:
+    rollup = models.MetricRollup
+    stmt = pg_insert(rollup).from_select(
+        ["agent_id", "metric_type", "field", "bucket_width", "bucket_start",
+         "count", "sum", "min", "max"],
+        rows
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            rollup.agent_id, rollup.metric_type, rollup.field,
+            rollup.bucket_width, rollup.bucket_start
+        ],
+        set_={
+            "count": stmt.excluded["count"],
+            "sum": stmt.excluded["sum"],
+            "min": stmt.excluded["min"],
+            "max": stmt.excluded["max"],
+        }
+    )
+    return db.execute(stmt).rowcount
+
+def _closed_until(now: datetime, width: int) -> datetime:
+    return align(now - timedelta(seconds=settings.ROLLUP_LAG_SECONDS), width)
+
+def expire_rollups(db: Session, today: Optional[date] = None) -> int:
+    """Delete rollups older than METRICS_RETENTION_DAYS, the retention of the raw partitions"""
+    today = today or datetime.utcnow().date()
+    cutoff = datetime.combine(today - timedelta(days=settings.METRICS_RETENTION_DAYS), time())
+    rollup = models.MetricRollup
+    expired = 0
+    for width in ROLLUP_WIDTHS:
+        # One width at a time, so each delete is a range of the watermark index
+        expired += db.execute(rollup.__table__.delete().where(
+            rollup.bucket_width == width, rollup.bucket_start < cutoff
+        )).rowcount
+    db.commit()
+    return expired
+
+def refresh_rollups(db: Session, width: int, now: Optional[datetime] = None) -> int:
+    """Roll up every closed bucket since the last run into agent_metric_rollups"""
+    now = now or datetime.utcnow()
+    end = _closed_until(now, width)
+    watermark = rollup_watermark(db, width)
+    # The newest rolled-up bucket again, for samples whose commit raced the last run
+    start = watermark - timedelta(seconds=width) if watermark else align(
+        now - timedelta(hours=settings.ROLLUP_BACKFILL_HOURS), width
+    )
+    if start >= end:
+        return 0
+
+    count = _upsert_rollups(db, _rollup_rows(
+        width, models.AgentMetric.timestamp >= start, models.AgentMetric.timestamp < end
+    ))
+    db.commit()
+    return count
+
+def mark_late_samples(session: Session, rows: List[Dict[str, Any]]):
+    """Record the hours of samples older than the rollup lag, whose buckets may be closed"""
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    late_before = _closed_until(datetime.utcnow(), min(ROLLUP_WIDTHS))
+    dirty = {
+        (row["agent_id"], align(timestamp, DIRTY_WIDTH))
+        for row in rows
+        for timestamp in (parse_timestamp(row["timestamp"]),) if timestamp < late_before
+    }
+    if dirty:
+        session.execute(
+            pg_insert(models.MetricRollupDirty).on_conflict_do_nothing(),
+            [{"agent_id": agent_id, "hour_start": hour} for agent_id, hour in dirty]
+        )
+
+metric_service.before_commit_hooks.append(mark_late_samples)
+
+def reroll_dirty_hours(db: Session, now: Optional[datetime] = None) -> int:
+    """Roll up again the closed buckets of hours that late samples marked; returns hours done"""
+    now = now or datetime.utcnow()
+    dirty = models.MetricRollupDirty
+    done = 0
+    while True:
+        # Taken and re-rolled in one transaction, so a failed run leaves the marks for the next
+        batch = select(dirty.agent_id, dirty.hour_start).limit(DIRTY_BATCH)
+        marks: List[Tuple[Any, datetime]] = db.execute(
+            dirty.__table__.delete().where(
+                tuple_(dirty.agent_id, dirty.hour_start).in_(batch)
+            ).returning(dirty.agent_id, dirty.hour_start)
+        ).all()
+        if not marks:
+            return done
+        agents_by_hour: Dict[datetime, Set[Any]] = defaultdict(set)
+        for agent_id, hour in marks:
+            agents_by_hour[hour].add(agent_id)
+        for width in ROLLUP_WIDTHS:
+            end = _closed_until(now, width)
+            for hour, agent_ids in agents_by_hour.items():
+                until = min(hour + timedelta(seconds=DIRTY_WIDTH), end)
+                if hour >= until:
+                    # Not closed yet; the regular refresh rolls it up
+                    continue
+                _upsert_rollups(db, _rollup_rows(
+                    width,
+                    models.AgentMetric.agent_id.in_(agent_ids),
+                    models.AgentMetric.timestamp >= hour,
+                    models.AgentMetric.timestamp < until
+                ))
+        db.commit()
+        done += len(marks)
+
+def refresh_all_rollups():
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        for width in ROLLUP_WIDTHS:
+            count = refresh_rollups(db, width)
+            logger.debug("Rolled up %d %ss buckets", count, width)
+        hours = reroll_dirty_hours(db)
+        if hours:
+            logger.info("Rolled up %d agent-hours again for late samples", hours)
+        expired = expire_rollups(db)
+        if expired:
+            logger.info("Deleted %d expired rollups", expired)
+    finally:
+        db.close()
@@ -0,0 +1,50 @@
+# tests/conftest.py
+import os
+import uuid
+from datetime import datetime
+
+# Settings are read when the app is imported; the unit tests need no Postgres
+for name, value in {
+    "ADMIN_KEY": "test-admin-key",
+    "SECRET_KEY": "test-secret-key",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "test",
+}.items():
+    os.environ.setdefault(name, value)
+os.environ["DATABASE_URL_OVERRIDE"] = "sqlite://"
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.models import models
+
+@pytest.fixture
+def engine():
+    """A private in-memory SQLite database with every table"""
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    with Session(engine) as session:
+        yield session
+
+@pytest.fixture
+def agent_id(db) -> uuid.UUID:
+    agent = models.Agent(
+        id=uuid.uuid4(), hostname="host-1", ip_address="10.0.0.1", environment="test",
+        status="registered", last_seen=datetime.utcnow(), created_at=datetime.utcnow()
+    )
+    db.add(agent)
+    db.commit()
+    return agent.id
@@ -0,0 +1,108 @@
+# tests/test_alerts.py
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from app.models import models
+from app.services.alerts import AlertEngine, FIRED, RESOLVED, THRESHOLD, ZSCORE, _Series
+
+T0 = datetime(2026, 1, 1)
+
+def rule(**fields) -> models.AlertRule:
+    defaults = dict(
+        id=uuid.uuid4(), name="rule", metric_type="memory", field="used", environment=None,
+        kind=ZSCORE, comparator=">", threshold=4.0, for_seconds=0, window=20, enabled=True,
+    )
+    return models.AlertRule(**{**defaults, **fields})
+
+def engine_with(*rules) -> AlertEngine:
+    engine = AlertEngine(max_series=100)
+    engine.set_rules(list(rules))
+    return engine
+
+def samples(agent_id, values, metric_type="memory", field="used", start=T0):
+    return [
+        {
+            "agent_id": agent_id, "metric_type": metric_type, "value": {field: value},
+            "timestamp": start + timedelta(minutes=index),
+        }
+        for index, value in enumerate(values)
+    ]
+
+# A steady signal with a little noise, so the baseline has a spread
+BASELINE = [100 + (-1) ** i * (i % 3) for i in range(40)]
+
+def test_zscore_is_withheld_until_warmed_up():
+    series = _Series()
+    scores = [series.zscore(value, alpha=2 / 11, warmup=10) for value in BASELINE[:12]]
+    assert scores[:10] == [None] * 10
+    assert all(abs(score) < 3 for score in scores[10:])
+    assert series.zscore(150, alpha=2 / 11, warmup=10) > 10
+
+def test_constant_baseline_flags_any_change_as_infinite():
+    series = _Series()
+    for _ in range(5):
+        series.zscore(5.0, alpha=0.5, warmup=3)
+    assert series.zscore(5.0, alpha=0.5, warmup=3) == 0.0
+    assert series.zscore(6.0, alpha=0.5, warmup=3) == float("inf")
+
+def test_zscore_rule_fires_on_a_spike_and_resolves():
+    zscore = rule()
+    engine = engine_with(zscore)
+    agent_id = uuid.uuid4()
+
+    engine.observe(samples(agent_id, BASELINE))
+    assert engine.stats()["firing"] == 0
+
+    engine.observe(samples(agent_id, [140], start=T0 + timedelta(hours=1)))
+    engine.observe(samples(agent_id, [100], start=T0 + timedelta(hours=2)))
+    kinds = [kind for kind, _ in engine._transitions]
+    assert kinds == [FIRED, RESOLVED]
+    fired = engine._transitions[0][1]
+    assert (fired["rule_id"], fired["agent_id"], fired["value"]) == (zscore.id, agent_id, 140)
+
+def test_threshold_rule_fires_only_after_holding_for_its_duration():
+    engine = engine_with(rule(kind=THRESHOLD, threshold=90, for_seconds=300, metric_type="cpu", field="percent"))
+    agent_id = uuid.uuid4()
+
+    engine.observe(samples(agent_id, [95, 95, 95, 50], metric_type="cpu", field="percent"))
+    assert engine._transitions == []
+
+    engine.observe(samples(agent_id, [95] * 7, metric_type="cpu", field="percent", start=T0 + timedelta(hours=1)))
+    assert [kind for kind, _ in engine._transitions] == [FIRED]
+    assert engine._transitions[0][1]["started_at"] == T0 + timedelta(hours=1)
+
+def test_late_and_non_numeric_samples_are_ignored():
+    engine = engine_with(rule(kind=THRESHOLD, threshold=90, metric_type="cpu", field="percent"))
+    agent_id = uuid.uuid4()
+    engine.observe(samples(agent_id, [10], metric_type="cpu", field="percent", start=T0 + timedelta(hours=1)))
+    engine.observe(samples(agent_id, [99], metric_type="cpu", field="percent"))
+    engine.observe(samples(agent_id, ["99", None, True], metric_type="cpu", field="percent", start=T0 + timedelta(hours=2)))
+    assert engine._transitions == []
+    assert engine.evaluated_samples == 1
+
+def test_changed_rule_starts_its_series_over():
+    zscore = rule()
+    engine = engine_with(zscore)
+    agent_id = uuid.uuid4()
+    engine.observe(samples(agent_id, BASELINE + [140]))
+    assert engine.stats()["pending_transitions"] == 1
+
+    engine.set_rules([rule(id=zscore.id, threshold=5.0)])
+    stats = engine.stats()
+    assert (stats["series"], stats["pending_transitions"]) == (0, 0)
+
+def test_flush_keeps_transitions_of_existing_rules_when_others_were_deleted(db, agent_id):
+    db.execute(text("PRAGMA foreign_keys = ON"))
+    kept = rule(kind=THRESHOLD, threshold=90, metric_type="cpu", field="percent")
+    deleted = rule(kind=THRESHOLD, threshold=90, metric_type="cpu", field="percent")
+    db.add(kept)
+    db.commit()
+    engine = engine_with(kept, deleted)
+    engine.observe(samples(agent_id, [95], metric_type="cpu", field="percent"))
+    assert engine.stats()["pending_transitions"] == 2
+
+    assert engine.flush(db) == 1
+    assert engine.dropped_transitions == 1
+    assert db.scalars(select(models.AlertEvent.rule_id)).all() == [kept.id]
@@ -0,0 +1,28 @@
+# tests/test_codecs.py
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.core.codecs import InvalidTimestamp, parse_timestamp, parse_timestamps
+from app.services import log_service, metric_service
+
+def test_timestamps_parse_from_epoch_iso_and_datetime():
+    expected = datetime(2023, 11, 14, 22, 13, 20)
+    assert parse_timestamps([1700000000, "2023-11-14T22:13:20Z", expected]) == [expected] * 3
+
+@pytest.mark.parametrize("value", [1e20, -1e20, float("inf"), float("nan"), "yesterday", True, None])
+def test_invalid_timestamps_raise_one_error_type(value):
+    with pytest.raises(InvalidTimestamp):
+        parse_timestamp(value)
+
+def test_columnar_error_names_the_bad_index():
+    agent_id = uuid.uuid4()
+    with pytest.raises(InvalidTimestamp, match=r"^timestamps\[1\]: "):
+        metric_service.rows_from_columnar(
+            agent_id, {"timestamps": [1700000000, 1e20], "metrics": {"cpu": {"percent": [1, 2]}}}
+        )
+    with pytest.raises(InvalidTimestamp, match=r"^timestamps\[0\]: "):
+        log_service.rows_from_columnar(
+            agent_id, {"timestamps": [-1e20], "level": ["ERROR"], "message": ["disk full"]}
+        )
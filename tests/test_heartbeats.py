@@ -0,0 +1,97 @@
+# tests/test_heartbeats.py
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.models import models
+from app.services.heartbeats import HeartbeatTracker, OFFLINE, ONLINE, STALE
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+@pytest.fixture
+def agent_id(agent_id, db):
+    """The agent, last stored as seen well before T0"""
+    db.get(models.Agent, agent_id).last_seen = T0 - timedelta(hours=1)
+    db.commit()
+    return agent_id
+
+def tracker() -> HeartbeatTracker:
+    return HeartbeatTracker(stale_after=60, offline_after=300)
+
+def stored(db, agent_id):
+    db.expire_all()
+    return db.execute(
+        select(models.Agent.last_seen, models.Agent.status).where(models.Agent.id == agent_id)
+    ).one()
+
+def test_beats_coalesce_into_one_write_of_the_latest(db, agent_id):
+    heartbeats = tracker()
+    for seconds in (0, 5, 10):
+        heartbeats.beat(agent_id, T0 + timedelta(seconds=seconds))
+
+    assert heartbeats.flush(db) == 1
+    assert tuple(stored(db, agent_id)) == (T0 + timedelta(seconds=10), ONLINE)
+    # Nothing new since the last flush
+    assert heartbeats.flush(db) == 0
+
+def test_late_beat_does_not_rewind_last_seen(agent_id):
+    heartbeats = tracker()
+    heartbeats.beat(agent_id, T0 + timedelta(seconds=30))
+    last_seen, status = heartbeats.beat(agent_id, T0)
+    assert last_seen == T0 + timedelta(seconds=30)
+    assert heartbeats.live(agent_id) == (T0 + timedelta(seconds=30), ONLINE)
+
+def test_flush_does_not_overwrite_a_newer_stored_last_seen(db, agent_id):
+    db.get(models.Agent, agent_id).last_seen = T0 + timedelta(minutes=5)
+    db.commit()
+    heartbeats = tracker()
+    heartbeats.beat(agent_id, T0)
+    heartbeats.flush(db)
+    assert stored(db, agent_id).last_seen == T0 + timedelta(minutes=5)
+
+def test_sweep_downgrades_silent_agents(db, agent_id):
+    heartbeats = tracker()
+    changes = []
+    heartbeats.status_listeners.append(lambda changed, status: changes.append((changed, status)))
+    heartbeats.beat(agent_id, T0)
+
+    assert heartbeats.sweep(db, now=T0 + timedelta(seconds=30)) == {}
+    assert heartbeats.sweep(db, now=T0 + timedelta(seconds=90)) == {STALE: 1}
+    assert heartbeats.sweep(db, now=T0 + timedelta(seconds=400)) == {OFFLINE: 1}
+    assert changes == [(agent_id, ONLINE), (agent_id, STALE), (agent_id, OFFLINE)]
+
+    heartbeats.flush(db)
+    assert stored(db, agent_id).status == OFFLINE
+
+def test_sweep_keeps_agents_another_worker_saw(db, agent_id):
+    heartbeats = tracker()
+    heartbeats.beat(agent_id, T0)
+    # Another worker stored a more recent check-in
+    db.get(models.Agent, agent_id).last_seen = T0 + timedelta(seconds=80)
+    db.commit()
+
+    assert heartbeats.sweep(db, now=T0 + timedelta(seconds=90)) == {}
+    assert heartbeats.live(agent_id) == (T0 + timedelta(seconds=80), ONLINE)
+
+def test_sweep_without_persist_only_changes_memory(db, agent_id):
+    heartbeats = tracker()
+    heartbeats.beat(agent_id, T0)
+    heartbeats.flush(db)
+
+    assert heartbeats.sweep(db, now=T0 + timedelta(seconds=90), persist=False) == {STALE: 1}
+    assert heartbeats.live(agent_id)[1] == STALE
+    assert heartbeats.flush(db) == 0
+    assert stored(db, agent_id).status == ONLINE
+
+def test_sync_adopts_newer_stored_status(db, agent_id):
+    heartbeats = tracker()
+    heartbeats.warm(db)
+    agent = db.get(models.Agent, agent_id)
+    agent.last_seen, agent.status = agent.last_seen + timedelta(seconds=1), ONLINE
+    db.commit()
+
+    assert heartbeats.sync(db) == 1
+    assert heartbeats.live(agent_id)[1] == ONLINE
+    assert heartbeats.live(uuid.uuid4()) is None
@@ -0,0 +1,245 @@
+# tests/test_idempotency.py
+import uuid
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints import logs as logs_endpoint
+from app.core import security
+from app.core.cache import MISSING
+from app.models import models
+from app.services import ingest_queue as ingest_queue_module
+from app.services import log_guard as log_guard_module
+from app.services import log_service, metric_service
+from app.services.idempotency import IN_FLIGHT, RecentKeys, key_scope, submission_key
+from app.services.ingest_queue import IngestQueue, LOG, METRIC
+from app.services.log_guard import LogGuard
+from app.services.metric_service import insert_metric_rows, metric_row
+
+def rows(agent_id, count=2):
+    return [metric_row(agent_id, "cpu", {"percent": i}) for i in range(count)]
+
+def stored_metrics(db) -> int:
+    return db.scalar(select(func.count()).select_from(models.AgentMetric))
+
+def test_submission_key_needs_a_session_to_use_seq():
+    assert submission_key("abc", seq=7, session="s1") == "key:abc"
+    assert submission_key(None, seq=7, session="s1") == "seq:s1:7"
+    assert submission_key(None, seq=7) is None
+    assert submission_key(None, seq=0, session="s1") == "seq:s1:0"
+
+def test_retry_in_flight_gets_the_first_attempts_rows():
+    keys = RecentKeys(max_size=10, ttl=60)
+    agent_id = uuid.uuid4()
+    scope = key_scope(METRIC, agent_id)
+    first, response = keys.claim(scope, "key:a", rows(agent_id))
+    assert response is MISSING
+    assert all(row["id"].version == 5 for row in first)
+
+    retry, response = keys.claim(scope, "key:a", rows(agent_id))
+    assert response is MISSING
+    assert retry is first
+    assert keys.stats()["duplicates"] == 0
+
+def test_exclusive_retry_in_flight_is_told_so():
+    keys = RecentKeys(max_size=10, ttl=60)
+    agent_id = uuid.uuid4()
+    scope = key_scope(LOG, agent_id)
+    assert keys.claim(scope, "key:a", rows(agent_id), exclusive=True)[1] is MISSING
+    assert keys.claim(scope, "key:a", rows(agent_id), exclusive=True)[1] is IN_FLIGHT
+
+    keys.complete(scope, "key:a", {"queued": 2})
+    assert keys.claim(scope, "key:a", rows(agent_id), exclusive=True)[1] == {"queued": 2}
+
+def test_completed_key_answers_with_the_first_response():
+    keys = RecentKeys(max_size=10, ttl=60)
+    agent_id = uuid.uuid4()
+    scope = key_scope(METRIC, agent_id)
+    keys.claim(scope, "key:a", rows(agent_id))
+    keys.complete(scope, "key:a", {"queued": 2})
+
+    assert keys.claim(scope, "key:a", rows(agent_id))[1] == {"queued": 2}
+    assert keys.response(scope, "key:a") == {"queued": 2}
+    assert keys.response(key_scope(METRIC, uuid.uuid4()), "key:a") is MISSING
+    assert keys.stats()["duplicates"] == 2
+
+def test_released_key_is_claimed_afresh_with_the_same_ids():
+    keys = RecentKeys(max_size=10, ttl=60)
+    agent_id = uuid.uuid4()
+    scope = key_scope(METRIC, agent_id)
+    first, _ = keys.claim(scope, "key:a", rows(agent_id))
+    keys.release(scope, "key:a")
+
+    retry, response = keys.claim(scope, "key:a", rows(agent_id))
+    assert response is MISSING
+    assert retry is not first
+    assert [row["id"] for row in retry] == [row["id"] for row in first]
+
+def test_batch_items_are_claimed_one_by_one():
+    keys = RecentKeys(max_size=10, ttl=60)
+    agent_id = uuid.uuid4()
+    scope = key_scope(METRIC, agent_id)
+    keys.claim(scope, "seq:s1:1", rows(agent_id))
+    keys.complete(scope, "seq:s1:1", True)
+
+    batch, duplicates, claims = keys.claim_items([
+        (scope, "seq:s1:1", rows(agent_id)),
+        (scope, "seq:s1:2", rows(agent_id)),
+        (scope, None, rows(agent_id, 1)),
+    ])
+    assert (len(batch), duplicates, claims) == (3, 1, [(scope, "seq:s1:2")])
+
+def test_keyed_rows_are_inserted_once(db, agent_id):
+    keys = RecentKeys(max_size=10, ttl=60)
+    scope = key_scope(METRIC, agent_id)
+    first, _ = keys.claim(scope, "key:a", rows(agent_id))
+    assert insert_metric_rows(db, first) == 2
+    db.commit()
+
+    # Past the window the retry rebuilds the same ids; timestamps the agent sent match too
+    keys.release(scope, "key:a")
+    retry, _ = keys.claim(scope, "key:a", [dict(row) for row in first])
+    assert insert_metric_rows(db, retry) == 0
+    db.commit()
+    assert stored_metrics(db) == 2
+
+@pytest.fixture
+def queue(engine, monkeypatch):
+    monkeypatch.setattr(ingest_queue_module, "SessionLocal", lambda: Session(engine))
+    return IngestQueue(max_size=100, batch_size=2, flush_interval=60.0)
+
+@pytest.mark.asyncio
+async def test_queued_claims_complete_once_their_rows_are_stored(queue, db, agent_id):
+    keys = RecentKeys(max_size=10, ttl=60)
+    scope = key_scope(METRIC, agent_id)
+    claimed, _ = keys.claim(scope, "key:a", rows(agent_id, 3))
+    await queue.start()
+    # Three rows span two batches; the key settles after the last one
+    queue.submit(METRIC, claimed, done=keys.settle_later([(scope, "key:a")], {"queued": 3}))
+    assert keys.response(scope, "key:a") is MISSING
+
+    await queue.stop()
+    assert keys.response(scope, "key:a") == {"queued": 3}
+    assert stored_metrics(db) == 3
+
+@pytest.mark.asyncio
+async def test_queued_claims_are_released_when_the_write_fails(queue, monkeypatch, agent_id):
+    def fail(db, rows):
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(metric_service, "insert_metric_rows", fail)
+
+    keys = RecentKeys(max_size=10, ttl=60)
+    scope = key_scope(METRIC, agent_id)
+    claimed, _ = keys.claim(scope, "key:a", rows(agent_id))
+    await queue.start()
+    queue.submit(METRIC, claimed, done=keys.settle_later([(scope, "key:a")], {"queued": 2}))
+    await queue.stop()
+
+    assert queue.flush_errors == 1
+    assert keys.stats()["keys"] == 0
+
+@pytest.mark.asyncio
+async def test_empty_submission_settles_at_once(queue):
+    settled = []
+    await queue.start()
+    queue.submit(METRIC, [], done=settled.append)
+    assert settled == [True]
+    await queue.stop()
+
+class Clock:
+    """Stands in for the time module, whose monotonic() the log guard reads"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(log_guard_module, "time", clock)
+    return clock
+
+@pytest.fixture
+def log_api(queue, clock, monkeypatch):
+    """The logs router on its own, with private queue, guard and key window"""
+    guard = LogGuard(window=10, max_span=60, max_keys=100, rate=0, burst=0)
+    keys = RecentKeys(max_size=10, ttl=60)
+    monkeypatch.setattr(logs_endpoint, "ingest_queue", queue)
+    monkeypatch.setattr(logs_endpoint, "log_guard", guard)
+    monkeypatch.setattr(logs_endpoint, "recent_keys", keys)
+    monkeypatch.setattr(log_service, "after_commit_hooks", [guard.mark_committed])
+    app = FastAPI()
+    app.include_router(logs_endpoint.router, prefix="/logs")
+    app.dependency_overrides[security.authorize_agent] = lambda: None
+    return httpx.AsyncClient(app=app, base_url="http://test"), guard, keys
+
+async def submit_log(client, agent_id, key, message="disk full"):
+    response = await client.post(
+        f"/logs/{agent_id}/submit",
+        json={"level": "ERROR", "message": message},
+        headers={"Idempotency-Key": key}
+    )
+    assert response.status_code == 202
+    return response.json()
+
+def stored_logs(db):
+    db.expire_all()
+    return db.execute(select(models.AgentLog.message, models.AgentLog.repeat_count)).all()
+
+@pytest.mark.asyncio
+async def test_log_retries_while_queued_are_duplicates_not_repeats(log_api, queue, db, agent_id):
+    client, guard, keys = log_api
+    await queue.start()
+    async with client:
+        first = await submit_log(client, agent_id, "abc")
+        assert (first["queued"], first["collapsed"]) == (1, 0)
+        for _ in range(2):
+            retry = await submit_log(client, agent_id, "abc")
+            assert (retry["queued"], retry["collapsed"], retry["duplicates"]) == (0, 0, 1)
+        assert keys.response(key_scope(LOG, agent_id), "key:abc") is MISSING
+
+        await queue.stop()
+        assert (await submit_log(client, agent_id, "abc"))["duplicates"] == 1
+    assert guard.collapsed_rows == 0
+    assert stored_logs(db) == [("disk full", 1)]
+
+@pytest.mark.asyncio
+async def test_collapsed_log_settles_when_the_row_it_joined_is_stored(log_api, queue, db, agent_id):
+    client, guard, keys = log_api
+    scope = key_scope(LOG, agent_id)
+    await queue.start()
+    async with client:
+        await submit_log(client, agent_id, "first")
+        assert (await submit_log(client, agent_id, "second"))["collapsed"] == 1
+        # The row it folded into is still queued
+        assert keys.response(scope, "key:second") is MISSING
+        await queue.stop()
+    assert keys.response(scope, "key:second")["collapsed"] == 1
+
+    guard.flush(db)
+    assert stored_logs(db) == [("disk full", 2)]
+
+@pytest.mark.asyncio
+async def test_collapsed_log_is_released_when_the_row_it_joined_is_lost(log_api, queue, clock, db, agent_id, monkeypatch):
+    def fail(db, rows):
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(log_service, "insert_log_rows", fail)
+
+    client, guard, keys = log_api
+    await queue.start()
+    async with client:
+        await submit_log(client, agent_id, "first")
+        await submit_log(client, agent_id, "second")
+        await queue.stop()
+    # The failed flush releases the first key at once, the second when its row closes
+    assert keys.stats()["keys"] == 1
+
+    clock.now += 11
+    guard.flush(db)
+    assert keys.stats()["keys"] == 0
+    assert guard.lost_repeats == 1
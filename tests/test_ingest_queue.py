@@ -0,0 +1,64 @@
+# tests/test_ingest_queue.py
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.config.settings import get_settings
+from app.models import models
+from app.services import ingest_queue as ingest_queue_module
+from app.services.ingest_queue import IngestQueue, METRIC
+from app.services.metric_service import metric_row
+
+settings = get_settings()
+
+@pytest.fixture
+def queue(engine, monkeypatch):
+    # Batches only flush when the queue stops, so its depth is what the tests enqueue
+    monkeypatch.setattr(ingest_queue_module, "SessionLocal", lambda: Session(engine))
+    return IngestQueue(max_size=4, batch_size=100, flush_interval=60.0)
+
+def rows(agent_id, count):
+    return [metric_row(agent_id, "cpu", {"percent": i}) for i in range(count)]
+
+def stored_metrics(db) -> int:
+    return db.scalar(select(func.count()).select_from(models.AgentMetric))
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_the_whole_submission(queue, db, agent_id):
+    await queue.start()
+    assert queue.submit(METRIC, rows(agent_id, 3)) == 3
+
+    with pytest.raises(HTTPException) as rejected:
+        queue.submit(METRIC, rows(agent_id, 2))
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers["Retry-After"] == str(settings.INGEST_RETRY_AFTER)
+    assert queue.depth == 3
+    assert queue.rejected_rows == 2
+
+    # What fits is still accepted
+    assert queue.submit(METRIC, rows(agent_id, 1)) == 1
+    await queue.stop()
+    assert queue.flushed_rows == 4
+    assert stored_metrics(db) == 4
+
+@pytest.mark.asyncio
+async def test_stopped_queue_answers_unavailable(queue, agent_id):
+    await queue.start()
+    await queue.stop()
+    with pytest.raises(HTTPException) as rejected:
+        queue.submit(METRIC, rows(agent_id, 1))
+    assert rejected.value.status_code == 503
+    assert "Retry-After" in rejected.value.headers
+
+@pytest.mark.asyncio
+async def test_rows_of_unknown_agents_are_dropped_not_the_batch(queue, db, agent_id):
+    await queue.start()
+    queue.submit(METRIC, rows(agent_id, 2) + rows(uuid.uuid4(), 1))
+    await queue.stop()
+    assert queue.flushed_rows == 2
+    assert queue.dropped_rows == 1
+    assert queue.flush_errors == 0
+    assert stored_metrics(db) == 2
@@ -0,0 +1,115 @@
+# tests/test_log_guard.py
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from app.models import models
+from app.schemas import schemas
+from app.services import log_guard as log_guard_module
+from app.services import log_service
+from app.services.log_guard import LogGuard
+
+class Clock:
+    """Stands in for the time module, whose monotonic() the guard reads"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(log_guard_module, "time", clock)
+    return clock
+
+def guard(rate: float = 0, burst: int = 0) -> LogGuard:
+    return LogGuard(window=10, max_span=60, max_keys=100, rate=rate, burst=burst)
+
+def log(agent_id, message="disk full", level="ERROR"):
+    return log_service.log_row(agent_id, schemas.LogCreate(level=level, message=message))
+
+def test_repeat_within_window_collapses_into_open_row(clock):
+    logs = guard()
+    agent_id = uuid.uuid4()
+    first = logs.admit([log(agent_id)])
+    assert len(first.rows) == 1
+
+    clock.now += 5
+    repeat = logs.admit([log(agent_id)])
+    assert repeat.rows == []
+    assert len(repeat.collapsed) == 1
+    assert repeat.collapsed[0]["id"] == first.rows[0]["id"]
+    assert repeat.collapsed[0]["repeat_count"] == 2
+
+def test_repeats_within_one_batch_are_carried_by_the_row(clock):
+    agent_id = uuid.uuid4()
+    admission = guard().admit([log(agent_id) for _ in range(3)])
+    assert len(admission.rows) == 1
+    assert admission.rows[0]["repeat_count"] == 3
+    assert len(admission.collapsed) == 2
+
+def test_dedup_key_is_agent_level_and_message(clock):
+    logs = guard()
+    agent_id = uuid.uuid4()
+    admission = logs.admit([
+        log(agent_id), log(agent_id, level="WARN"), log(agent_id, message="other"), log(uuid.uuid4()),
+    ])
+    assert len(admission.rows) == 4
+
+def test_window_and_max_span_close_the_open_row(clock):
+    logs = guard()
+    agent_id = uuid.uuid4()
+    logs.admit([log(agent_id)])
+    clock.now += 11
+    assert len(logs.admit([log(agent_id)]).rows) == 1
+
+    # Repeats keep the window open, but never beyond max_span
+    for _ in range(6):
+        clock.now += 9
+        assert logs.admit([log(agent_id)]).rows == []
+    clock.now += 9
+    assert len(logs.admit([log(agent_id)]).rows) == 1
+
+def test_token_bucket_drops_new_rows_beyond_the_burst(clock):
+    logs = guard(rate=1, burst=2)
+    agent_id = uuid.uuid4()
+    admission = logs.admit([log(agent_id, message=f"m{i}") for i in range(3)])
+    assert len(admission.rows) == 2
+    assert admission.dropped == 1
+    assert logs.retry_after(agent_id) == 1
+
+    # Repeats of an open row spend no tokens
+    assert len(logs.admit([log(agent_id, message="m0")]).collapsed) == 1
+
+    # Other agents have their own bucket
+    assert len(logs.admit([log(uuid.uuid4(), message="m9")]).rows) == 1
+
+    clock.now += 1
+    assert len(logs.admit([log(agent_id, message="m3")]).rows) == 1
+    assert logs.admit([log(agent_id, message="m4")]).dropped == 1
+
+def test_repeats_are_flushed_to_the_committed_row(clock, db, agent_id):
+    logs = guard()
+    admission = logs.admit([log(agent_id)])
+    log_service.insert_log_rows(db, admission.rows)
+    db.commit()
+    logs.mark_committed(admission.rows)
+
+    logs.admit([log(agent_id), log(agent_id)])
+    assert logs.flush(db) == 2
+    assert db.scalar(select(models.AgentLog.repeat_count)) == 3
+    assert logs.flush(db) == 0
+
+def test_repeats_of_an_uncommitted_row_are_lost_not_written(clock, db, agent_id):
+    logs = guard()
+    logs.admit([log(agent_id)])
+    logs.admit([log(agent_id)])
+    assert logs.flush(db) == 0
+
+    clock.now += 11
+    logs.flush(db)
+    assert logs.stats()["open_rows"] == 0
+    assert logs.lost_repeats == 1
@@ -0,0 +1,31 @@
+# tests/test_rollups.py
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.config.settings import get_settings
+from app.models import models
+from app.services.rollups import VALUE_AGGREGATES, expire_rollups
+
+settings = get_settings()
+
+TODAY = date(2026, 1, 31)
+
+def test_p95_interpolates_like_percentile_cont():
+    assert VALUE_AGGREGATES["p95"]([10, 1, 4, 3, 2]) == pytest.approx(8.8)
+    assert VALUE_AGGREGATES["p95"]([7.0]) == 7.0
+    assert VALUE_AGGREGATES["avg"]([1, 2, 6]) == 3
+
+def test_rollups_past_metric_retention_are_deleted(db, agent_id):
+    cutoff = datetime(2026, 1, 31) - timedelta(days=settings.METRICS_RETENTION_DAYS)
+    for width in (300, 3600):
+        for start in (cutoff - timedelta(hours=1), cutoff):
+            db.add(models.MetricRollup(
+                agent_id=agent_id, metric_type="cpu", field="percent", bucket_width=width,
+                bucket_start=start, count=1, sum=1.0, min=1.0, max=1.0
+            ))
+    db.commit()
+
+    assert expire_rollups(db, TODAY) == 2
+    assert set(db.scalars(select(models.MetricRollup.bucket_start))) == {cutoff}